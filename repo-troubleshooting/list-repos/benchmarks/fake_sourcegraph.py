@@ -0,0 +1,812 @@
+#!/usr/bin/env python3
+"""Local stand-in for the Sourcegraph GraphQL API, for benchmarking list-repos.py
+
+Serves synthetic repositories for every operation list-repos.py sends:
+ListRepos (with the --only filters), CountRepos, ListRepoCursors, SingleRepo,
+CommitCount, CommitOid, RunSearch,
+RunSearchRepos, SkippedFileReasons, ValidateRepoRev, the startup checks, the
+reclone/reindex mutations, /.api/search/stream for --search-api stream, and
+/__version.
+Queries over --max-fields are rejected with the same
+ErrQueryComplexityLimitExceeded error Sourcegraph returns, so page-size and
+batch-size shrinking is exercised too. Repos are generated
+on demand from their index, so 1M repos cost no more memory than 10k
+
+    python3 benchmarks/fake_sourcegraph.py --repos 100000 --port 8080
+    SRC_ENDPOINT=http://127.0.0.1:8080 SRC_ACCESS_TOKEN=sgp_bench \\
+        python3 list-repos.py --count-commits
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import collections
+import functools
+import json
+import random
+import re
+import threading
+import time
+from collections.abc import Sequence
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, urlparse
+
+OPERATION_NAME_RE = re.compile(r"^(?:query|mutation)\s+(\w+)", re.MULTILINE)
+REPO_NAME_RE = re.compile(r"^github\.com/org/repo(\d+)$")
+ALIAS_VARIABLE_RE = re.compile(r"\$(?:name|query)(\d+):")
+# The repo filters list-repos.py puts in front of a --run-search pattern
+RUN_SEARCH_REPO_RE = re.compile(r"r:\^(\S+?)\$ ")
+RUN_SEARCH_REPOS_RE = re.compile(r"r:\^\(\?:(\S+?)\)\$ ")
+ESCAPE_RE = re.compile(r"\\(.)")
+SKIPPED_FILES_REPO_RE = re.compile(r"r:\^?(\S+?)\$?@")
+# `repositories(...)` calls, with the alias CountRepos gives each one, and
+# the literal filter arguments --only adds to them
+REPOSITORIES_CALL_RE = re.compile(r"(?:(\w+): )?repositories\(([^)]*)\)")
+LISTING_FILTER_RE = re.compile(r"(\w+): (true|false|[A-Z_]+)\b")
+REPO_NODE_FRAGMENT_RE = re.compile(
+    r"^fragment RepoNodeFields on Repository \{\n(.*?)^\}",
+    re.DOTALL | re.MULTILINE,
+)
+FIELD_NAME_RE = re.compile(r"\s*(\w+)")
+
+# What /__version reports
+FAKE_VERSION = "6.0.0-fake"
+
+# Matches per "matches" event on /.api/search/stream
+STREAM_MATCHES_PER_EVENT = 100
+
+# Rough GraphQL field counts, used to decide when a query breaks --max-fields.
+# Listing nodes count the fields their RepoNodeFields fragment selects
+FIELDS_PER_COMMIT_COUNT_ALIAS = 15
+FIELDS_PER_RUN_SEARCH_ALIAS = 6
+
+# Every --run-search pattern matches in one repo out of this many, so
+# --run-search-mode global has a realistic handful of repos to follow up
+RUN_SEARCH_MATCH_EVERY = 100
+
+# mirrorInfo.byteSize of every --monorepo-every repo. Other repos cycle
+# through 1-1000 size units of 3 MB git data and 1 MB indexed content, so
+# they stay under 3 GB whatever --repos is
+MONOREPO_BYTES = 50 * 1024**3
+
+# Reason text Zoekt writes into the placeholder content of a skipped file
+SKIPPED_FILE_REASONS = (
+    "file size 2097152 exceeds maximum size 1048576",
+    "binary file",
+    "too many trigrams",
+)
+
+
+def repo_name(i: int) -> str:
+    return f"github.com/org/repo{i:06d}"
+
+
+def repo_index(name: str) -> int | None:
+    """Return the index a synthetic repo name was generated from"""
+    match = REPO_NAME_RE.match(name)
+    return int(match.group(1)) if match else None
+
+
+def skipped_file_count(i: int) -> int:
+    return i % 3
+
+
+def repo_bytes(i: int, monorepo: bool = False) -> int:
+    """mirrorInfo.byteSize of repo_node(i)"""
+    return MONOREPO_BYTES if monorepo else (i % 1000 + 1) * 3 * 1024 * 1024
+
+
+def repo_is_fork(i: int) -> bool:
+    return i % 9 == 0
+
+
+def repo_is_archived(i: int) -> bool:
+    return i % 250 == 0
+
+
+def repo_node(i: int, monorepo: bool = False) -> dict[str, Any]:
+    """Return a listing node shaped like REPOSITORY_LISTING_QUERY's output"""
+    name = repo_name(i)
+    size = i % 1000 + 1
+    return {
+        "id": base64.b64encode(f"Repository:{i}".encode()).decode(),
+        "name": name,
+        "url": f"/{name}",
+        "isFork": repo_is_fork(i),
+        "isArchived": repo_is_archived(i),
+        "isPrivate": True,
+        "createdAt": "2024-01-01T00:00:00Z",
+        "mirrorInfo": {
+            "remoteURL": f"https://github.com/org/repo{i}",
+            "cloned": i % 7 != 0,
+            "cloneInProgress": False,
+            "isCorrupted": i % 97 == 0,
+            "lastError": "exit status 128" if i % 11 == 0 else None,
+            "lastSyncOutput": "\n".join(f"line {n}" for n in range(20)),
+            "corruptionLogs": [],
+            "byteSize": str(repo_bytes(i, monorepo)),
+            "lastChanged": "2024-05-01T00:00:00Z",
+            "updatedAt": "2024-05-02T00:00:00Z",
+            "nextSyncAt": "2030-01-01T00:00:00Z",
+            "updateSchedule": {"intervalSeconds": 3600},
+            "shard": "gitserver-0",
+        },
+        "textSearchIndex": (
+            None
+            if i % 5 == 0
+            else {
+                "status": {
+                    "updatedAt": "2024-05-02T00:00:00Z",
+                    "contentFilesCount": i,
+                    "contentByteSize": size * 1024 * 1024,
+                    "indexByteSize": size * 300 * 1024,
+                    "indexShardsCount": 1,
+                    "newLinesCount": 10,
+                    "defaultBranchNewLinesCount": 5,
+                    "otherBranchesNewLinesCount": 5,
+                },
+                "lastIndexStatus": "SUCCESS",
+                "lastIndexFailureMessage": None,
+                "host": {"name": "indexed-search-0"},
+                "refs": [
+                    {
+                        "ref": {"displayName": "main"},
+                        "indexed": True,
+                        "indexedCommit": {"oid": commit_oid(i)},
+                        "skippedIndexed": {
+                            "count": skipped_file_count(i),
+                            "query": (
+                                f"r:^{re.escape(name)}$@{commit_oid(i)} "
+                                "type:file index:only patternType:regexp "
+                                "^NOT-INDEXED:"
+                            ),
+                        },
+                    },
+                ],
+            }
+        ),
+        "externalServices": {"nodes": [{"displayName": "GitHub"}]},
+    }
+
+
+def matches_listing_filter(i: int, name: str, value: bool | str) -> bool:
+    """Whether repo_node(i) passes one `repositories` filter argument"""
+    if name in ("orderBy", "descending"):
+        return True
+    if name == "cloneStatus":
+        return ("CLONED" if i % 7 else "NOT_CLONED") == value
+    if name == "indexed":
+        # indexed: false drops the indexed repos; true keeps everything
+        return bool(value) or i % 5 == 0
+    if name == "failedFetch":
+        return not value or i % 11 == 0
+    if name == "corrupted":
+        return not value or i % 97 == 0
+    return True
+
+
+def parse_listing_filter(arguments: str) -> tuple[tuple[str, bool | str], ...]:
+    """Return the literal filter arguments of one `repositories(...)` call"""
+    booleans: dict[str, bool | str] = {"true": True, "false": False}
+    return tuple(
+        (str(name), booleans.get(value, str(value)))
+        for name, value in LISTING_FILTER_RE.findall(arguments)
+    )
+
+
+@functools.lru_cache(maxsize=16)
+def repo_node_selection(query: str) -> dict[str, Any]:
+    """Parse the RepoNodeFields fragment of `query` into a nested field tree"""
+    fragment = REPO_NODE_FRAGMENT_RE.search(query)
+    tree: dict[str, Any] = {}
+    stack = [tree]
+    for line in (fragment.group(1) if fragment else "").splitlines():
+        if line.strip() == "}":
+            stack.pop()
+            continue
+        name = FIELD_NAME_RE.match(line)
+        if name is None:
+            continue
+        children: dict[str, Any] = {}
+        stack[-1][name.group(1)] = children
+        if line.rstrip().endswith("{"):
+            stack.append(children)
+    return tree
+
+
+def selection_size(tree: dict[str, Any]) -> int:
+    return sum(1 + selection_size(children) for children in tree.values())
+
+
+def select_fields(value: Any, tree: dict[str, Any]) -> Any:
+    """Keep only the fields of `value` that `tree` selects, like GraphQL does"""
+    if not tree:
+        return value
+    if isinstance(value, list):
+        return [select_fields(item, tree) for item in value]
+    if not isinstance(value, dict):
+        return value
+    return {
+        key: select_fields(value[key], children)
+        for key, children in tree.items()
+        if key in value
+    }
+
+
+def commit_oid(i: int) -> str:
+    return f"{i:040x}"
+
+
+def commit_count_fields(i: int) -> dict[str, Any]:
+    """Return one repo's CommitCountFields selection"""
+    return {
+        "commit": {
+            "oid": commit_oid(i),
+            "ancestors": {"totalCount": 1000 + i % 5000},
+        },
+        "mirrorInfo": {
+            "lastCleanedAt": "2024-05-01T00:00:00Z",
+            "cleanupSchedule": {
+                "due": "2030-01-01T00:00:00Z",
+                "intervalSeconds": 86400,
+            },
+            "cleanupQueue": {"index": i % 50, "optimizing": False},
+            "repositoryStatistics": {
+                "packfiles": {"lastFullRepack": "2024-04-01T00:00:00Z"},
+            },
+        },
+    }
+
+
+def run_search_matches(i: int | None) -> bool:
+    return i is not None and i % RUN_SEARCH_MATCH_EVERY == 0
+
+
+def searched_by_default(i: int | None, query: str) -> bool:
+    """Whether a search that names several repos covers repo i
+
+    Like Sourcegraph, only an exact single-repo filter includes forks and
+    archived repos without fork:yes and archived:yes
+    """
+    if i is None:
+        return False
+    return (not repo_is_fork(i) or "fork:yes" in query) and (
+        not repo_is_archived(i) or "archived:yes" in query
+    )
+
+
+def skipped_file_path(n: int) -> str:
+    return f"assets/blob{n}.bin"
+
+
+def skipped_file_content(n: int) -> str:
+    return "NOT-INDEXED: " + SKIPPED_FILE_REASONS[n % len(SKIPPED_FILE_REASONS)]
+
+
+def search_results(match_count: int) -> dict[str, Any]:
+    return {"results": {"matchCount": match_count, "limitHit": False, "alert": None}}
+
+
+@dataclass(frozen=True)
+class FakeSourcegraphConfig:
+    """Scale, latency, and failure injection for one fake instance"""
+
+    repos: int = 10_000
+    # Seconds added to every request, and per repo of an aliased per-repo batch
+    latency: float = 0.0
+    per_repo_latency: float = 0.0
+    # Fraction of requests answered with HTTP 503, or with a retryable
+    # GraphQL error and no data
+    error_rate: float = 0.0
+    graphql_error_rate: float = 0.0
+    max_fields: int = 500_000
+    # Every Nth repo is a monorepo whose commit count takes this many seconds
+    monorepo_every: int = 0
+    monorepo_latency: float = 0.0
+
+
+class FakeSourcegraph:
+    """Answers list-repos.py GraphQL operations from synthetic data"""
+
+    def __init__(self, config: FakeSourcegraphConfig) -> None:
+        self.config = config
+        self.requests: collections.Counter[str] = collections.Counter()
+        self._lock = threading.Lock()
+        self._filtered_repos: dict[tuple[tuple[str, bool | str], ...], list[int]] = {}
+        # These read their filters from the query text rather than variables
+        self._listing_operations = {
+            "ListRepos": self.list_repos,
+            "CountRepos": self.count_repos,
+        }
+        self._operations = {
+            "CurrentUser": self.current_user,
+            "TextSearchIndexFields": self.text_search_index_fields,
+            "ListRepoCursors": self.list_repo_cursors,
+            "SingleRepo": self.single_repo,
+            "ValidateRepoRev": self.validate_repo_rev,
+            "CommitCount": self.commit_count,
+            "CommitOid": self.commit_oids,
+            "RunSearch": self.run_search,
+            "RunSearchRepos": self.run_search_repos,
+            "SkippedFileReasons": self.skipped_file_reasons,
+            "Reclone": self.reclone,
+            "Reindex": self.reindex,
+        }
+
+    def reset_counts(self) -> None:
+        with self._lock:
+            self.requests.clear()
+
+    def handle(self, payload: dict[str, Any]) -> tuple[int, dict[str, Any]]:
+        """Return the HTTP status and JSON body for one GraphQL request"""
+        query = str(payload.get("query") or "")
+        variables = payload.get("variables") or {}
+        match = OPERATION_NAME_RE.search(query)
+        operation = match.group(1) if match else "anonymous"
+        with self._lock:
+            self.requests[operation] += 1
+
+        aliases = [int(n) for n in ALIAS_VARIABLE_RE.findall(query)]
+        time.sleep(self.config.latency + self.config.per_repo_latency * len(aliases))
+        if operation == "CommitCount":
+            time.sleep(self.config.monorepo_latency * self.monorepos_in(variables))
+        if random.random() < self.config.error_rate:
+            return 503, {"errors": [{"message": "service unavailable"}]}
+        if random.random() < self.config.graphql_error_rate:
+            return 200, {
+                "data": None,
+                "errors": [{"message": "context deadline exceeded"}],
+            }
+        fields = self.field_count(operation, variables, len(aliases), query)
+        if fields > self.config.max_fields:
+            return 400, {
+                "errors": [
+                    {
+                        "message": "query exceeds maximum field count",
+                        "extensions": {
+                            "code": "ErrQueryComplexityLimitExceeded",
+                            "type": "field count",
+                            "actual": fields,
+                            "limit": self.config.max_fields,
+                        },
+                    },
+                ],
+            }
+        listing_handler = self._listing_operations.get(operation)
+        if listing_handler is not None:
+            return 200, {"data": listing_handler(query, variables)}
+        handler = self._operations.get(operation)
+        if handler is None:
+            return 200, {"errors": [{"message": f"unknown operation {operation}"}]}
+        return 200, {"data": handler(variables, aliases)}
+
+    def field_count(
+        self,
+        operation: str,
+        variables: dict[str, Any],
+        aliases: int,
+        query: str = "",
+    ) -> int:
+        if operation == "ListRepos":
+            fields = selection_size(repo_node_selection(query))
+            return int(variables.get("first") or 0) * fields
+        if operation in ("CommitCount", "CommitOid"):
+            return aliases * FIELDS_PER_COMMIT_COUNT_ALIAS
+        if operation in ("RunSearch", "RunSearchRepos"):
+            return aliases * FIELDS_PER_RUN_SEARCH_ALIAS
+        return 0
+
+    def listing_page(
+        self,
+        variables: dict[str, Any],
+        node: Any,
+        repos: Sequence[int] | None = None,
+    ) -> dict[str, Any]:
+        """Page through `repos` (default: all of them); cursors are offsets"""
+        if repos is None:
+            repos = range(1, self.config.repos + 1)
+        start = int(variables.get("after") or 0)
+        page = repos[start : start + int(variables["first"])]
+        end = start + len(page)
+        return {
+            "repositories": {
+                "totalCount": len(repos),
+                "pageInfo": {
+                    "hasNextPage": end < len(repos),
+                    "endCursor": str(end),
+                },
+                "nodes": [node(i) for i in page],
+            },
+        }
+
+    def filtered_repos(
+        self,
+        listing_filter: tuple[tuple[str, bool | str], ...],
+    ) -> Sequence[int]:
+        """Return the repo indexes passing every filter, cached per filter
+
+        `orderBy: SIZE` sorts them by mirrorInfo.byteSize, like Sourcegraph
+        """
+        if not listing_filter:
+            return range(1, self.config.repos + 1)
+        with self._lock:
+            repos = self._filtered_repos.get(listing_filter)
+        if repos is None:
+            repos = [
+                i
+                for i in range(1, self.config.repos + 1)
+                if all(
+                    matches_listing_filter(i, name, value)
+                    for name, value in listing_filter
+                )
+            ]
+            arguments = dict(listing_filter)
+            if arguments.get("orderBy") == "SIZE":
+                repos.sort(
+                    key=lambda i: repo_bytes(i, self.is_monorepo(i)),
+                    reverse=bool(arguments.get("descending")),
+                )
+            with self._lock:
+                self._filtered_repos[listing_filter] = repos
+        return repos
+
+    def current_user(self, _variables: dict[str, Any], _aliases: list[int]) -> Any:
+        return {"currentUser": {"username": "bench", "siteAdmin": True}}
+
+    def text_search_index_fields(self, _variables: Any, _aliases: list[int]) -> Any:
+        names = ["status", "host", "refs", "lastIndexStatus", "lastIndexFailureMessage"]
+        return {"__type": {"fields": [{"name": name} for name in names]}}
+
+    def is_monorepo(self, i: int | None) -> bool:
+        every = self.config.monorepo_every
+        return i is not None and every > 0 and i % every == 0
+
+    def monorepos_in(self, variables: dict[str, Any]) -> int:
+        return sum(
+            1
+            for key, value in variables.items()
+            if key.startswith("name") and self.is_monorepo(self.known_repo(value))
+        )
+
+    def repo_node(self, i: int) -> dict[str, Any]:
+        return repo_node(i, self.is_monorepo(i))
+
+    def list_repos(self, query: str, variables: dict[str, Any]) -> Any:
+        call = REPOSITORIES_CALL_RE.search(query)
+        listing_filter = parse_listing_filter(call.group(2) if call else "")
+        selection = repo_node_selection(query)
+        return self.listing_page(
+            variables,
+            lambda i: select_fields(self.repo_node(i), selection),
+            self.filtered_repos(listing_filter),
+        )
+
+    def count_repos(self, query: str, _variables: dict[str, Any]) -> Any:
+        return {
+            alias: {
+                "totalCount": len(
+                    self.filtered_repos(parse_listing_filter(arguments)),
+                ),
+            }
+            for alias, arguments in REPOSITORIES_CALL_RE.findall(query)
+        }
+
+    def list_repo_cursors(self, variables: dict[str, Any], _aliases: list[int]) -> Any:
+        return self.listing_page(
+            variables,
+            lambda i: {"id": base64.b64encode(f"Repository:{i}".encode()).decode()},
+        )
+
+    def known_repo(self, name: object) -> int | None:
+        i = repo_index(str(name))
+        return i if i is not None and 1 <= i <= self.config.repos else None
+
+    def single_repo(self, variables: dict[str, Any], _aliases: list[int]) -> Any:
+        i = self.known_repo(variables.get("name"))
+        return {"repository": None if i is None else self.repo_node(i)}
+
+    def validate_repo_rev(self, variables: dict[str, Any], _aliases: list[int]) -> Any:
+        i = self.known_repo(variables.get("name"))
+        if i is None:
+            return {"repository": None}
+        node = self.repo_node(i)
+        return {
+            "repository": {
+                "name": node["name"],
+                "defaultBranch": {"displayName": "main"},
+                "commit": {"oid": commit_oid(i)},
+                "textSearchIndex": node["textSearchIndex"],
+            },
+        }
+
+    def commit_count(self, variables: dict[str, Any], aliases: list[int]) -> Any:
+        if not aliases:
+            i = self.known_repo(variables.get("name"))
+            return {
+                "repository": None if i is None else commit_count_fields(i),
+                "search": search_results(42),
+            }
+        data: dict[str, Any] = {}
+        for n in aliases:
+            i = self.known_repo(variables.get(f"name{n}"))
+            data[f"repo{n}"] = None if i is None else commit_count_fields(i)
+            data[f"allRefs{n}"] = search_results(42)
+        return data
+
+    def commit_oids(self, variables: dict[str, Any], aliases: list[int]) -> Any:
+        """CommitCount without the ancestor walk, so monorepos answer quickly"""
+        data: dict[str, Any] = {}
+        for n in aliases:
+            i = self.known_repo(variables.get(f"name{n}"))
+            fields = None
+            if i is not None:
+                fields = commit_count_fields(i)
+                fields["commit"] = {"oid": commit_oid(i)}
+            data[f"repo{n}"] = fields
+            data[f"allRefs{n}"] = search_results(42)
+        return data
+
+    def repo_search(self, query: object) -> dict[str, Any]:
+        match = RUN_SEARCH_REPO_RE.search(str(query or ""))
+        i = self.known_repo(ESCAPE_RE.sub(r"\1", match.group(1))) if match else None
+        return search_results(3 if run_search_matches(i) else 0)
+
+    def run_search(self, variables: dict[str, Any], aliases: list[int]) -> Any:
+        if not aliases:
+            return {"search": self.repo_search(variables.get("query"))}
+        return {
+            f"search{n}": self.repo_search(variables.get(f"query{n}")) for n in aliases
+        }
+
+    def run_search_repos(self, variables: dict[str, Any], aliases: list[int]) -> Any:
+        data: dict[str, Any] = {}
+        for n in aliases:
+            query = str(variables.get(f"query{n}") or "")
+            match = RUN_SEARCH_REPOS_RE.search(query)
+            names = ESCAPE_RE.sub(r"\1", match.group(1)).split("|") if match else []
+            data[f"search{n}"] = {
+                "results": {
+                    "limitHit": False,
+                    "alert": None,
+                    "results": [
+                        {"name": name}
+                        for name in names
+                        if run_search_matches(i := self.known_repo(name))
+                        and searched_by_default(i, query)
+                    ],
+                },
+            }
+        return data
+
+    def skipped_files_repo(self, query: object) -> int | None:
+        match = SKIPPED_FILES_REPO_RE.search(str(query or ""))
+        return self.known_repo(ESCAPE_RE.sub(r"\1", match.group(1))) if match else None
+
+    def skipped_file_reasons(
+        self, variables: dict[str, Any], _aliases: list[int]
+    ) -> Any:
+        i = self.skipped_files_repo(variables.get("query"))
+        count = 0 if i is None else skipped_file_count(i)
+        name = repo_name(i or 0)
+        matches = [
+            {
+                "repository": {"name": name},
+                "file": {"path": skipped_file_path(n), "byteSize": 2 * 1024 * 1024},
+                "chunkMatches": [{"content": skipped_file_content(n)}],
+            }
+            for n in range(count)
+        ]
+        return {
+            "search": {
+                "results": {
+                    "matchCount": count,
+                    "limitHit": False,
+                    "alert": None,
+                    "results": matches,
+                },
+            },
+        }
+
+    def version(self) -> str:
+        with self._lock:
+            self.requests["Version"] += 1
+        return FAKE_VERSION
+
+    def search_stream(self, query: str, display: int) -> list[tuple[str, Any]]:
+        """Return the (event, data) pairs /.api/search/stream sends for `query`"""
+        with self._lock:
+            self.requests["SearchStream"] += 1
+        time.sleep(self.config.latency)
+        if "NOT-INDEXED" in query:
+            i = self.skipped_files_repo(query)
+            count = 0 if i is None else skipped_file_count(i)
+            matches = [
+                {
+                    "type": "content",
+                    "repository": repo_name(i or 0),
+                    "path": skipped_file_path(n),
+                    "chunkMatches": [{"content": skipped_file_content(n)}],
+                }
+                for n in range(count)
+            ]
+        else:
+            repo = RUN_SEARCH_REPO_RE.search(query)
+            i = self.known_repo(ESCAPE_RE.sub(r"\1", repo.group(1))) if repo else None
+            count = 3 if run_search_matches(i) else 0
+            matches = [
+                {"type": "content", "repository": repo_name(i or 0), "path": f"f{n}"}
+                for n in range(count)
+            ]
+        shown = matches if display < 0 else matches[:display]
+        events: list[tuple[str, Any]] = [
+            ("matches", shown[start : start + STREAM_MATCHES_PER_EVENT])
+            for start in range(0, len(shown), STREAM_MATCHES_PER_EVENT)
+        ]
+        skipped = [{"reason": "display"}] if len(shown) < len(matches) else []
+        events.append(
+            (
+                "progress",
+                {
+                    "done": True,
+                    "repositoriesCount": 1,
+                    "matchCount": len(matches),
+                    "skipped": skipped,
+                },
+            ),
+        )
+        events.append(("done", {}))
+        return events
+
+    def reclone(self, _variables: Any, _aliases: list[int]) -> Any:
+        return {"recloneRepository": {"alwaysNil": None}}
+
+    def reindex(self, _variables: Any, _aliases: list[int]) -> Any:
+        return {"reindexRepository": {"alwaysNil": None}}
+
+
+def serve(
+    instance: FakeSourcegraph,
+    host: str = "127.0.0.1",
+    port: int = 0,
+) -> ThreadingHTTPServer:
+    """Start serving `instance` on a daemon thread; port 0 picks a free one"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+        def do_POST(self) -> None:
+            length = int(self.headers.get("Content-Length") or 0)
+            status, body = instance.handle(json.loads(self.rfile.read(length)))
+            encoded = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(encoded)))
+            self.end_headers()
+            self.wfile.write(encoded)
+
+        def do_GET(self) -> None:
+            url = urlparse(self.path)
+            if url.path == "/__version":
+                body = instance.version().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            if url.path != "/.api/search/stream":
+                self.send_error(404)
+                return
+            parameters = parse_qs(url.query)
+            events = instance.search_stream(
+                parameters.get("q", [""])[0],
+                int(parameters.get("display", ["-1"])[0]),
+            )
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            self.close_connection = True
+            try:
+                for event, data in events:
+                    self.wfile.write(
+                        f"event: {event}\ndata: {json.dumps(data)}\n\n".encode(),
+                    )
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # list-repos.py hangs up once it has every skipped file
+                pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the FakeSourcegraphConfig options shared with throughput.py"""
+    defaults = FakeSourcegraphConfig()
+    parser.add_argument("--repos", type=int, default=defaults.repos)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=defaults.latency,
+        help="Seconds added to every request",
+    )
+    parser.add_argument(
+        "--per-repo-latency",
+        type=float,
+        default=defaults.per_repo_latency,
+        help="Extra seconds per repo in an aliased CommitCount/RunSearch batch",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=defaults.error_rate,
+        help="Fraction of requests answered with HTTP 503",
+    )
+    parser.add_argument(
+        "--graphql-error-rate",
+        type=float,
+        default=defaults.graphql_error_rate,
+        help="Fraction of requests answered with a retryable GraphQL error",
+    )
+    parser.add_argument(
+        "--max-fields",
+        type=int,
+        default=defaults.max_fields,
+        help="Reject queries selecting more fields with ErrQueryComplexityLimitExceeded",
+    )
+    parser.add_argument(
+        "--monorepo-every",
+        type=int,
+        default=defaults.monorepo_every,
+        help="Make every Nth repo a 50 GB monorepo (0: none)",
+    )
+    parser.add_argument(
+        "--monorepo-latency",
+        type=float,
+        default=defaults.monorepo_latency,
+        help="Extra seconds per monorepo in a CommitCount request",
+    )
+
+
+def config_from_args(args: argparse.Namespace) -> FakeSourcegraphConfig:
+    return FakeSourcegraphConfig(
+        repos=args.repos,
+        latency=args.latency,
+        per_repo_latency=args.per_repo_latency,
+        error_rate=args.error_rate,
+        graphql_error_rate=args.graphql_error_rate,
+        max_fields=args.max_fields,
+        monorepo_every=args.monorepo_every,
+        monorepo_latency=args.monorepo_latency,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=(__doc__ or "").splitlines()[0])
+    add_config_arguments(parser)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+    instance = FakeSourcegraph(config_from_args(args))
+    server = serve(instance, args.host, args.port)
+    host, port = server.server_address[:2]
+    print(f"Serving {args.repos} repos at http://{host}:{port}; Ctrl-C to stop")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        print(json.dumps(dict(instance.requests), indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Microbenchmark: per-row cost of turning listing nodes into CSV rows
+
+Compares the compiled projection used by list-repos.py (`project_repo`) with
+evaluating every column spec on its own, the way rows were built before the
+projection existed: one dotted-path walk per cell, plus separate walks for
+the error and skipped-file checks. --statistics is timed on its own
+
+    python3 benchmarks/row_projection.py --repos 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import sys
+import timeit
+from pathlib import Path
+from typing import Any
+
+from fake_sourcegraph import repo_node
+
+SCRIPT = Path(__file__).resolve().parent.parent / "list-repos.py"
+
+
+def load_list_repos() -> Any:
+    """Import list-repos.py, whose hyphenated name rules out a plain import"""
+    spec = importlib.util.spec_from_file_location("list_repos", SCRIPT)
+    if spec is None or spec.loader is None:
+        sys.exit(f"Cannot load {SCRIPT}")
+    module = importlib.util.module_from_spec(spec)
+    # dataclasses resolve annotations through sys.modules
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def per_cell(lr: Any, columns: list[Any], repo: dict[str, Any]) -> list[Any]:
+    """Evaluate each column spec independently, walking its path from the root"""
+    row = []
+    for _, extract, _, _, _ in columns:
+        if isinstance(extract, lr.FieldPath):
+            value = lr.get_path(repo, extract.path)
+            if value is not None and extract.convert is not None:
+                value = extract.convert(value)
+            row.append(value)
+        else:
+            row.append(extract(repo))
+    return row
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=(__doc__ or "").splitlines()[0])
+    parser.add_argument("--repos", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    lr = load_list_repos()
+    repos = [repo_node(i) for i in range(1, args.repos + 1)]
+    endpoint = "https://sourcegraph.example.com"
+
+    def per_cell_pass() -> None:
+        for repo in repos:
+            per_cell(lr, lr.COLUMNS, repo)
+            mirror_status = lr.derive_mirror_status(repo)
+            if lr.has_cloning_error(mirror_status):
+                per_cell(lr, lr.CLONING_ERROR_EXTRA_COLUMNS, repo)
+            lr.has_indexing_error(
+                mirror_status,
+                lr.derive_index_status(repo),
+                lr.get_path(repo, "textSearchIndex.lastIndexStatus"),
+            )
+            if lr.total_skipped_files(repo) > 0:
+                per_cell(lr, lr.SKIPPED_FILES_EXTRA_COLUMNS, repo)
+
+    def projected_pass() -> None:
+        for repo in repos:
+            lr.project_repo(repo, endpoint)
+
+    projected = [lr.project_repo(repo, endpoint) for repo in repos]
+
+    def stats_pass() -> None:
+        stats = lr.StatsCollector()
+        for repo in projected:
+            stats.add(repo)
+
+    print(f"{len(repos)} repos, best of {args.repeat}")
+    for label, func in (
+        ("per-cell path walks", per_cell_pass),
+        ("compiled projection", projected_pass),
+        ("StatsCollector.add", stats_pass),
+    ):
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print(f"{label:<20} {best / len(repos) * 1e6:8.2f} us/row")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""End-to-end throughput of list-repos.py against a local fake instance
+
+Starts fake_sourcegraph.py in-process, runs list-repos.py once per scenario
+in a scratch directory, and reports repos/sec, GraphQL requests/sec, and the
+peak RSS of the list-repos.py process. Save a baseline with --json and
+compare later runs against it to catch regressions
+
+    python3 benchmarks/throughput.py --repos 10000
+    python3 benchmarks/throughput.py --repos 100000 --scenario count-commits \\
+        --per-repo-latency 0.005 --error-rate 0.01 --json after.json \\
+        --baseline before.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from fake_sourcegraph import (
+    FakeSourcegraph,
+    add_config_arguments,
+    config_from_args,
+    serve,
+)
+
+SCRIPT = Path(__file__).resolve().parent.parent / "list-repos.py"
+
+# list-repos.py flags for each scenario, on top of --list-repos-args
+SCENARIOS = {
+    "listing": [],
+    "listing-columns": [
+        "--columns",
+        "url,mirrorInfo.status,mirrorInfo.byteSize(MB)",
+    ],
+    "statistics": ["--statistics"],
+    "count-commits": ["--count-commits"],
+    "count-commits-ordered": ["--count-commits", "--ordered"],
+    "count-commits-cached": ["--count-commits"],
+    "count-commits-replay": ["--count-commits", "--replay", "archive"],
+    "count-commits-large-repo-lane": [
+        "--count-commits",
+        "--large-repo-mb",
+        "10240",
+    ],
+    "only-cloning-errors": ["--only", "cloning-errors"],
+    "count-commits-top-500": ["--count-commits", "--top", "500"],
+    "run-search": ["--run-search", "TODO patternType:literal"],
+    "run-search-global": [
+        "--run-search",
+        "TODO patternType:literal",
+        "--run-search-mode",
+        "global",
+    ],
+    "skipped-files-reason": ["--skipped-files-reason"],
+    "skipped-files-reason-stream": [
+        "--skipped-files-reason",
+        "--search-api",
+        "stream",
+    ],
+}
+
+# Flags for an untimed list-repos.py run in the same directory first, so a
+# scenario measures a warm cache or a replay of that run's --record archive
+SETUP_RUNS = {
+    "count-commits-cached": ["--count-commits"],
+    "count-commits-replay": ["--count-commits", "--record", "archive"],
+}
+
+# Flag a scenario whose repos/sec drops by more than this against --baseline
+REGRESSION_TOLERANCE = 0.10
+
+
+@dataclass(frozen=True)
+class ScenarioResult:
+    scenario: str
+    repos: int
+    seconds: float
+    requests: int
+    peak_rss_mb: float
+    exit_code: int
+
+    @property
+    def repos_per_second(self) -> float:
+        return self.repos / self.seconds if self.seconds else 0.0
+
+    @property
+    def requests_per_second(self) -> float:
+        return self.requests / self.seconds if self.seconds else 0.0
+
+
+def peak_rss_mb(rusage_maxrss: int) -> float:
+    """ru_maxrss is in KiB on Linux and in bytes on macOS"""
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return rusage_maxrss / divisor
+
+
+def run_scenario(
+    instance: FakeSourcegraph,
+    endpoint: str,
+    scenario: str,
+    extra_args: list[str],
+) -> ScenarioResult:
+    """Run list-repos.py once and measure it from the outside
+
+    Each scenario gets its own --cache-dir, so only a SETUP_RUNS scenario
+    starts with cached capabilities and commit counts. Repos are counted
+    from the --profile the run writes, since --only and --top scenarios
+    write only some of the instance's repos
+    """
+    env = {
+        **os.environ,
+        "SRC_ENDPOINT": endpoint,
+        "SRC_ACCESS_TOKEN": "sgp_benchmark",
+    }
+    with tempfile.TemporaryDirectory(prefix=f"list-repos-{scenario}-") as workdir:
+        command = [sys.executable, str(SCRIPT)]
+        options = ["--cache-dir", str(Path(workdir) / "cache"), *extra_args]
+        if scenario in SETUP_RUNS:
+            subprocess.run(
+                [*command, *SETUP_RUNS[scenario], *options],
+                cwd=workdir,
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                check=False,
+            )
+        profile = Path(workdir) / "profile.json"
+        instance.reset_counts()
+        start = time.monotonic()
+        process = subprocess.Popen(
+            [*command, *SCENARIOS[scenario], *options, "--profile", str(profile)],
+            cwd=workdir,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        # wait4 reports the child's own peak RSS, not the harness's
+        _, status, rusage = os.wait4(process.pid, 0)
+        seconds = time.monotonic() - start
+        process.returncode = os.waitstatus_to_exitcode(status)
+        try:
+            repos = json.loads(profile.read_text())["repos_written"]
+        except (OSError, ValueError, KeyError):
+            repos = 0
+    return ScenarioResult(
+        scenario=scenario,
+        repos=repos,
+        seconds=seconds,
+        requests=sum(instance.requests.values()),
+        peak_rss_mb=peak_rss_mb(rusage.ru_maxrss),
+        exit_code=process.returncode,
+    )
+
+
+def load_baseline(path: Path) -> dict[str, float]:
+    """Return repos/sec per scenario from an earlier --json file"""
+    results = json.loads(path.read_text())["results"]
+    return {result["scenario"]: result["repos_per_second"] for result in results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=(__doc__ or "").splitlines()[0])
+    add_config_arguments(parser)
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=sorted(SCENARIOS),
+        help="Scenario to run; repeat for several (default: all)",
+    )
+    parser.add_argument(
+        "--list-repos-args",
+        default="",
+        help="Extra list-repos.py flags for every scenario, e.g. '--transport async'",
+    )
+    parser.add_argument("--json", type=Path, help="Also write results to this file")
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        help="Earlier --json file; exit 1 if repos/sec regressed",
+    )
+    args = parser.parse_args()
+
+    config = config_from_args(args)
+    instance = FakeSourcegraph(config)
+    server = serve(instance)
+    host, port = server.server_address[:2]
+    endpoint = f"http://{host}:{port}"
+    extra_args = shlex.split(args.list_repos_args)
+
+    print(
+        f"{config.repos} repos, latency {config.latency}s "
+        f"(+{config.per_repo_latency}s per batched repo), "
+        f"error rates {config.error_rate} HTTP / {config.graphql_error_rate} GraphQL",
+    )
+    print(
+        f"{'scenario':<30} {'seconds':>9} {'repos/s':>10} {'requests':>9} "
+        f"{'req/s':>8} {'peak RSS':>10}",
+    )
+    results = []
+    try:
+        for scenario in args.scenario or list(SCENARIOS):
+            result = run_scenario(instance, endpoint, scenario, extra_args)
+            results.append(result)
+            failed = f"  (exit {result.exit_code})" if result.exit_code else ""
+            print(
+                f"{scenario:<30} {result.seconds:>9.2f} "
+                f"{result.repos_per_second:>10.0f} {result.requests:>9} "
+                f"{result.requests_per_second:>8.1f} "
+                f"{result.peak_rss_mb:>7.1f} MB{failed}",
+            )
+    finally:
+        server.shutdown()
+
+    if args.json is not None:
+        args.json.write_text(
+            json.dumps(
+                {
+                    "config": asdict(config),
+                    "list_repos_args": extra_args,
+                    "results": [
+                        {
+                            **asdict(result),
+                            "repos_per_second": result.repos_per_second,
+                            "requests_per_second": result.requests_per_second,
+                        }
+                        for result in results
+                    ],
+                },
+                indent=2,
+            )
+            + "\n",
+        )
+
+    regressed = False
+    if args.baseline is not None:
+        baseline = load_baseline(args.baseline)
+        for result in results:
+            before = baseline.get(result.scenario)
+            if not before:
+                continue
+            change = result.repos_per_second / before - 1
+            if change < -REGRESSION_TOLERANCE:
+                regressed = True
+            print(f"{result.scenario:<30} {change:+.1%} repos/s vs baseline")
+    if regressed or any(result.exit_code for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,46 +3,174 @@
 from __future__ import annotations
 
 import argparse
+import array
+import asyncio
 import base64
+import bisect
+import codecs
 import collections
 import concurrent.futures
 import contextlib
 import csv
+import gzip
+import hashlib
+import heapq
 import http.client
+import importlib
+import itertools
 import json
 import logging
+import math
 import os
+import queue
+import random
 import re
 import shlex
+import sqlite3
+import ssl
 import sys
+import tempfile
 import textwrap
+import threading
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, NoReturn, TextIO, cast
-from urllib.parse import ParseResult, urlparse, urlsplit, urlunsplit
+from typing import IO, TYPE_CHECKING, Any, Generic, NoReturn, TextIO, TypeVar, cast
+from urllib.parse import ParseResult, urlencode, urlparse, urlsplit, urlunsplit
 
 if TYPE_CHECKING:
-    from collections.abc import Callable, Iterator
+    from collections.abc import Callable, Generator, Iterable, Iterator
 
 logger = logging.getLogger(__name__)
 
 
 # --- Tune-ables -----------------------------------------------------------------
 
+# Startup probe results (site-admin flag, RepositoryTextSearchIndex fields,
+# accepted listing page size) are reused for this long per endpoint, token,
+# and instance version; --capability-cache-ttl 0 turns the cache off
+DEFAULT_CAPABILITY_CACHE_TTL_SECONDS = 3600
+CAPABILITY_CACHE_FILE = "capabilities.json"
+# Exact --count-commits counts keyed by repo and commit OID, reused while the
+# rev still resolves to that commit. Past this many rows the least recently
+# used are dropped at the end of a run (one row is about 150 bytes on disk)
+COMMIT_COUNT_CACHE_FILE = "commit-counts.sqlite"
+COMMIT_COUNT_CACHE_MAX_ENTRIES = 1_000_000
+# --record compresses each GraphQL response on a worker thread; 6 keeps a
+# 1,000-repo listing page to a few milliseconds at most of 9's ratio
+RESPONSE_ARCHIVE_COMPRESSLEVEL = 6
+# The instance version is read from the unauthenticated /__version endpoint
+INSTANCE_VERSION_TIMEOUT_SECONDS = 10
+DEFAULT_CHECKPOINT_FILE = "checkpoint.jsonl"
+# Completed repos between --resume checkpoint saves; each save flushes every
+# output CSV, so this trades resume granularity against fsync-free flush cost
+DEFAULT_CHECKPOINT_INTERVAL = 100
 DEFAULT_CLONING_ERRORS_FILE = "repos-with-cloning-errors.csv"
 DEFAULT_CONCURRENCY = 16
+# Adaptive per-repo concurrency (AIMD): grow the in-flight limit by one after a
+# window of completed work whose p50 and p95 latencies stay within the
+# tolerance of the best window seen; multiply it by the backoff ratio on
+# 429/502/503/504 or "deadline exceeded", then ignore further overload signals
+# for the cooldown so one burst of failing requests only counts once
+ADAPTIVE_CONCURRENCY_WINDOW = 20
+ADAPTIVE_CONCURRENCY_LATENCY_TOLERANCE = 1.5
+ADAPTIVE_CONCURRENCY_BACKOFF_RATIO = 0.5
+ADAPTIVE_CONCURRENCY_COOLDOWN_SECONDS = 5
+OVERLOAD_HTTP_STATUSES = {429, 502, 503, 504}
+OVERLOAD_GRAPHQL_ERROR_TERMS = ("deadline exceeded",)
+# --large-repo-mb lane: repos at or above the size threshold are queried one
+# per request on their own threads, at most this many at once, on top of the
+# --concurrency limit for everything else
+DEFAULT_LARGE_REPO_CONCURRENCY = 2
+# Finished batches held back for an earlier, slower one before submission of
+# new batches pauses, per in-flight slot; bounds the reorder buffer's memory
+REORDER_BUFFER_BATCHES_PER_SLOT = 8
 DEFAULT_CSV_SCHEMA_FILE = "CSV_SCHEMA.md"
 DEFAULT_INDEXING_ERRORS_FILE = "repos-with-indexing-errors.csv"
 DEFAULT_LOG_FILE_STEM = "list-repos"
 DEFAULT_OUTPUT_FILE = "repos.csv"
+DEFAULT_OUTPUT_FORMAT = "csv"
+# --output-format choices and the suffix each gives the repo listing files
+OUTPUT_FORMAT_SUFFIXES = {"csv": ".csv", "parquet": ".parquet", "arrow": ".arrow"}
+# Rows buffered per Parquet row group / Arrow record batch; bounds the memory
+# a columnar writer holds regardless of instance size
+COLUMNAR_ROW_GROUP_SIZE = 10_000
+COLUMNAR_COMPRESSION = "zstd"
 DEFAULT_SKIPPED_FILES_FILE = "repos-with-skipped-files.csv"
 DEFAULT_SKIPPED_FILE_REASONS_FILE = "skipped-file-reasons.csv"
 DEFAULT_STATS_FILE_PREFIX = "stats"
+# Percentiles appended to every --statistics file's summary rows
+STATS_PERCENTILES = (50, 90, 99)
+# --statistics-sketch: worst-case relative error of a reported percentile
+STATS_SKETCH_RELATIVE_ACCURACY = 0.01
+# --profile latency histogram bucket bounds, in seconds; they span a quick
+# listing page through a slow monorepo commit count
+PROFILE_LATENCY_BUCKETS_SECONDS = (
+    0.01,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    120,
+    300,
+    600,
+)
+# --profile paths with this suffix get the Prometheus textfile format, not JSON
+PROFILE_PROMETHEUS_SUFFIX = ".prom"
+# Repos buffered by --store before one bulk-insert transaction
+STORE_COMMIT_INTERVAL = 1000
 DEFAULT_MAX_RETRIES = 5
+# --burst default: requests the --max-rps token bucket may send back to back
+DEFAULT_RATE_LIMIT_BURST = 10
+# Retry delays are scaled by a random factor in [1 - ratio, 1 + ratio] so
+# threads that failed together do not retry together
+RETRY_JITTER_RATIO = 0.5
+# Upper bound on a server Retry-After pause, so one bad header cannot stall
+# the run for hours
+MAX_RETRY_AFTER_SECONDS = 300
+# Repos per aliased CommitCount / RunSearch request. Shrinks automatically when
+# Sourcegraph reports a GraphQL field-count violation
+DEFAULT_QUERY_BATCH_SIZE = 20
+RUN_SEARCH_MODES = ("per-repo", "global")
+DEFAULT_RUN_SEARCH_MODE = "per-repo"
+# --run-search-mode global: listed repos per select:repo search. A chunk whose
+# search hits a result limit is split in half and searched again
+RUN_SEARCH_GLOBAL_CHUNK_SIZE = 200
+DEFAULT_TRANSPORT = "sync"
+# --search-api: how --skipped-files-reason and per-repo --run-search searches
+# are sent. stream uses /.api/search/stream (server-sent events)
+SEARCH_API_CHOICES = ("graphql", "stream")
+DEFAULT_SEARCH_API = "graphql"
+# Log a streaming search's running match count at most this often
+SEARCH_STREAM_PROGRESS_INTERVAL_SECONDS = 10
+TRANSPORT_CHOICES = ("sync", "async")
+# Extra pooled connections beyond --concurrency, for the listing prefetch
+# thread and reclone/reindex mutations sent from the main thread
+ASYNC_POOL_EXTRA_CONNECTIONS = 2
+# Close pooled connections idle for longer than this; most load balancers
+# drop idle keep-alive connections after 60s or more
+ASYNC_POOL_IDLE_TIMEOUT_SECONDS = 30
+# Response bodies are read in chunks of this size into a spool that stays in
+# memory up to RESPONSE_SPOOL_MEMORY_BYTES and moves to a temp file beyond it
+RESPONSE_CHUNK_BYTES = 64 * 1024
+RESPONSE_SPOOL_MEMORY_BYTES = 1024 * 1024
 GRAPHQL_FIELD_COUNT_RETRY_HEADROOM_PERCENT = 95
 PAGE_SIZE = 500
+DEFAULT_LISTING_SHARDS = 1
+# --listing-shards boundary scan page size. The scan selects only repo IDs,
+# so pages can be far larger than the full listing's field-heavy pages
+SHARD_BOUNDARY_SCAN_PAGE_SIZE = 5000
+# --columns starts from a larger page size, in proportion to the fields it
+# leaves out, up to the ID-only scan's page size
+MAX_COLUMNS_PAGE_SIZE = SHARD_BOUNDARY_SCAN_PAGE_SIZE
 REQUEST_TIMEOUT_SECONDS = 60
 REQUEST_TIMEOUT_SECONDS_WITH_COMMIT_COUNT = (
     600  # Counting commits server-side can be slow on big monorepos
@@ -143,8 +271,66 @@ REPO_NODE_FRAGMENT_TAIL = """
 """
 
 
+# --columns builds a pruned fragment from dotted field paths instead. These
+# fields keep the arguments and directives the full fragment gives them
+REPO_NODE_FIELD_ARGUMENTS = {
+    "externalServices": "(first: 100) @include(if: $includeExternalServices)",
+}
+REPO_NODE_TEXT_SEARCH_INDEX_FAILURE_PATHS = frozenset(
+    {"textSearchIndex.lastIndexStatus", "textSearchIndex.lastIndexFailureMessage"},
+)
+
+# Process-wide --columns field paths, installed by use_repo_node_fields.
+# None selects the full fragment
+_repo_node_fields: frozenset[str] | None = None
+
+
+@contextlib.contextmanager
+def use_repo_node_fields(fields: frozenset[str] | None) -> Iterator[None]:
+    """Install the pruned repo node selection for the duration of a run"""
+    global _repo_node_fields
+    _repo_node_fields = fields
+    try:
+        yield
+    finally:
+        _repo_node_fields = None
+
+
+def build_selection_set(paths: Iterable[str], indent: str = "  ") -> str:
+    """Render dotted field paths as a nested GraphQL selection set"""
+    tree: dict[str, Any] = {}
+    for path in sorted(paths):
+        node = tree
+        for key in path.split("."):
+            node = node.setdefault(key, {})
+    lines: list[str] = []
+
+    def render(node: dict[str, Any], prefix: str, depth: int) -> None:
+        for key, children in node.items():
+            path = f"{prefix}{key}"
+            arguments = REPO_NODE_FIELD_ARGUMENTS.get(path, "")
+            if not children:
+                lines.append(f"{indent * depth}{key}{arguments}")
+                continue
+            lines.append(f"{indent * depth}{key}{arguments} {{")
+            render(children, f"{path}.", depth + 1)
+            lines.append(f"{indent * depth}}}")
+
+    render(tree, "", 1)
+    return "\n".join(lines) + "\n"
+
+
 def build_repo_node_fragment(include_index_failure_fields: bool) -> str:
     """Return the shared Repository fragment with optional index-failure fields"""
+    fields = _repo_node_fields
+    if fields is not None:
+        if not include_index_failure_fields:
+            fields = fields - REPO_NODE_TEXT_SEARCH_INDEX_FAILURE_PATHS
+        return (
+            "\nfragment RepoNodeFields on Repository {\n"
+            + build_selection_set(fields)
+            + "}\n"
+        )
     return (
         REPO_NODE_FRAGMENT_HEAD
         + (
@@ -156,17 +342,100 @@ def build_repo_node_fragment(include_index_failure_fields: bool) -> str:
     )
 
 
+def repo_node_variables(fragment: str, variables: str) -> str:
+    """Append $includeExternalServices when the fragment uses it
+
+    GraphQL rejects declared variables that no field uses, and a pruned
+    fragment may not select externalServices
+    """
+    if "$includeExternalServices" in fragment:
+        return f"{variables}, $includeExternalServices: Boolean!"
+    return variables
+
+
+# --only modes, as `repositories` connection filters. A mode with several
+# filters walks the listing once per filter and drops repos seen already.
+# indexing-errors only finds cloned repos with no index at all: a repo whose
+# latest indexing attempt failed but that keeps an older index is indexed
+# as far as the server-side filter is concerned
+LISTING_FILTERS: dict[str, tuple[dict[str, bool | str], ...]] = {
+    "cloning-errors": (
+        {"failedFetch": True},
+        {"corrupted": True},
+        {"cloneStatus": "NOT_CLONED"},
+    ),
+    "indexing-errors": ({"cloneStatus": "CLONED", "indexed": False},),
+    "not-cloned": ({"cloneStatus": "NOT_CLONED"},),
+    "not-indexed": ({"indexed": False},),
+    "corrupted": ({"corrupted": True},),
+}
+
+
+def listing_filter_arguments(listing_filter: dict[str, bool | str]) -> str:
+    """Render filters as inline `repositories` arguments, e.g. `, indexed: false`"""
+    return "".join(
+        f", {name}: {str(value).lower() if isinstance(value, bool) else value}"
+        for name, value in listing_filter.items()
+    )
+
+
+def describe_listing_filter(listing_filter: dict[str, bool | str]) -> str:
+    """Return filters the way they appear in the query, for log messages"""
+    return listing_filter_arguments(listing_filter).removeprefix(", ")
+
+
 # Non-admin tokens set $includeExternalServices=false to skip admin-only fields
-def build_repository_listing_query(include_index_failure_fields: bool) -> str:
-    """Return the paginated repository listing query"""
+def build_repository_listing_query(
+    include_index_failure_fields: bool,
+    listing_filter: dict[str, bool | str] | None = None,
+) -> str:
+    """Return the paginated repository listing query, optionally filtered"""
+    arguments = listing_filter_arguments(listing_filter or {})
+    fragment = build_repo_node_fragment(include_index_failure_fields)
+    variables = repo_node_variables(fragment, "$first: Int!, $after: String")
     return (
-        build_repo_node_fragment(include_index_failure_fields)
-        + """
-query ListRepos($first: Int!, $after: String, $includeExternalServices: Boolean!) {
-  repositories(first: $first, after: $after) {
+        fragment
+        + f"""
+query ListRepos({variables}) {{
+  repositories(first: $first, after: $after"""
+        + arguments
+        + """) {
+    totalCount
+    pageInfo {
+      hasNextPage
+      endCursor
+    }
     nodes {
       ...RepoNodeFields
     }
+  }
+}
+"""
+    )
+
+
+def build_repository_count_query(
+    listing_filters: tuple[dict[str, bool | str], ...],
+) -> str:
+    """Return one aliased totalCount per --only filter, in one request"""
+    counts = "".join(
+        f"  count{position}: repositories(first: 0"
+        + listing_filter_arguments(listing_filter)
+        + ") {\n    totalCount\n  }\n"
+        for position, listing_filter in enumerate(listing_filters)
+    )
+    return "query CountRepos {\n" + counts + "}\n"
+
+
+# ID-only walk of the same connection (and so the same ordering) as ListRepos.
+# --listing-shards uses the endCursor of each page as a boundary where a shard
+# can start its own ListRepos walk; the IDs only give an exact per-page count
+REPOSITORY_CURSORS_QUERY = """
+query ListRepoCursors($first: Int!, $after: String) {
+  repositories(first: $first, after: $after) {
+    nodes {
+      id
+    }
     totalCount
     pageInfo {
       hasNextPage
@@ -175,30 +444,31 @@ query ListRepos($first: Int!, $after: String, $includeExternalServices: Boolean!
   }
 }
 """
-    )
 
 
 # Single-repo lookup used by the scoped variants of --count-commits / --reclone
 # / --reindex. Returns the same field set as the listing query (via the shared
-# fragment) so the rest of the pipeline (build_row, write_csv, the error/skip
+# fragment) so the rest of the pipeline (project_repo, write_csv, the error/skip
 # detectors, etc.) can treat the result identically to a listing-page node
 def build_single_repo_query(include_index_failure_fields: bool) -> str:
     """Return the single repository lookup query"""
+    fragment = build_repo_node_fragment(include_index_failure_fields)
+    variables = repo_node_variables(fragment, "$name: String!")
     return (
-        build_repo_node_fragment(include_index_failure_fields)
-        + """
-query SingleRepo($name: String!, $includeExternalServices: Boolean!) {
-  repository(name: $name) {
+        fragment
+        + f"""
+query SingleRepo({variables}) {{
+  repository(name: $name) {{
     ...RepoNodeFields
-  }
-}
+  }}
+}}
 """
     )
 
 
 # Used once at startup to gate admin-only fields and mutations
 CURRENT_USER_QUERY = """
-query { currentUser { username siteAdmin } }
+query CurrentUser { currentUser { username siteAdmin } }
 """
 
 TEXT_SEARCH_INDEX_FIELDS_QUERY = """
@@ -215,33 +485,41 @@ TEXT_SEARCH_INDEX_FAILURE_FIELD_NAMES = frozenset(
     {"lastIndexStatus", "lastIndexFailureMessage"},
 )
 
-# Per-repo query for exact rev count, cleanup metadata, and all-refs proxy
+# Per-repo fields for exact rev count, cleanup metadata, and all-refs proxy
 # Omitting ancestors.first asks gitserver for the full reachable commit count
-COMMIT_COUNT_QUERY = """
-query CommitCount($name: String!, $rev: String!, $allRefsSearch: String!) {
-  repository(name: $name) {
-    commit(rev: $rev) {
-      ancestors {
-        totalCount
-      }
+COMMIT_COUNT_FRAGMENT = """
+fragment CommitCountFields on Repository {
+  commit(rev: $rev) {
+    oid
+    ancestors {
+      totalCount
     }
-    mirrorInfo {
-      lastCleanedAt
-      cleanupSchedule {
-        due
-        intervalSeconds
-      }
-      cleanupQueue {
-        index
-        optimizing
-      }
-      repositoryStatistics {
-        packfiles {
-          lastFullRepack
-        }
+  }
+  mirrorInfo {
+    lastCleanedAt
+    cleanupSchedule {
+      due
+      intervalSeconds
+    }
+    cleanupQueue {
+      index
+      optimizing
+    }
+    repositoryStatistics {
+      packfiles {
+        lastFullRepack
       }
     }
   }
+}
+"""
+
+COMMIT_COUNT_QUERY = (
+    """
+query CommitCount($name: String!, $rev: String!, $allRefsSearch: String!) {
+  repository(name: $name) {
+    ...CommitCountFields
+  }
   search(query: $allRefsSearch, version: V3) {
     results {
       matchCount
@@ -249,6 +527,48 @@ query CommitCount($name: String!, $rev: String!, $allRefsSearch: String!) {
   }
 }
 """
+    + COMMIT_COUNT_FRAGMENT
+)
+
+
+# CommitCountFields without the ancestor walk, for repos whose count may
+# already be in the commit-count cache under the rev's current OID
+COMMIT_OID_FRAGMENT = COMMIT_COUNT_FRAGMENT.replace(
+    "\n    ancestors {\n      totalCount\n    }",
+    "",
+)
+
+
+def build_commit_count_batch_query(size: int, *, oid_only: bool = False) -> str:
+    """Build a CommitCount query with repo<i> / allRefs<i> aliases per repo
+
+    With oid_only it is a CommitOid query, which resolves the rev but does
+    not count its ancestors
+    """
+    operation, fragment = (
+        ("CommitOid", COMMIT_OID_FRAGMENT)
+        if oid_only
+        else ("CommitCount", COMMIT_COUNT_FRAGMENT)
+    )
+    variables = ", ".join(
+        f"$name{i}: String!, $allRefsSearch{i}: String!" for i in range(size)
+    )
+    fields = "".join(
+        f"""
+  repo{i}: repository(name: $name{i}) {{
+    ...CommitCountFields
+  }}
+  allRefs{i}: search(query: $allRefsSearch{i}, version: V3) {{
+    results {{
+      matchCount
+    }}
+  }}"""
+        for i in range(size)
+    )
+    return (
+        f"\nquery {operation}($rev: String!, {variables}) {{{fields}\n}}\n" + fragment
+    )
+
 
 # Approximate all-refs count. Not comparable to the exact rev count
 # Repo anchoring, regex escaping, and timeout prevent slow unbounded searches
@@ -282,6 +602,25 @@ query RunSearch($query: String!) {
 """
 
 
+def build_run_search_batch_query(size: int) -> str:
+    """Build a RunSearch query with one search<i> alias per repo and pattern"""
+    variables = ", ".join(f"$query{i}: String!" for i in range(size))
+    fields = "".join(
+        f"""
+  search{i}: search(query: $query{i}, version: V3) {{
+    results {{
+      matchCount
+      limitHit
+      alert {{
+        title
+      }}
+    }}
+  }}"""
+        for i in range(size)
+    )
+    return f"\nquery RunSearch({variables}) {{{fields}\n}}\n"
+
+
 def build_run_search_query(repo_name: str, pattern: str) -> str:
     """Build a per-repo --run-search query while leaving pattern syntax verbatim"""
     return RUN_SEARCH_QUERY_TEMPLATE.format(
@@ -290,6 +629,59 @@ def build_run_search_query(repo_name: str, pattern: str) -> str:
     )
 
 
+# --run-search-file pattern names become part of CSV column names
+RUN_SEARCH_PATTERN_NAME_RE = re.compile(r"[A-Za-z0-9_-]+")
+
+
+@dataclass(frozen=True)
+class RunSearchPattern:
+    """One --run-search pattern and the name its result columns carry
+
+    A single --run-search PATTERN has an empty name and keeps the plain
+    runSearch.* columns; --run-search-file patterns get runSearch.<name>.*
+    """
+
+    name: str
+    pattern: str
+
+    def column(self, column: str) -> str:
+        """Return this pattern's copy of a RUN_SEARCH_COLUMNS name"""
+        if not self.name:
+            return column
+        prefix, _, field = column.partition(".")
+        return f"{prefix}.{self.name}.{field}"
+
+
+def load_run_search_patterns(path: Path) -> list[RunSearchPattern]:
+    """Read NAME=PATTERN lines; blank lines and # comments are skipped"""
+    if not path.is_file():
+        die(f"--run-search-file {path} does not exist")
+    patterns: list[RunSearchPattern] = []
+    names: set[str] = set()
+    for line_number, line in enumerate(
+        path.read_text(encoding="utf-8").splitlines(),
+        start=1,
+    ):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        name, separator, pattern = line.partition("=")
+        name = name.strip()
+        pattern = pattern.strip()
+        where = f"--run-search-file {path}:{line_number}"
+        if not separator or not pattern:
+            die(f"{where}: expected NAME=PATTERN, got {line!r}")
+        if not RUN_SEARCH_PATTERN_NAME_RE.fullmatch(name):
+            die(f"{where}: pattern name {name!r} may only use letters, digits, _ and -")
+        if name in names:
+            die(f"{where}: duplicate pattern name {name!r}")
+        names.add(name)
+        patterns.append(RunSearchPattern(name, pattern))
+    if not patterns:
+        die(f"--run-search-file {path} has no NAME=PATTERN lines")
+    return patterns
+
+
 RECLONE_MUTATION = """
 mutation Reclone($repo: ID!) {
   recloneRepository(repo: $repo) {
@@ -389,14 +781,87 @@ def get_path(repo: dict[str, Any], path: str) -> object | None:
     return current
 
 
-def get_path_mb(repo: dict[str, Any], path: str) -> int | None:
-    """Like get_path, but convert to megabytes"""
-    value = get_path(repo, path)
+def whole_mb(value: object) -> int | None:
+    """Convert a GraphQL byte count (int or BigInt string) to whole megabytes"""
     if isinstance(value, (int, str)):
         return int(value) // (1024 * 1024)
     return None
 
 
+@dataclass(frozen=True)
+class FieldPath:
+    """Column extractor reading a dotted GraphQL path
+
+    `convert` is applied to the value unless the path is missing or null, in
+    which case the cell is None
+    """
+
+    path: str
+    convert: Callable[[Any], Any] | None = None
+
+
+class RowProjection:
+    """Column tables compiled into one flat plan evaluated in a single pass
+
+    Every distinct dotted-path prefix becomes one slot filled from its parent
+    slot, so `textSearchIndex.status` is looked up once per repo however many
+    columns read fields below it. Slot 0 is the repo node itself, which is
+    what plain callable extractors receive
+    """
+
+    def __init__(
+        self,
+        *column_groups: list[tuple[str, Any, str, bool, str]],
+        paths: Iterable[str] = (),
+    ) -> None:
+        self._slots: dict[str, int] = {"": 0}
+        self._steps: list[tuple[int, str]] = []
+        self._groups = [
+            [self._cell(extract) for _, extract, _, _, _ in columns]
+            for columns in column_groups
+        ]
+        for path in paths:
+            self._slot(path)
+
+    def _slot(self, path: str) -> int:
+        slot = self._slots.get(path)
+        if slot is None:
+            parent, _, key = path.rpartition(".")
+            # Parents get their slot first, so one forward pass fills them all
+            self._steps.append((self._slot(parent), key))
+            slot = self._slots[path] = len(self._steps)
+        return slot
+
+    def _cell(
+        self,
+        extract: FieldPath | Callable[[dict[str, Any]], Any],
+    ) -> tuple[int, Callable[[Any], Any] | None]:
+        if isinstance(extract, FieldPath):
+            return self._slot(extract.path), extract.convert
+        return 0, extract
+
+    def slot(self, path: str) -> int:
+        """Return the slot index of a compiled path"""
+        return self._slots[path]
+
+    def walk(self, node: dict[str, Any]) -> list[Any]:
+        """Resolve every compiled path of `node`, indexed by slot"""
+        slots: list[Any] = [node]
+        append = slots.append
+        for parent, key in self._steps:
+            value = slots[parent]
+            append(value.get(key) if isinstance(value, dict) else None)
+        return slots
+
+    def cells(self, slots: list[Any], group: int = 0) -> list[Any]:
+        """Return one column group's cells from an already walked node"""
+        row: list[Any] = []
+        for slot, convert in self._groups[group]:
+            value = slots[slot]
+            row.append(value if convert is None or value is None else convert(value))
+        return row
+
+
 def derive_mirror_status(repo: dict[str, Any]) -> str:
     """Summarize the repo's mirror state into a single status string"""
     mirror: dict[str, Any] = repo.get("mirrorInfo") or {}
@@ -426,19 +891,16 @@ def seconds_relative_to_now(timestamp: object, *, future: bool) -> int | None:
 
 def derive_index_status(repo: dict[str, Any]) -> str:
     """Summarize the repo's search-index state as 'indexed' or 'not_indexed'"""
-    return (
-        "indexed"
-        if get_path(repo, "textSearchIndex.status") is not None
-        else "not_indexed"
-    )
+    index: dict[str, Any] = repo.get("textSearchIndex") or {}
+    return "indexed" if index.get("status") is not None else "not_indexed"
 
 
-def redact_remote_url(repo: dict[str, Any]) -> str | None:
+def redact_remote_url(raw: object) -> str | None:
     """Redact mirrorInfo.remoteURL userinfo before it reaches any CSV output"""
-    raw = get_path(repo, "mirrorInfo.remoteURL")
     if not isinstance(raw, str):
         return None
-    if not raw:
+    # Without an "@" there is no userinfo, so skip the comparatively slow parse
+    if "@" not in raw:
         return raw
     parts = urlsplit(raw)
     if not parts.scheme or not parts.netloc or "@" not in parts.netloc:
@@ -466,9 +928,8 @@ def join_corruption_logs(repo: dict[str, Any]) -> str:
     )
 
 
-def truncate_sync_output(repo: dict[str, Any]) -> str | None:
+def truncate_sync_output(value: object) -> str | None:
     """Return lastSyncOutput truncated to first 5 + last 5 lines"""
-    value = get_path(repo, "mirrorInfo.lastSyncOutput")
     if not isinstance(value, str):
         return None
     return truncate_lines(value)
@@ -485,19 +946,22 @@ def truncate_lines(value: str, head: int = 5, tail: int = 5) -> str:
     )
 
 
-def has_cloning_error(repo: dict[str, Any]) -> bool:
+def has_cloning_error(mirror_status: str) -> bool:
     """Return True for errored, corrupted, or not-yet-cloned repos"""
-    return derive_mirror_status(repo) in {"errored", "corrupted", "not_cloned"}
+    return mirror_status in {"errored", "corrupted", "not_cloned"}
 
 
-def has_indexing_error(repo: dict[str, Any]) -> bool:
+def has_indexing_error(
+    mirror_status: str,
+    index_status: str,
+    last_index_status: object,
+) -> bool:
     """Return True for cloned repos with a missing or failed search index"""
-    if derive_mirror_status(repo) != "cloned":
+    if mirror_status != "cloned":
         return False
-    if get_path(repo, "textSearchIndex.status") is None:
+    if index_status != "indexed":
         return True
-    last_status = get_path(repo, "textSearchIndex.lastIndexStatus")
-    return isinstance(last_status, str) and last_status.upper() == "FAILURE"
+    return isinstance(last_index_status, str) and last_index_status.upper() == "FAILURE"
 
 
 def _index_refs(repo: dict[str, Any]) -> list[dict[str, Any]]:
@@ -572,11 +1036,6 @@ def head_skipped_query(repo: dict[str, Any]) -> str:
     return head_query or fallback
 
 
-def has_skipped_files(repo: dict[str, Any]) -> bool:
-    """Return True if zoekt skipped at least one file for this repo"""
-    return total_skipped_files(repo) > 0
-
-
 def fetch_commit_count(
     endpoint: str,
     token: str,
@@ -614,22 +1073,46 @@ def fetch_commit_count(
         )
         return None, None, elapsed, empty_extras
     elapsed = time.monotonic() - start
-    repo: dict[str, Any] = data.get("repository") or {}
+    remember_commit_count(repo_name, data.get("repository"))
+    return parse_commit_count(
+        data.get("repository"),
+        data.get("search"),
+        elapsed,
+    )
+
+
+def remember_commit_count(repo_name: str, repo_block: dict[str, Any] | None) -> None:
+    """Add a CommitCount result to the commit-count cache, if one is in use"""
+    cache = _commit_count_cache
+    if cache is None:
+        return
+    oid = get_path(repo_block or {}, "commit.oid")
+    count = get_path(repo_block or {}, "commit.ancestors.totalCount")
+    if isinstance(oid, str) and isinstance(count, int):
+        cache.store(repo_name, oid, count)
+
+
+def parse_commit_count(
+    repo_block: dict[str, Any] | None,
+    search_block: dict[str, Any] | None,
+    elapsed: float,
+) -> tuple[int | None, int | None, float, list[Any]]:
+    """Convert CommitCount repository and search blocks to result values"""
+    repo: dict[str, Any] = repo_block or {}
     commit: dict[str, Any] = repo.get("commit") or {}
     ancestors: dict[str, Any] = commit.get("ancestors") or {}
     default_count_raw = ancestors.get("totalCount")
     default_count: int | None = (
         default_count_raw if isinstance(default_count_raw, int) else None
     )
-    search_block: dict[str, Any] = data.get("search") or {}
-    search_results: dict[str, Any] = search_block.get("results") or {}
+    search_results: dict[str, Any] = (search_block or {}).get("results") or {}
     all_refs_count_raw = search_results.get("matchCount")
     all_refs_count: int | None = (
         all_refs_count_raw if isinstance(all_refs_count_raw, int) else None
     )
-    optimization_values = [
-        extract(repo) for _, extract, _, _, _ in COMMIT_COUNT_OPTIMIZATION_COLUMNS
-    ]
+    optimization_values = COMMIT_COUNT_OPTIMIZATION_PROJECTION.cells(
+        COMMIT_COUNT_OPTIMIZATION_PROJECTION.walk(repo),
+    )
     return default_count, all_refs_count, elapsed, optimization_values
 
 
@@ -641,8 +1124,10 @@ def fetch_run_search(
     max_retries: int = DEFAULT_MAX_RETRIES,
 ) -> tuple[int | None, float, bool, str | None]:
     """Return --run-search match count, elapsed time, limit flag, and alert"""
-    start = time.monotonic()
     query = build_run_search_query(repo_name, pattern)
+    if _search_api == "stream":
+        return stream_run_search(endpoint, token, repo_name, query, max_retries)
+    start = time.monotonic()
     try:
         data = graphql_request(
             endpoint,
@@ -661,8 +1146,52 @@ def fetch_run_search(
         logger.warning("run-search network error for %s: %s", repo_name, exc)
         return None, elapsed, False, None
     elapsed = time.monotonic() - start
-    search_block: dict[str, Any] = data.get("search") or {}
-    results: dict[str, Any] = search_block.get("results") or {}
+    return parse_run_search(data.get("search"), elapsed)
+
+
+def stream_run_search(
+    endpoint: str,
+    token: str,
+    repo_name: str,
+    query: str,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+) -> tuple[int | None, float, bool, str | None]:
+    """Run one --run-search query through the search stream, without matches"""
+    start = time.monotonic()
+    summary = SearchStreamSummary()
+    try:
+        for _match in stream_search(
+            endpoint,
+            token,
+            query,
+            summary,
+            version="V3",
+            display=0,
+            timeout=REQUEST_TIMEOUT_SECONDS,
+            max_retries=max_retries,
+            description=f"Search in {repo_name}",
+        ):
+            pass
+    except (GraphQLError, HTTPRequestError) as exc:
+        logger.warning("run-search query failed for %s: %s", repo_name, exc)
+        return None, time.monotonic() - start, False, None
+    except OSError as exc:
+        logger.warning("run-search network error for %s: %s", repo_name, exc)
+        return None, time.monotonic() - start, False, None
+    return (
+        summary.match_count,
+        time.monotonic() - start,
+        summary.limit_hit,
+        summary.alert_title,
+    )
+
+
+def parse_run_search(
+    search_block: dict[str, Any] | None,
+    elapsed: float,
+) -> tuple[int | None, float, bool, str | None]:
+    """Convert a RunSearch search block to result values"""
+    results: dict[str, Any] = (search_block or {}).get("results") or {}
     raw_count = results.get("matchCount")
     match_count: int | None = raw_count if isinstance(raw_count, int) else None
     limit_hit = bool(results.get("limitHit"))
@@ -674,136 +1203,576 @@ def fetch_run_search(
     return match_count, elapsed, limit_hit, alert_title
 
 
-# --- CSV format -----------------------------------------------------------
+# --- Aliased per-repo query batches -------------------------------------------
 
-# Each entry is (csv_column_name, extractor_function). Keeping the column name
-# next to the function that produces its value eliminates the risk of the
-# header drifting out of sync with the row data
-COLUMNS: list[tuple[str, Callable[[dict[str, Any]], Any], str, bool, str]] = [
-    (
-        "id",
-        lambda r: decode_repo_id(r["id"]),
-        "Numeric Sourcegraph database ID for the repository, decoded "
-        "locally from the base64 GraphQL global ID; useful when correlating "
-        "with the `repo` table or admin URLs",
-        False,
-        "integer",
-    ),
-    (
-        "url",
-        lambda r: r.get("url"),
-        "URL to the repository on this Sourcegraph instance",
-        False,
-        "string",
-    ),
-    (
-        "mirrorInfo.remoteURL",
-        redact_remote_url,
-        "Clone URL of the upstream repository on the code host",
-        True,
-        "string",
-    ),
-    (
-        "externalServices",
-        join_external_services,
-        "Display names of the external service(s) which clone this repository",
-        True,
-        "string (semicolon-joined)",
-    ),
-    (
-        "mirrorInfo.status",
-        derive_mirror_status,
-        "Single-word summary of the repo's mirror state, derived locally "
-        "from `mirrorInfo`",
-        False,
-        "enum (corrupted, errored, cloning, cloned, not_cloned)",
-    ),
-    (
-        "isFork",
-        lambda r: r.get("isFork"),
-        "Whether this repository is a fork",
-        False,
-        "boolean",
-    ),
-    (
-        "isArchived",
-        lambda r: r.get("isArchived"),
-        "Whether this repository has been archived on the code host",
-        False,
-        "boolean",
-    ),
-    (
-        "isPrivate",
-        lambda r: r.get("isPrivate"),
-        "Whether this repository is private",
-        False,
-        "boolean",
-    ),
-    (
-        "mirrorInfo.byteSize(MB)",
-        lambda r: get_path_mb(r, "mirrorInfo.byteSize"),
-        "On-disk size of the bare-cloned repository, in megabytes",
-        False,
-        "float",
-    ),
-    (
-        "createdAt",
-        lambda r: r.get("createdAt"),
-        "Timestamp the repo was first cloned to your Sourcegraph instance",
-        False,
-        "timestamp",
-    ),
-    (
-        "mirrorInfo.lastChanged",
-        lambda r: get_path(r, "mirrorInfo.lastChanged"),
-        "Timestamp of the most recent commit in the repo",
-        False,
-        "timestamp",
-    ),
-    (
-        "mirrorInfo.updatedAt",
-        lambda r: get_path(r, "mirrorInfo.updatedAt"),
-        "Timestamp of the most recent successful sync of the repo from the code host",
-        False,
-        "timestamp",
-    ),
-    (
-        "mirrorInfo.secondsSinceUpdatedAt",
-        lambda r: seconds_relative_to_now(
-            get_path(r, "mirrorInfo.updatedAt"),
-            future=False,
-        ),
-        "Integer seconds elapsed between `mirrorInfo.updatedAt` and when the script was run",
-        False,
-        "integer",
-    ),
-    (
-        "mirrorInfo.nextSyncAt",
-        lambda r: get_path(r, "mirrorInfo.nextSyncAt"),
-        "Timestamp the repo is next scheduled to be synced from upstream",
-        False,
-        "timestamp",
-    ),
-    (
-        "mirrorInfo.secondsUntilNextSyncAt",
-        lambda r: seconds_relative_to_now(
-            get_path(r, "mirrorInfo.nextSyncAt"),
-            future=True,
-        ),
-        "Integer seconds remaining until `mirrorInfo.nextSyncAt`",
-        False,
-        "integer",
-    ),
-    (
+# CommitCount and RunSearch requests carry one aliased field group per repo so
+# a batch of repos costs one round trip. The batch size starts at
+# --query-batch-size and shrinks when Sourcegraph reports a field-count
+# violation. Aliases that fail on their own are retried as single-repo queries,
+# so one bad repo never costs the rest of its batch
+
+
+# A repo name, or a repo name plus what to ask about it
+AliasItem = TypeVar("AliasItem")
+
+
+class QueryBatchSize:
+    """Thread-safe alias batch size shared by all workers for one query type"""
+
+    def __init__(self, label: str, size: int) -> None:
+        self.label = label
+        self._size = size
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            return self._size
+
+    def shrink(self, tried: int, violation: GraphQLFieldCountViolation) -> int:
+        """Lower the batch size after `tried` aliases broke the field limit"""
+        next_size = retry_page_size_after_field_count_violation(tried, violation)
+        with self._lock:
+            if next_size < self._size:
+                logger.warning(
+                    "Sourcegraph rejected %s batch of %d: GraphQL field count "
+                    "%d exceeds limit %d; retrying with batch size %d",
+                    self.label,
+                    tried,
+                    violation.actual,
+                    violation.limit,
+                    next_size,
+                )
+                self._size = next_size
+            return self._size
+
+
+def failed_aliases(data: dict[str, Any], errors: list[Any]) -> set[str]:
+    """Return aliases that carry a GraphQL error or came back without data"""
+    failed = {alias for alias, value in data.items() if value is None}
+    for graphql_error in errors:
+        path = graphql_error.get("path") if isinstance(graphql_error, dict) else None
+        if isinstance(path, list) and path and isinstance(path[0], str):
+            failed.add(path[0])
+    return failed
+
+
+def send_alias_batch(
+    endpoint: str,
+    token: str,
+    batch_size: QueryBatchSize,
+    items: list[AliasItem],
+    build_request: Callable[[list[AliasItem]], tuple[str, dict[str, Any]]],
+    *,
+    timeout: int,
+    max_retries: int,
+) -> Iterator[tuple[list[AliasItem], dict[str, Any] | None, set[str], float]]:
+    """Yield (items, data, failed aliases, elapsed) for each aliased sub-batch
+
+    graphql_request retries a sub-batch that failed as a whole with a
+    retryable error before it comes back here. A sub-batch whose whole
+    request still failed yields None for its data, so the caller falls back
+    to single-repo queries for every item in it
+    """
+    remaining = list(items)
+    while remaining:
+        chunk = remaining[: batch_size.size]
+        query, variables = build_request(chunk)
+        errors: list[Any] = []
+        data: dict[str, Any] | None
+        start = time.monotonic()
+        try:
+            data = graphql_request(
+                endpoint,
+                token,
+                query,
+                variables,
+                timeout=timeout,
+                max_retries=max_retries,
+                request_description=f"{batch_size.label} batch of {len(chunk)}",
+                partial_errors=errors,
+            )
+        except HTTPRequestError as error:
+            violation = parse_field_count_violation(error)
+            if violation is not None and len(chunk) > 1:
+                batch_size.shrink(len(chunk), violation)
+                continue
+            logger.warning(
+                "%s batch of %d failed; retrying repos one by one: %s",
+                batch_size.label,
+                len(chunk),
+                error,
+            )
+            data = None
+        except (GraphQLError, OSError) as error:
+            logger.warning(
+                "%s batch of %d failed; retrying repos one by one: %s",
+                batch_size.label,
+                len(chunk),
+                error,
+            )
+            data = None
+        elapsed = time.monotonic() - start
+        failed = failed_aliases(data, errors) if data is not None else set()
+        yield chunk, data, failed, elapsed
+        remaining = remaining[len(chunk) :]
+
+
+def fetch_commit_counts(
+    endpoint: str,
+    token: str,
+    repo_names: list[str],
+    rev: str,
+    batch_size: QueryBatchSize,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+) -> dict[str, tuple[int | None, int | None, float | None, list[Any]]]:
+    """Return fetch_commit_count results for many repos via aliased batches
+
+    Repos the commit-count cache has seen are first resolved to the rev's
+    OID; only those whose OID it does not hold get the ancestor walk
+    """
+    results: dict[str, tuple[int | None, int | None, float | None, list[Any]]] = {}
+    cache = _commit_count_cache
+    if cache is not None:
+        results = fetch_cached_commit_counts(
+            endpoint,
+            token,
+            cache,
+            cache.known_repos(repo_names),
+            rev,
+            batch_size,
+            max_retries=max_retries,
+        )
+        repo_names = [name for name in repo_names if name not in results]
+    if len(repo_names) == 1 or batch_size.size == 1:
+        for name in repo_names:
+            results[name] = fetch_commit_count(
+                endpoint,
+                token,
+                name,
+                rev,
+                max_retries=max_retries,
+            )
+        return results
+
+    def build_request(chunk: list[str]) -> tuple[str, dict[str, Any]]:
+        variables: dict[str, Any] = {"rev": rev}
+        for i, name in enumerate(chunk):
+            variables[f"name{i}"] = name
+            variables[f"allRefsSearch{i}"] = build_all_refs_search(name)
+        return build_commit_count_batch_query(len(chunk)), variables
+
+    for chunk, data, failed, elapsed in send_alias_batch(
+        endpoint,
+        token,
+        batch_size,
+        repo_names,
+        build_request,
+        timeout=REQUEST_TIMEOUT_SECONDS_WITH_COMMIT_COUNT,
+        max_retries=max_retries,
+    ):
+        for i, name in enumerate(chunk):
+            if data is None or {f"repo{i}", f"allRefs{i}"} & failed:
+                results[name] = fetch_commit_count(
+                    endpoint,
+                    token,
+                    name,
+                    rev,
+                    max_retries=max_retries,
+                )
+                continue
+            remember_commit_count(name, data.get(f"repo{i}"))
+            results[name] = parse_commit_count(
+                data.get(f"repo{i}"),
+                data.get(f"allRefs{i}"),
+                elapsed,
+            )
+    return results
+
+
+def fetch_cached_commit_counts(
+    endpoint: str,
+    token: str,
+    cache: CommitCountCache,
+    repo_names: list[str],
+    rev: str,
+    batch_size: QueryBatchSize,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+) -> dict[str, tuple[int | None, int | None, float | None, list[Any]]]:
+    """Return fetch_commit_count results for repos whose rev OID is cached
+
+    CommitOid batches still fetch the all-refs count and cleanup metadata,
+    which move with other branches and with maintenance. Cached counts have
+    no query time. Repos whose OID is not cached, or whose request failed,
+    are left out for CommitCount
+    """
+
+    def build_request(chunk: list[str]) -> tuple[str, dict[str, Any]]:
+        variables: dict[str, Any] = {"rev": rev}
+        for i, name in enumerate(chunk):
+            variables[f"name{i}"] = name
+            variables[f"allRefsSearch{i}"] = build_all_refs_search(name)
+        return build_commit_count_batch_query(len(chunk), oid_only=True), variables
+
+    results: dict[str, tuple[int | None, int | None, float | None, list[Any]]] = {}
+    for chunk, data, failed, elapsed in send_alias_batch(
+        endpoint,
+        token,
+        batch_size,
+        repo_names,
+        build_request,
+        timeout=REQUEST_TIMEOUT_SECONDS_WITH_COMMIT_COUNT,
+        max_retries=max_retries,
+    ):
+        if data is None:
+            continue
+        oids = {
+            name: oid
+            for i, name in enumerate(chunk)
+            if not {f"repo{i}", f"allRefs{i}"} & failed
+            and isinstance(
+                oid := get_path(data.get(f"repo{i}") or {}, "commit.oid"), str
+            )
+        }
+        counts = cache.lookup(oids)
+        for i, name in enumerate(chunk):
+            if name not in counts:
+                continue
+            _, all_refs_count, _, optimization_values = parse_commit_count(
+                data.get(f"repo{i}"),
+                data.get(f"allRefs{i}"),
+                elapsed,
+            )
+            # The CommitOid round trip is not what counting would cost
+            results[name] = (counts[name], all_refs_count, None, optimization_values)
+    return results
+
+
+def fetch_run_searches(
+    endpoint: str,
+    token: str,
+    repo_searches: list[tuple[str, list[RunSearchPattern]]],
+    batch_size: QueryBatchSize,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+) -> dict[tuple[str, str], tuple[int | None, float, bool, str | None]]:
+    """Return fetch_run_search results, keyed by (repo, pattern name)
+
+    Every pattern a repo needs goes into the same aliased request, so the
+    batch size counts repos while each request carries repos x patterns
+    search<i> aliases
+    """
+    results: dict[tuple[str, str], tuple[int | None, float, bool, str | None]] = {}
+    repo_searches = [item for item in repo_searches if item[1]]
+    one_pattern_each = all(len(patterns) == 1 for _, patterns in repo_searches)
+    # Search streams cannot be aliased together, so --search-api stream always
+    # sends one search per repo and pattern
+    if _search_api == "stream" or (
+        one_pattern_each and (len(repo_searches) <= 1 or batch_size.size == 1)
+    ):
+        for name, patterns in repo_searches:
+            for pattern in patterns:
+                results[name, pattern.name] = fetch_run_search(
+                    endpoint,
+                    token,
+                    name,
+                    pattern.pattern,
+                    max_retries=max_retries,
+                )
+        return results
+
+    def build_request(
+        chunk: list[tuple[str, list[RunSearchPattern]]],
+    ) -> tuple[str, dict[str, Any]]:
+        variables = {
+            f"query{i}": build_run_search_query(name, pattern.pattern)
+            for i, (name, pattern) in enumerate(
+                (name, pattern) for name, patterns in chunk for pattern in patterns
+            )
+        }
+        return build_run_search_batch_query(len(variables)), variables
+
+    for chunk, data, failed, elapsed in send_alias_batch(
+        endpoint,
+        token,
+        batch_size,
+        repo_searches,
+        build_request,
+        timeout=REQUEST_TIMEOUT_SECONDS,
+        max_retries=max_retries,
+    ):
+        searches = ((name, pattern) for name, patterns in chunk for pattern in patterns)
+        for i, (name, pattern) in enumerate(searches):
+            if data is None or f"search{i}" in failed:
+                results[name, pattern.name] = fetch_run_search(
+                    endpoint,
+                    token,
+                    name,
+                    pattern.pattern,
+                    max_retries=max_retries,
+                )
+                continue
+            results[name, pattern.name] = parse_run_search(
+                data.get(f"search{i}"),
+                elapsed,
+            )
+    return results
+
+
+# --- Instance-wide search (--run-search-mode global) ---------------------------
+
+# Rather than one anchored search per repo, each chunk of listed repos gets a
+# single select:repo search per pattern. Only repos that search returns are
+# then searched one by one for exact columns; every other repo has no matches.
+# Unlike the exact r:^repo$ filter, an alternation falls back to Sourcegraph's
+# defaults, which skip forks and archived repos, so opt back into both
+
+RUN_SEARCH_GLOBAL_QUERY_TEMPLATE = (
+    "r:^(?:{repos})$ {pattern} fork:yes archived:yes select:repo count:all timeout:120s"
+)
+
+# Columns for a repo the chunk search ruled out; no per-repo query was sent,
+# so queryTimeSeconds stays blank
+RUN_SEARCH_NO_MATCH: tuple[int | None, float | None, bool, str | None] = (
+    0,
+    None,
+    False,
+    None,
+)
+
+_SELECT_FILTER_RE = re.compile(r"(?:^|\s)select:", re.IGNORECASE)
+
+
+def build_run_search_repos_query(size: int) -> str:
+    """Build a RunSearchRepos query with one search<i> alias per pattern"""
+    variables = ", ".join(f"$query{i}: String!" for i in range(size))
+    fields = "".join(
+        f"""
+  search{i}: search(query: $query{i}, version: V3) {{
+    results {{
+      limitHit
+      alert {{
+        title
+      }}
+      results {{
+        ... on Repository {{
+          name
+        }}
+      }}
+    }}
+  }}"""
+        for i in range(size)
+    )
+    return f"\nquery RunSearchRepos({variables}) {{{fields}\n}}\n"
+
+
+def fetch_run_search_candidates(
+    endpoint: str,
+    token: str,
+    repo_names: list[str],
+    patterns: list[RunSearchPattern],
+    max_retries: int = DEFAULT_MAX_RETRIES,
+) -> dict[str, set[str]]:
+    """Return, per pattern name, the repos in `repo_names` that may match it
+
+    A chunk whose search hit a limit is split in half and searched again. A
+    chunk that failed or raised an alert is returned whole, so its repos get
+    the usual per-repo search and its alert lands in their alertTitle
+    """
+    candidates: dict[str, set[str]] = {pattern.name: set() for pattern in patterns}
+    pending = [(repo_names, patterns)]
+    while pending:
+        names, chunk_patterns = pending.pop()
+        if not names or not chunk_patterns:
+            continue
+        repos = "|".join(re.escape(name) for name in names)
+        variables = {
+            f"query{i}": RUN_SEARCH_GLOBAL_QUERY_TEMPLATE.format(
+                repos=repos,
+                pattern=pattern.pattern,
+            )
+            for i, pattern in enumerate(chunk_patterns)
+        }
+        errors: list[Any] = []
+        try:
+            data = graphql_request(
+                endpoint,
+                token,
+                build_run_search_repos_query(len(chunk_patterns)),
+                variables,
+                timeout=REQUEST_TIMEOUT_SECONDS,
+                max_retries=max_retries,
+                request_description=f"RunSearchRepos over {len(names)} repos",
+                partial_errors=errors,
+            )
+        except (GraphQLError, HTTPRequestError, OSError) as error:
+            logger.warning(
+                "Instance-wide search over %d repos failed; searching them "
+                "one by one: %s",
+                len(names),
+                error,
+            )
+            for pattern in chunk_patterns:
+                candidates[pattern.name].update(names)
+            continue
+        failed = failed_aliases(data, errors)
+        chunk = set(names)
+        limited: list[RunSearchPattern] = []
+        for i, pattern in enumerate(chunk_patterns):
+            search_block = data.get(f"search{i}") or {}
+            results: dict[str, Any] = search_block.get("results") or {}
+            if f"search{i}" in failed or results.get("alert"):
+                candidates[pattern.name].update(names)
+            elif results.get("limitHit"):
+                limited.append(pattern)
+            else:
+                candidates[pattern.name].update(
+                    node["name"]
+                    for node in results.get("results") or []
+                    if isinstance(node, dict) and node.get("name") in chunk
+                )
+        if limited and len(names) == 1:
+            for pattern in limited:
+                candidates[pattern.name].update(names)
+        elif limited:
+            middle = len(names) // 2
+            logger.info(
+                "Instance-wide search over %d repos hit a limit; splitting it",
+                len(names),
+            )
+            pending += [(names[:middle], limited), (names[middle:], limited)]
+    return candidates
+
+
+# --- CSV format -----------------------------------------------------------
+
+# Each entry is (csv_column_name, extractor_function). Keeping the column name
+# next to the function that produces its value eliminates the risk of the
+# header drifting out of sync with the row data
+COLUMNS: list[
+    tuple[str, FieldPath | Callable[[dict[str, Any]], Any], str, bool, str]
+] = [
+    (
+        "id",
+        FieldPath("id", decode_repo_id),
+        "Numeric Sourcegraph database ID for the repository, decoded "
+        "locally from the base64 GraphQL global ID; useful when correlating "
+        "with the `repo` table or admin URLs",
+        False,
+        "integer",
+    ),
+    (
+        "url",
+        FieldPath("url"),
+        "URL to the repository on this Sourcegraph instance",
+        False,
+        "string",
+    ),
+    (
+        "mirrorInfo.remoteURL",
+        FieldPath("mirrorInfo.remoteURL", redact_remote_url),
+        "Clone URL of the upstream repository on the code host",
+        True,
+        "string",
+    ),
+    (
+        "externalServices",
+        join_external_services,
+        "Display names of the external service(s) which clone this repository",
+        True,
+        "string (semicolon-joined)",
+    ),
+    (
+        "mirrorInfo.status",
+        derive_mirror_status,
+        "Single-word summary of the repo's mirror state, derived locally "
+        "from `mirrorInfo`",
+        False,
+        "enum (corrupted, errored, cloning, cloned, not_cloned)",
+    ),
+    (
+        "isFork",
+        FieldPath("isFork"),
+        "Whether this repository is a fork",
+        False,
+        "boolean",
+    ),
+    (
+        "isArchived",
+        FieldPath("isArchived"),
+        "Whether this repository has been archived on the code host",
+        False,
+        "boolean",
+    ),
+    (
+        "isPrivate",
+        FieldPath("isPrivate"),
+        "Whether this repository is private",
+        False,
+        "boolean",
+    ),
+    (
+        "mirrorInfo.byteSize(MB)",
+        FieldPath("mirrorInfo.byteSize", whole_mb),
+        "On-disk size of the bare-cloned repository, in megabytes",
+        False,
+        "float",
+    ),
+    (
+        "createdAt",
+        FieldPath("createdAt"),
+        "Timestamp the repo was first cloned to your Sourcegraph instance",
+        False,
+        "timestamp",
+    ),
+    (
+        "mirrorInfo.lastChanged",
+        FieldPath("mirrorInfo.lastChanged"),
+        "Timestamp of the most recent commit in the repo",
+        False,
+        "timestamp",
+    ),
+    (
+        "mirrorInfo.updatedAt",
+        FieldPath("mirrorInfo.updatedAt"),
+        "Timestamp of the most recent successful sync of the repo from the code host",
+        False,
+        "timestamp",
+    ),
+    (
+        "mirrorInfo.secondsSinceUpdatedAt",
+        FieldPath(
+            "mirrorInfo.updatedAt", lambda ts: seconds_relative_to_now(ts, future=False)
+        ),
+        "Integer seconds elapsed between `mirrorInfo.updatedAt` and when the script was run",
+        False,
+        "integer",
+    ),
+    (
+        "mirrorInfo.nextSyncAt",
+        FieldPath("mirrorInfo.nextSyncAt"),
+        "Timestamp the repo is next scheduled to be synced from upstream",
+        False,
+        "timestamp",
+    ),
+    (
+        "mirrorInfo.secondsUntilNextSyncAt",
+        FieldPath(
+            "mirrorInfo.nextSyncAt", lambda ts: seconds_relative_to_now(ts, future=True)
+        ),
+        "Integer seconds remaining until `mirrorInfo.nextSyncAt`",
+        False,
+        "integer",
+    ),
+    (
         "mirrorInfo.updateSchedule.intervalSeconds",
-        lambda r: get_path(r, "mirrorInfo.updateSchedule.intervalSeconds"),
+        FieldPath("mirrorInfo.updateSchedule.intervalSeconds"),
         "Interval, in seconds, between scheduled mirror updates. Default max is 28800 seconds (8 hours), but is shortened for busy / popular repos",
         False,
         "integer",
     ),
     (
         "mirrorInfo.shard",
-        lambda r: get_path(r, "mirrorInfo.shard"),
+        FieldPath("mirrorInfo.shard"),
         "Pod name of the gitserver shard which holds this repo's clone",
         True,
         "string",
@@ -819,7 +1788,7 @@ COLUMNS: list[tuple[str, Callable[[dict[str, Any]], Any], str, bool, str]] = [
     ),
     (
         "textSearchIndex.lastIndexStatus",
-        lambda r: get_path(r, "textSearchIndex.lastIndexStatus"),
+        FieldPath("textSearchIndex.lastIndexStatus"),
         "Most recent persisted text search indexing attempt result. "
         "Blank when the Sourcegraph instance does not expose this field "
         "or no attempt was reported",
@@ -828,7 +1797,7 @@ COLUMNS: list[tuple[str, Callable[[dict[str, Any]], Any], str, bool, str]] = [
     ),
     (
         "textSearchIndex.lastIndexFailureMessage",
-        lambda r: get_path(r, "textSearchIndex.lastIndexFailureMessage"),
+        FieldPath("textSearchIndex.lastIndexFailureMessage"),
         "Failure message from the most recent persisted text search indexing "
         "attempt. Blank when the Sourcegraph instance does not expose this "
         "field or no failure was reported",
@@ -837,63 +1806,63 @@ COLUMNS: list[tuple[str, Callable[[dict[str, Any]], Any], str, bool, str]] = [
     ),
     (
         "textSearchIndex.status.updatedAt",
-        lambda r: get_path(r, "textSearchIndex.status.updatedAt"),
+        FieldPath("textSearchIndex.status.updatedAt"),
         "Timestamp the repo was last indexed for fast search. It should be shortly after mirrorInfo.lastChanged, as indexing jobs are scheduled after new commits are fetched",
         False,
         "timestamp",
     ),
     (
         "textSearchIndex.status.contentFilesCount",
-        lambda r: get_path(r, "textSearchIndex.status.contentFilesCount"),
+        FieldPath("textSearchIndex.status.contentFilesCount"),
         "Number of files included in the index. Note that some files are excluded from indexing, ex. binary files",
         False,
         "integer",
     ),
     (
         "textSearchIndex.status.contentByteSize(MB)",
-        lambda r: get_path_mb(r, "textSearchIndex.status.contentByteSize"),
+        FieldPath("textSearchIndex.status.contentByteSize", whole_mb),
         "Size, in megabytes, of the source content that was indexed. Note that some files are excluded from indexing, ex. binary files",
         False,
         "float",
     ),
     (
         "textSearchIndex.status.indexByteSize(MB)",
-        lambda r: get_path_mb(r, "textSearchIndex.status.indexByteSize"),
+        FieldPath("textSearchIndex.status.indexByteSize", whole_mb),
         "Size of the Zoekt search index for this repo, in megabytes",
         False,
         "float",
     ),
     (
         "textSearchIndex.status.indexShardsCount",
-        lambda r: get_path(r, "textSearchIndex.status.indexShardsCount"),
+        FieldPath("textSearchIndex.status.indexShardsCount"),
         "Number of Zoekt shards that make up this repo's index",
         False,
         "integer",
     ),
     (
         "textSearchIndex.status.newLinesCount",
-        lambda r: get_path(r, "textSearchIndex.status.newLinesCount"),
+        FieldPath("textSearchIndex.status.newLinesCount"),
         "Total number of lines across every indexed branch",
         False,
         "integer",
     ),
     (
         "textSearchIndex.status.defaultBranchNewLinesCount",
-        lambda r: get_path(r, "textSearchIndex.status.defaultBranchNewLinesCount"),
+        FieldPath("textSearchIndex.status.defaultBranchNewLinesCount"),
         "Number of lines indexed on the repo's default branch",
         False,
         "integer",
     ),
     (
         "textSearchIndex.status.otherBranchesNewLinesCount",
-        lambda r: get_path(r, "textSearchIndex.status.otherBranchesNewLinesCount"),
+        FieldPath("textSearchIndex.status.otherBranchesNewLinesCount"),
         "Number of lines indexed across non-default branches",
         False,
         "integer",
     ),
     (
         "textSearchIndex.host.name",
-        lambda r: get_path(r, "textSearchIndex.host.name"),
+        FieldPath("textSearchIndex.host.name"),
         "Pod name of the indexserver shard which holds this repo's index",
         False,
         "string",
@@ -906,49 +1875,46 @@ URL_COLUMN_INDEX = CSV_COLUMNS.index("url")
 # Cleanup metadata appended only when --count-commits runs its per-repo query
 # repositoryStatistics may be empty for non-admin tokens or non-cloned repos
 COMMIT_COUNT_OPTIMIZATION_COLUMNS: list[
-    tuple[str, Callable[[dict[str, Any]], Any], str, bool, str]
+    tuple[str, FieldPath | Callable[[dict[str, Any]], Any], str, bool, str]
 ] = [
     (
         "mirrorInfo.lastCleanedAt",
-        lambda r: get_path(r, "mirrorInfo.lastCleanedAt"),
+        FieldPath("mirrorInfo.lastCleanedAt"),
         "Timestamp of the last successful gitserver cleanup ('gc') of this repo",
         False,
         "timestamp",
     ),
     (
         "mirrorInfo.cleanupSchedule.due",
-        lambda r: get_path(r, "mirrorInfo.cleanupSchedule.due"),
+        FieldPath("mirrorInfo.cleanupSchedule.due"),
         "Timestamp the repo is next scheduled to be cleaned up by gitserver",
         False,
         "timestamp",
     ),
     (
         "mirrorInfo.cleanupSchedule.intervalSeconds",
-        lambda r: get_path(r, "mirrorInfo.cleanupSchedule.intervalSeconds"),
+        FieldPath("mirrorInfo.cleanupSchedule.intervalSeconds"),
         "Interval, in seconds, between scheduled cleanup runs",
         False,
         "integer",
     ),
     (
         "mirrorInfo.cleanupQueue.index",
-        lambda r: get_path(r, "mirrorInfo.cleanupQueue.index"),
+        FieldPath("mirrorInfo.cleanupQueue.index"),
         "Position of the repo in the gitserver cleanup queue",
         False,
         "integer",
     ),
     (
         "mirrorInfo.cleanupQueue.optimizing",
-        lambda r: get_path(r, "mirrorInfo.cleanupQueue.optimizing"),
+        FieldPath("mirrorInfo.cleanupQueue.optimizing"),
         "Whether gitserver is currently running optimization on this repo",
         False,
         "boolean",
     ),
     (
         "mirrorInfo.repositoryStatistics.packfiles.lastFullRepack",
-        lambda r: get_path(
-            r,
-            "mirrorInfo.repositoryStatistics.packfiles.lastFullRepack",
-        ),
+        FieldPath("mirrorInfo.repositoryStatistics.packfiles.lastFullRepack"),
         "Timestamp of the most recent full repack of this repo's packfiles",
         True,
         "timestamp",
@@ -973,8 +1939,11 @@ COMMIT_COUNT_COLUMNS: list[tuple[str, str, bool, str]] = [
     ),
     (
         "commitCount.queryTimeSeconds",
-        "Wall-clock seconds the per-repo commit-count GraphQL request "
-        "took. Useful for spotting which repos are expensive to count",
+        "Wall-clock seconds the commit-count GraphQL request took. Useful "
+        "for spotting which repos are expensive to count. With "
+        "`--query-batch-size` above 1 this is the time of the whole aliased "
+        "batch the repo was counted in. Blank for counts reused from "
+        "`--since-snapshot` or from the commit-count cache",
         False,
         "float",
     ),
@@ -995,7 +1964,11 @@ RUN_SEARCH_COLUMNS: list[tuple[str, str, bool, str]] = [
     ),
     (
         "runSearch.queryTimeSeconds",
-        "Wall-clock seconds the per-repo `--run-search` GraphQL request took",
+        "Wall-clock seconds the `--run-search` GraphQL request took. With "
+        "`--query-batch-size` above 1 this is the time of the whole aliased "
+        "batch the repo was searched in. Blank with `--run-search-mode "
+        "global` for repos the instance-wide search found no matches in, and "
+        "for results reused from `--since-snapshot`",
         False,
         "float",
     ),
@@ -1016,18 +1989,18 @@ RUN_SEARCH_COLUMNS: list[tuple[str, str, bool, str]] = [
 
 # Extra columns appended only to the cloning-errors CSV
 CLONING_ERROR_EXTRA_COLUMNS: list[
-    tuple[str, Callable[[dict[str, Any]], Any], str, bool, str]
+    tuple[str, FieldPath | Callable[[dict[str, Any]], Any], str, bool, str]
 ] = [
     (
         "mirrorInfo.isCorrupted",
-        lambda r: get_path(r, "mirrorInfo.isCorrupted"),
+        FieldPath("mirrorInfo.isCorrupted"),
         "Whether Sourcegraph has detected the on-disk clone is corrupted",
         False,
         "boolean",
     ),
     (
         "mirrorInfo.lastError",
-        lambda r: get_path(r, "mirrorInfo.lastError"),
+        FieldPath("mirrorInfo.lastError"),
         "Last error message returned by gitserver while fetching or "
         "cloning this repo, if any",
         False,
@@ -1035,7 +2008,7 @@ CLONING_ERROR_EXTRA_COLUMNS: list[
     ),
     (
         "mirrorInfo.lastSyncOutput",
-        truncate_sync_output,
+        FieldPath("mirrorInfo.lastSyncOutput", truncate_sync_output),
         "Output of the most recent sync attempt, truncated to the first 5 and last 5 lines",
         False,
         "string",
@@ -1059,7 +2032,7 @@ CLONING_ERROR_CSV_COLUMNS = CSV_COLUMNS + [
 # file along with its NOT-INDEXED reason (too-large / binary / too-many-trigrams
 # / too-small / blob-missing)
 SKIPPED_FILES_EXTRA_COLUMNS: list[
-    tuple[str, Callable[[dict[str, Any]], Any], str, bool, str]
+    tuple[str, FieldPath | Callable[[dict[str, Any]], Any], str, bool, str]
 ] = [
     (
         "skippedIndexed.totalCount",
@@ -1089,6 +2062,85 @@ SKIPPED_FILES_CSV_COLUMNS = CSV_COLUMNS + [
     name for name, _, _, _, _ in SKIPPED_FILES_EXTRA_COLUMNS
 ]
 
+# GraphQL field paths read by the callable column extractors, for --columns;
+# a FieldPath column needs only its own path. The groups below are also
+# what the error checks, --statistics, and the other options read
+MIRROR_STATUS_FIELDS = (
+    "mirrorInfo.cloned",
+    "mirrorInfo.cloneInProgress",
+    "mirrorInfo.isCorrupted",
+    "mirrorInfo.lastError",
+)
+# derive_index_status only checks that status is non-null
+INDEX_STATUS_FIELDS = ("textSearchIndex.status.updatedAt",)
+SKIPPED_INDEXED_FIELDS = (
+    "textSearchIndex.refs.ref.displayName",
+    "textSearchIndex.refs.skippedIndexed.count",
+    "textSearchIndex.refs.skippedIndexed.query",
+)
+SIZE_FIELDS = (
+    "mirrorInfo.byteSize",
+    "textSearchIndex.status.contentByteSize",
+    "textSearchIndex.status.indexByteSize",
+)
+# What project_repo reads for ProjectedRepo's mirror status, error flags, and
+# raw sizes, which mutations, --statistics, and --large-repo-mb act on
+PROJECTED_REPO_FIELDS = (
+    *MIRROR_STATUS_FIELDS,
+    *INDEX_STATUS_FIELDS,
+    "textSearchIndex.lastIndexStatus",
+    *SIZE_FIELDS,
+)
+EXTRACTOR_FIELDS: dict[Callable[[dict[str, Any]], Any], tuple[str, ...]] = {
+    derive_mirror_status: MIRROR_STATUS_FIELDS,
+    derive_index_status: INDEX_STATUS_FIELDS,
+    join_external_services: ("externalServices.nodes.displayName",),
+    join_corruption_logs: (
+        "mirrorInfo.corruptionLogs.timestamp",
+        "mirrorInfo.corruptionLogs.reason",
+    ),
+    total_skipped_files: SKIPPED_INDEXED_FIELDS,
+    refs_with_skips: SKIPPED_INDEXED_FIELDS,
+    head_skipped_query: SKIPPED_INDEXED_FIELDS,
+}
+
+
+def repo_node_fields(
+    columns: Iterable[str],
+    required: Iterable[str] = (),
+) -> frozenset[str]:
+    """Return the repo node field paths that `columns` and `required` read"""
+    extractors = {
+        name: extract
+        for name, extract, _, _, _ in (
+            *COLUMNS,
+            *CLONING_ERROR_EXTRA_COLUMNS,
+            *SKIPPED_FILES_EXTRA_COLUMNS,
+        )
+    }
+    # Checkpoints key on id; per-repo queries and log lines use name
+    fields = {"id", "name", *required}
+    for name in columns:
+        extract = extractors[name]
+        if isinstance(extract, FieldPath):
+            fields.add(extract.path)
+        else:
+            fields.update(EXTRACTOR_FIELDS[extract])
+    return frozenset(fields)
+
+
+def columns_page_size(fields: frozenset[str]) -> int:
+    """Scale PAGE_SIZE by how much lighter a pruned repo node is than a full one"""
+    full = repo_node_fields(
+        [name for name, _, _, _, _ in CLONING_ERROR_EXTRA_COLUMNS]
+        + [name for name, _, _, _, _ in SKIPPED_FILES_EXTRA_COLUMNS]
+        + CSV_COLUMNS,
+    )
+    return max(
+        PAGE_SIZE, min(MAX_COLUMNS_PAGE_SIZE, PAGE_SIZE * len(full) // len(fields))
+    )
+
+
 SKIPPED_FILE_REASON_COLUMNS: list[tuple[str, str, bool, str]] = [
     (
         "repository.name",
@@ -1116,7 +2168,10 @@ SKIPPED_FILE_REASON_COLUMNS: list[tuple[str, str, bool, str]] = [
     ),
     (
         "file.byteSize",
-        "Sourcegraph-reported file byte size",
+        (
+            "Sourcegraph-reported file byte size. Blank with `--search-api "
+            "stream`, whose matches do not carry it"
+        ),
         False,
         "integer",
     ),
@@ -1140,6 +2195,113 @@ SKIPPED_FILE_REASON_COLUMNS: list[tuple[str, str, bool, str]] = [
     ),
 ]
 
+# Declared type of every repo listing column, for typed --output-format files
+COLUMN_TYPES: dict[str, str] = {
+    **{
+        name: vtype
+        for name, _, _, _, vtype in (
+            *COLUMNS,
+            *CLONING_ERROR_EXTRA_COLUMNS,
+            *SKIPPED_FILES_EXTRA_COLUMNS,
+        )
+    },
+    **{
+        name: vtype
+        for name, _, _, vtype in (*COMMIT_COUNT_COLUMNS, *RUN_SEARCH_COLUMNS)
+    },
+}
+
+
+def column_type(name: str) -> str:
+    """Return a column's declared type, including runSearch.<name>.* copies"""
+    vtype = COLUMN_TYPES.get(name)
+    if vtype is None and name.startswith("runSearch."):
+        prefix, _, rest = name.partition(".")
+        vtype = COLUMN_TYPES.get(f"{prefix}.{rest.partition('.')[2]}")
+    return vtype or "string"
+
+
+# --- Row projection -----------------------------------------------------------
+
+# Each repo node is walked once, in the worker thread that fetched it, and the
+# decoded cells feed the CSV rows, the error and skip checks, and --statistics
+
+REPO_PROJECTION = RowProjection(
+    COLUMNS,
+    CLONING_ERROR_EXTRA_COLUMNS,
+    SKIPPED_FILES_EXTRA_COLUMNS,
+    paths=SIZE_FIELDS,
+)
+CLONING_ERROR_COLUMN_GROUP = 1
+SKIPPED_FILES_COLUMN_GROUP = 2
+COMMIT_COUNT_OPTIMIZATION_PROJECTION = RowProjection(
+    COMMIT_COUNT_OPTIMIZATION_COLUMNS,
+)
+MIRROR_STATUS_COLUMN_INDEX = CSV_COLUMNS.index("mirrorInfo.status")
+INDEX_STATUS_COLUMN_INDEX = CSV_COLUMNS.index("textSearchIndex.status")
+LAST_INDEX_STATUS_COLUMN_INDEX = CSV_COLUMNS.index("textSearchIndex.lastIndexStatus")
+MIRROR_BYTES_SLOT = REPO_PROJECTION.slot("mirrorInfo.byteSize")
+CONTENT_BYTES_SLOT = REPO_PROJECTION.slot("textSearchIndex.status.contentByteSize")
+INDEX_BYTES_SLOT = REPO_PROJECTION.slot("textSearchIndex.status.indexByteSize")
+
+
+@dataclass(frozen=True)
+class ProjectedRepo:
+    """One repo node decoded for its CSV rows, error checks, and statistics"""
+
+    row: list[Any]
+    # Extra cells for the cloning-errors / skipped-files CSVs; None when the
+    # repo does not belong in that CSV
+    cloning_error_cells: list[Any] | None
+    skipped_files_cells: list[Any] | None
+    has_indexing_error: bool
+    # Raw GraphQL byte counts, unrounded, for --statistics
+    mirror_bytes: object
+    content_bytes: object
+    index_bytes: object
+
+    @property
+    def mirror_status(self) -> str:
+        return self.row[MIRROR_STATUS_COLUMN_INDEX]
+
+    @property
+    def has_cloning_error(self) -> bool:
+        return self.cloning_error_cells is not None
+
+    @property
+    def has_skipped_files(self) -> bool:
+        return self.skipped_files_cells is not None
+
+
+def project_repo(repo: dict[str, Any], endpoint: str) -> ProjectedRepo:
+    """Decode a repo node in one pass and absolutize its URL"""
+    slots = REPO_PROJECTION.walk(repo)
+    row = REPO_PROJECTION.cells(slots)
+    if row[URL_COLUMN_INDEX]:
+        row[URL_COLUMN_INDEX] = endpoint.rstrip("/") + row[URL_COLUMN_INDEX]
+    mirror_status = row[MIRROR_STATUS_COLUMN_INDEX]
+    return ProjectedRepo(
+        row=row,
+        cloning_error_cells=(
+            REPO_PROJECTION.cells(slots, CLONING_ERROR_COLUMN_GROUP)
+            if has_cloning_error(mirror_status)
+            else None
+        ),
+        skipped_files_cells=(
+            REPO_PROJECTION.cells(slots, SKIPPED_FILES_COLUMN_GROUP)
+            if total_skipped_files(repo) > 0
+            else None
+        ),
+        has_indexing_error=has_indexing_error(
+            mirror_status,
+            row[INDEX_STATUS_COLUMN_INDEX],
+            row[LAST_INDEX_STATUS_COLUMN_INDEX],
+        ),
+        mirror_bytes=slots[MIRROR_BYTES_SLOT],
+        content_bytes=slots[CONTENT_BYTES_SLOT],
+        index_bytes=slots[INDEX_BYTES_SLOT],
+    )
+
 
 # --- Statistics ---------------------------------------------------------------
 
@@ -1179,81 +2341,174 @@ PERCENT_BUCKETS: list[tuple[str, float, float | None]] = [
 ]
 
 
-def bucket_label(
-    value: float,
+def bucket_lows(
     buckets: list[tuple[str, float, float | None]] | list[tuple[str, int, int | None]],
-) -> str | None:
-    """Return the label of the first bucket that contains `value`, or None"""
-    for label, lo, hi in buckets:
-        if value >= lo and (hi is None or value < hi):
-            return label
-    return None
+) -> list[float]:
+    """Return the inclusive lower bounds of contiguous, ascending buckets"""
+    return [lo for _label, lo, _hi in buckets]
+
+
+def nearest_rank(count: int, percent: int) -> int:
+    """Return the 1-based nearest-rank position of a percentile in `count` values"""
+    return max(1, -(-count * percent // 100))
+
+
+class ExactSample:
+    """Every value of one --statistics dimension, packed into an array('d')"""
+
+    def __init__(self, lows: list[float]) -> None:
+        self.lows = lows
+        self.total = 0.0
+        self._values = array.array("d")
+        self._sorted: list[float] | None = None
+
+    @property
+    def count(self) -> int:
+        return len(self._values)
+
+    def add(self, value: float) -> None:
+        self._values.append(value)
+        self.total += value
+        self._sorted = None
+
+    def sorted_values(self) -> list[float]:
+        """Sort once and reuse the result until the next add"""
+        if self._sorted is None:
+            self._sorted = sorted(self._values)
+        return self._sorted
+
+    def bucket_counts(self) -> list[int]:
+        """Bin every value at once by bisecting the sorted sample at each bound"""
+        values = self.sorted_values()
+        edges = [bisect.bisect_left(values, lo) for lo in self.lows]
+        edges.append(len(values))
+        return [hi - lo for lo, hi in itertools.pairwise(edges)]
+
+    def percentile(self, percent: int) -> float | None:
+        values = self.sorted_values()
+        if not values:
+            return None
+        return values[nearest_rank(len(values), percent) - 1]
 
 
-class StatsCollector:
-    """Accumulate per-repo size and ratio counts for --statistics"""
+class LogHistogramSketch:
+    """Fixed-memory stand-in for ExactSample with bounded relative error
 
-    def __init__(self) -> None:
-        self.mirror_buckets: collections.Counter[str] = collections.Counter()
-        self.content_buckets: collections.Counter[str] = collections.Counter()
-        self.index_buckets: collections.Counter[str] = collections.Counter()
-        self.content_vs_mirror_buckets: collections.Counter[str] = collections.Counter()
-        self.index_vs_content_buckets: collections.Counter[str] = collections.Counter()
-        self.cloned_count = 0
-        self.cloned_total_mb = 0
-        self.content_count = 0
-        self.content_total_mb = 0
-        self.indexed_count = 0
-        self.indexed_total_mb = 0
-
-    def add(self, repo: dict[str, Any]) -> None:
-        """Update every counter from a single repo's size fields"""
-        mirror_mb = get_path_mb(repo, "mirrorInfo.byteSize")
-        content_mb = get_path_mb(repo, "textSearchIndex.status.contentByteSize")
-        index_mb = get_path_mb(repo, "textSearchIndex.status.indexByteSize")
+    Values land in logarithmic buckets whose bounds grow by a constant factor,
+    so memory depends on the range of values rather than their number, and a
+    percentile is off by at most STATS_SKETCH_RELATIVE_ACCURACY of its true
+    value. The fixed --statistics buckets are still counted exactly
+    """
+
+    def __init__(self, lows: list[float]) -> None:
+        self.lows = lows
+        self.count = 0
+        self.total = 0.0
+        self._counts = [0] * len(lows)
+        self._gamma = (1 + STATS_SKETCH_RELATIVE_ACCURACY) / (
+            1 - STATS_SKETCH_RELATIVE_ACCURACY
+        )
+        self._log_gamma = math.log(self._gamma)
+        self._zero_count = 0
+        self._log_buckets: collections.Counter[int] = collections.Counter()
+        self._min = math.inf
+        self._max = -math.inf
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self._min = min(self._min, value)
+        self._max = max(self._max, value)
+        index = bisect.bisect_right(self.lows, value) - 1
+        if index >= 0:
+            self._counts[index] += 1
+        if value <= 0:
+            self._zero_count += 1
+        else:
+            self._log_buckets[math.ceil(math.log(value) / self._log_gamma)] += 1
+
+    def bucket_counts(self) -> list[int]:
+        return list(self._counts)
+
+    def percentile(self, percent: int) -> float | None:
+        if not self.count:
+            return None
+        rank = nearest_rank(self.count, percent)
+        seen = self._zero_count
+        if rank <= seen:
+            return max(self._min, 0.0)
+        for key in sorted(self._log_buckets):
+            seen += self._log_buckets[key]
+            if rank <= seen:
+                # Midpoint of (gamma^(key-1), gamma^key] in relative terms
+                estimate = 2 * self._gamma**key / (self._gamma + 1)
+                return min(max(estimate, self._min), self._max)
+        return self._max
+
+
+class StatsCollector:
+    """Accumulate per-repo sizes and size ratios for --statistics
+
+    Each dimension keeps every value (ExactSample) by default, or a
+    LogHistogramSketch when `sketch` is set, so bucket counts and percentiles
+    are computed once at write time instead of per repo
+    """
+
+    def __init__(self, *, sketch: bool = False) -> None:
+        sample = LogHistogramSketch if sketch else ExactSample
+        self.mirror_mb = sample(bucket_lows(SIZE_BUCKETS_MB))
+        self.content_mb = sample(bucket_lows(SIZE_BUCKETS_MB))
+        self.index_mb = sample(bucket_lows(INDEX_SIZE_BUCKETS_MB))
+        self.content_vs_mirror_pct = sample(bucket_lows(PERCENT_BUCKETS))
+        self.index_vs_content_pct = sample(bucket_lows(PERCENT_BUCKETS))
+
+    def add(self, repo: ProjectedRepo) -> None:
+        """Record a single repo's sizes and ratios"""
+        mirror_mb = bytes_to_mb(repo.mirror_bytes)
+        content_mb = bytes_to_mb(repo.content_bytes)
+        index_mb = bytes_to_mb(repo.index_bytes)
 
         # Restrict the mirror size distribution to repos which actually have
         # a clone on disk; reporting `not_cloned` repos under "0-1 MB" would
         # blur "tiny repo" with "missing clone" in the same bucket
-        if mirror_mb is not None and derive_mirror_status(repo) == "cloned":
-            self.cloned_count += 1
-            self.cloned_total_mb += mirror_mb
-            label = bucket_label(mirror_mb, SIZE_BUCKETS_MB)
-            if label is not None:
-                self.mirror_buckets[label] += 1
+        if mirror_mb is not None and repo.mirror_status == "cloned":
+            self.mirror_mb.add(mirror_mb)
 
         # Both content and index sizes only exist on repos that have a search
         # index, so presence of the underlying field is the right gate
         if content_mb is not None:
-            self.content_count += 1
-            self.content_total_mb += content_mb
-            label = bucket_label(content_mb, SIZE_BUCKETS_MB)
-            if label is not None:
-                self.content_buckets[label] += 1
-
+            self.content_mb.add(content_mb)
         if index_mb is not None:
-            self.indexed_count += 1
-            self.indexed_total_mb += index_mb
-            label = bucket_label(index_mb, INDEX_SIZE_BUCKETS_MB)
-            if label is not None:
-                self.index_buckets[label] += 1
-
-        # Skip the ratio buckets when either operand is missing or the
-        # denominator floored to 0 MB (the result would be undefined / inf)
-        if content_mb is not None and mirror_mb is not None and mirror_mb > 0:
-            pct = (content_mb / mirror_mb) * 100
-            label = bucket_label(pct, PERCENT_BUCKETS)
-            if label is not None:
-                self.content_vs_mirror_buckets[label] += 1
-
-        if index_mb is not None and content_mb is not None and content_mb > 0:
-            pct = (index_mb / content_mb) * 100
-            label = bucket_label(pct, PERCENT_BUCKETS)
-            if label is not None:
-                self.index_vs_content_buckets[label] += 1
-
-
-# Per-stat output metadata: suffix, description, buckets, counter, summary rows
+            self.index_mb.add(index_mb)
+
+        # Skip the ratios when either operand is missing or the denominator is
+        # 0 bytes (the result would be undefined / inf)
+        if content_mb is not None and mirror_mb:
+            self.content_vs_mirror_pct.add(content_mb / mirror_mb * 100)
+        if index_mb is not None and content_mb:
+            self.index_vs_content_pct.add(index_mb / content_mb * 100)
+
+
+def bytes_to_mb(value: Any) -> float | None:
+    """Convert a GraphQL byte count (int or BigInt string) to fractional MB"""
+    if isinstance(value, (int, str)):
+        return int(value) / (1024 * 1024)
+    return None
+
+
+def percentile_rows(
+    sample: ExactSample | LogHistogramSketch,
+    unit: str,
+) -> list[tuple[str, Any]]:
+    """Return P50/P90/P99 summary rows, blank when the sample is empty"""
+    rows: list[tuple[str, Any]] = []
+    for percent in STATS_PERCENTILES:
+        value = sample.percentile(percent)
+        rows.append((f"P{percent}_{unit}", "" if value is None else round(value, 2)))
+    return rows
+
+
+# Per-stat output metadata: suffix, description, buckets, sample, summary rows
 STATS_FILES: list[
     tuple[
         str,
@@ -1267,45 +2522,54 @@ STATS_FILES: list[
         "mirror-byte-size",
         "Distribution of cloned repos by `mirrorInfo.byteSize` (MB)",
         SIZE_BUCKETS_MB,
-        "mirror_buckets",
+        "mirror_mb",
         lambda s: [
-            ("TOTAL_CLONED_REPOS", s.cloned_count),
-            ("TOTAL_CLONED_SIZE_MB", s.cloned_total_mb),
+            ("TOTAL_CLONED_REPOS", s.mirror_mb.count),
+            ("TOTAL_CLONED_SIZE_MB", round(s.mirror_mb.total)),
+            *percentile_rows(s.mirror_mb, "MB"),
         ],
     ),
     (
         "content-byte-size",
         "Distribution of indexed repos by `textSearchIndex.status.contentByteSize` (MB)",
         SIZE_BUCKETS_MB,
-        "content_buckets",
+        "content_mb",
         lambda s: [
-            ("TOTAL_INDEXED_REPOS", s.content_count),
-            ("TOTAL_CONTENT_SIZE_MB", s.content_total_mb),
+            ("TOTAL_INDEXED_REPOS", s.content_mb.count),
+            ("TOTAL_CONTENT_SIZE_MB", round(s.content_mb.total)),
+            *percentile_rows(s.content_mb, "MB"),
         ],
     ),
     (
         "index-byte-size",
         "Distribution of indexed repos by `textSearchIndex.status.indexByteSize` (MB)",
         INDEX_SIZE_BUCKETS_MB,
-        "index_buckets",
+        "index_mb",
         lambda s: [
-            ("TOTAL_INDEXED_REPOS", s.indexed_count),
-            ("TOTAL_INDEX_SIZE_MB", s.indexed_total_mb),
+            ("TOTAL_INDEXED_REPOS", s.index_mb.count),
+            ("TOTAL_INDEX_SIZE_MB", round(s.index_mb.total)),
+            *percentile_rows(s.index_mb, "MB"),
         ],
     ),
     (
         "content-vs-mirror-pct",
         "Distribution of `contentByteSize / mirrorInfo.byteSize` (as a percentage)",
         PERCENT_BUCKETS,
-        "content_vs_mirror_buckets",
-        lambda s: [("TOTAL_REPOS", sum(s.content_vs_mirror_buckets.values()))],
+        "content_vs_mirror_pct",
+        lambda s: [
+            ("TOTAL_REPOS", s.content_vs_mirror_pct.count),
+            *percentile_rows(s.content_vs_mirror_pct, "PCT"),
+        ],
     ),
     (
         "index-vs-content-pct",
         "Distribution of `indexByteSize / contentByteSize` (as a percentage)",
         PERCENT_BUCKETS,
-        "index_vs_content_buckets",
-        lambda s: [("TOTAL_REPOS", sum(s.index_vs_content_buckets.values()))],
+        "index_vs_content_pct",
+        lambda s: [
+            ("TOTAL_REPOS", s.index_vs_content_pct.count),
+            *percentile_rows(s.index_vs_content_pct, "PCT"),
+        ],
     ),
 ]
 
@@ -1315,12 +2579,12 @@ def write_stats(prefix: str, stats: StatsCollector) -> list[Path]:
     written: list[Path] = []
     for suffix, _desc, buckets, attr, summary_builder in STATS_FILES:
         path = Path(f"{prefix}-{DEFAULT_STATS_FILE_PREFIX}-{suffix}.csv")
-        counter: collections.Counter[str] = getattr(stats, attr)
+        sample: ExactSample | LogHistogramSketch = getattr(stats, attr)
         with path.open("w", newline="") as out:
             writer = csv.writer(out)
             writer.writerow(["bucket", "count"])
-            for label, _lo, _hi in buckets:
-                writer.writerow([label, counter.get(label, 0)])
+            for (label, _lo, _hi), count in zip(buckets, sample.bucket_counts()):
+                writer.writerow([label, count])
             for metric, value in summary_builder(stats):
                 writer.writerow([metric, value])
         written.append(path)
@@ -1352,7 +2616,9 @@ def table_row(*cells: str) -> str:
 
 
 def name_desc(
-    columns: list[tuple[str, Callable[[dict[str, Any]], Any], str, bool, str]],
+    columns: list[
+        tuple[str, FieldPath | Callable[[dict[str, Any]], Any], str, bool, str]
+    ],
 ) -> list[tuple[str, str, bool, str]]:
     """Drop extractor functions from column metadata"""
     return [
@@ -1458,13 +2724,22 @@ Appended to CSV files when `--run-search PATTERN` is used
 
 {run_search_list}
 
+With `--run-search-file PATH`, each `NAME=PATTERN` line in the file gets
+its own copy of these four columns, named `runSearch.<NAME>.<field>`
+(e.g. `runSearch.todos.matchCount`), in file order
+
 ## `--statistics` files
 
-- Written when `--statistics` is used
+- Written when `--statistics` or `--statistics-sketch` is used
 - One CSV file per dimension
 - Each file has two columns listing every bucket in declaration
-order, followed by per-stat summary rows (totals) appended below the
-bucket rows
+order, followed by per-stat summary rows (totals, then `P50`, `P90`, and
+`P99` nearest-rank percentiles) appended below the bucket rows
+- Sizes are binned and ranked in fractional MB computed from exact byte
+counts; `TOTAL_*_MB` rows are rounded to whole MB
+- Percentiles are exact with `--statistics`. `--statistics-sketch` keeps a
+fixed-size log-bucket histogram per dimension instead of every value, so
+percentiles are within 1% of the exact value; bucket counts stay exact
 - Counts come from the same listing pass that produces the
 main CSV, so enabling `--statistics` adds no extra GraphQL requests
 
@@ -1481,6 +2756,10 @@ class GraphQLError(RuntimeError):
     """Raised when the Sourcegraph GraphQL API returns errors"""
 
 
+class SearchStreamError(GraphQLError):
+    """Raised when /.api/search/stream sends an error event"""
+
+
 class HTTPRequestError(RuntimeError):
     """Raised when the server returns a definitive 4xx/5xx HTTP response"""
 
@@ -1599,45 +2878,932 @@ def open_connection(
     raise ValueError(msg)
 
 
+def request_target(parsed: ParseResult) -> str:
+    """Return the path and query string to put on the HTTP request line"""
+    path = parsed.path or "/"
+    if parsed.query:
+        path = f"{path}?{parsed.query}"
+    return path
+
+
 def send_once(
     url: str,
     body: bytes,
     headers: dict[str, str],
     timeout: int = REQUEST_TIMEOUT_SECONDS,
-) -> dict[str, Any]:
-    """Send one POST. Returns parsed JSON on 2xx, raises HTTPRequestError on 4xx/5xx"""
+) -> IO[bytes]:
+    """Send one POST. Returns the spooled body on 2xx, raises HTTPRequestError on 4xx/5xx"""
     parsed = urlparse(url)
-    path = parsed.path or "/"
-    if parsed.query:
-        path = f"{path}?{parsed.query}"
     conn = open_connection(parsed, timeout=timeout)
     try:
-        conn.request("POST", path, body=body, headers=headers)
+        conn.request("POST", request_target(parsed), body=body, headers=headers)
         resp = conn.getresponse()
-        response_body = resp.read()
         if resp.status >= http.client.BAD_REQUEST:
             raise HTTPRequestError(
                 resp.status,
                 resp.reason,
                 url,
                 resp.getheaders(),
-                response_body,
+                resp.read(),
             )
-        return json.loads(response_body)
+        response_body = response_spool()
+        while chunk := resp.read(RESPONSE_CHUNK_BYTES):
+            response_body.write(chunk)
+        response_body.seek(0)
+        return response_body
     finally:
         conn.close()
 
 
-def retry_delay_seconds(retry_number: int) -> int:
-    """Return exponential retry delay: 1, 2, 4, 8, 16... seconds"""
-    return 2 ** (retry_number - 1)
+def response_spool() -> IO[bytes]:
+    """Return a file for one response body that only stays in memory while small"""
+    return tempfile.SpooledTemporaryFile(max_size=RESPONSE_SPOOL_MEMORY_BYTES)
+
+
+class StaleConnectionError(ConnectionError):
+    """Raised when a reused keep-alive connection closes before responding"""
+
+
+@dataclass
+class PooledConnection:
+    """One open keep-alive connection owned by AsyncConnectionPool"""
+
+    reader: asyncio.StreamReader
+    writer: asyncio.StreamWriter
+    last_used: float
+    requests: int = 0
+
+
+class AsyncConnectionPool:
+    """Per-host HTTP/1.1 keep-alive connection pool driven by an asyncio loop
+
+    The event loop runs on a background thread, so the existing worker threads
+    call send() synchronously, exactly like send_once. Each request borrows an
+    idle connection (or opens a new one, up to max_connections per host) and
+    returns it once the full response body is read. Requests are never
+    pipelined: a connection carries at most one request at a time
+    """
+
+    def __init__(
+        self,
+        max_connections: int,
+        idle_timeout: float = ASYNC_POOL_IDLE_TIMEOUT_SECONDS,
+    ) -> None:
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.opened = 0
+        self.requests = 0
+        self._idle: dict[tuple[str, str, int], list[PooledConnection]] = {}
+        self._slots: dict[tuple[str, str, int], asyncio.Semaphore] = {}
+        self._ssl_context: ssl.SSLContext | None = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever,
+            name="list-repos-async-http",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def send(
+        self,
+        url: str,
+        body: bytes,
+        headers: dict[str, str],
+        timeout: int = REQUEST_TIMEOUT_SECONDS,
+    ) -> IO[bytes]:
+        """Send one POST over a pooled connection; same contract as send_once"""
+        future = asyncio.run_coroutine_threadsafe(
+            self._send(url, body, headers, timeout),
+            self._loop,
+        )
+        return future.result()
+
+    def close(self) -> None:
+        """Close every idle connection and stop the event loop thread"""
+        if self._loop.is_closed():
+            return
+        asyncio.run_coroutine_threadsafe(self._close_idle(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        logger.info(
+            "Async transport: %d request(s) over %d connection(s)",
+            self.requests,
+            self.opened,
+        )
+
+    def __enter__(self) -> AsyncConnectionPool:
+        return self
+
+    def __exit__(self, *_args: object) -> None:
+        self.close()
+
+    async def _send(
+        self,
+        url: str,
+        body: bytes,
+        headers: dict[str, str],
+        timeout: int,
+    ) -> IO[bytes]:
+        parsed = urlparse(url)
+        if not parsed.hostname:
+            msg = f"URL is missing a hostname: {parsed.geturl()!r}"
+            raise ValueError(msg)
+        if parsed.scheme not in ("http", "https"):
+            msg = f"Unsupported URL scheme: {parsed.scheme!r} (expected http or https)"
+            raise ValueError(msg)
+        default_port = 443 if parsed.scheme == "https" else 80
+        key = (parsed.scheme, parsed.hostname, parsed.port or default_port)
+        slots = self._slots.get(key)
+        if slots is None:
+            slots = self._slots[key] = asyncio.Semaphore(self.max_connections)
+        async with slots:
+            self.requests += 1
+            try:
+                connection = self._take_idle(key)
+                if connection is not None:
+                    try:
+                        return await asyncio.wait_for(
+                            self._exchange(key, connection, parsed, url, body, headers),
+                            timeout,
+                        )
+                    except StaleConnectionError:
+                        # The server closed the idle connection between
+                        # requests; nothing was processed, so reconnect once
+                        pass
+                connection = await asyncio.wait_for(self._open(key), timeout)
+                return await asyncio.wait_for(
+                    self._exchange(key, connection, parsed, url, body, headers),
+                    timeout,
+                )
+            except asyncio.TimeoutError:
+                # asyncio.TimeoutError is not an OSError before Python 3.11;
+                # re-raise the builtin so graphql_request retries it as usual
+                msg = f"timed out after {timeout}s"
+                raise TimeoutError(msg) from None
+
+    def _take_idle(self, key: tuple[str, str, int]) -> PooledConnection | None:
+        idle = self._idle.get(key) or []
+        now = self._loop.time()
+        while idle:
+            # Most recently used first; it is the least likely to be stale
+            connection = idle.pop()
+            if (
+                now - connection.last_used < self.idle_timeout
+                and not connection.reader.at_eof()
+            ):
+                return connection
+            connection.writer.close()
+        return None
+
+    async def _open(self, key: tuple[str, str, int]) -> PooledConnection:
+        scheme, host, port = key
+        ssl_context: ssl.SSLContext | None = None
+        if scheme == "https":
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+            ssl_context = self._ssl_context
+        reader, writer = await asyncio.open_connection(
+            host,
+            port,
+            ssl=ssl_context,
+            server_hostname=host if ssl_context is not None else None,
+        )
+        self.opened += 1
+        return PooledConnection(reader, writer, self._loop.time())
+
+    async def _exchange(
+        self,
+        key: tuple[str, str, int],
+        connection: PooledConnection,
+        parsed: ParseResult,
+        url: str,
+        body: bytes,
+        headers: dict[str, str],
+    ) -> IO[bytes]:
+        reused = connection.requests > 0
+        connection.requests += 1
+        reusable = False
+        try:
+            head = [
+                f"POST {request_target(parsed)} HTTP/1.1",
+                f"Host: {parsed.netloc.rpartition('@')[2]}",
+                *(f"{name}: {value}" for name, value in headers.items()),
+                f"Content-Length: {len(body)}",
+                "Connection: keep-alive",
+            ]
+            connection.writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+            connection.writer.write(body)
+            try:
+                await connection.writer.drain()
+                status_line = await connection.reader.readline()
+            except ConnectionError as error:
+                if reused:
+                    raise StaleConnectionError(str(error)) from error
+                raise
+            if not status_line:
+                if reused:
+                    msg = "keep-alive connection closed by server"
+                    raise StaleConnectionError(msg)
+                msg = "connection closed before the HTTP status line"
+                raise ConnectionError(msg)
+            status, reason, response_headers, keep_alive = await read_response_head(
+                connection.reader,
+                status_line,
+            )
+            response_body = response_spool()
+            reusable = await read_response_body(
+                connection.reader,
+                response_headers,
+                response_body,
+                keep_alive=keep_alive,
+            )
+        except asyncio.IncompleteReadError as error:
+            # Raised as EOFError; surface it as a retryable OSError instead
+            msg = "connection closed mid-response"
+            raise ConnectionError(msg) from error
+        finally:
+            # Only a fully read response leaves the connection in a known state
+            if reusable:
+                connection.last_used = self._loop.time()
+                self._idle.setdefault(key, []).append(connection)
+            else:
+                connection.writer.close()
+        response_body.seek(0)
+        if status >= http.client.BAD_REQUEST:
+            raise HTTPRequestError(
+                status,
+                reason,
+                url,
+                response_headers,
+                response_body.read(),
+            )
+        return response_body
+
+    async def _close_idle(self) -> None:
+        for idle in self._idle.values():
+            for connection in idle:
+                connection.writer.close()
+            idle.clear()
+
+
+async def read_response_head(
+    reader: asyncio.StreamReader,
+    status_line: bytes,
+) -> tuple[int, str, list[tuple[str, str]], bool]:
+    """Parse an HTTP/1.x status line and headers; return keep-alive eligibility"""
+    version, _, rest = status_line.decode("latin-1").strip().partition(" ")
+    status_text, _, reason = rest.partition(" ")
+    if not version.startswith("HTTP/1.") or not status_text.isdigit():
+        msg = f"malformed HTTP status line: {status_line[:80]!r}"
+        raise ConnectionError(msg)
+    headers: list[tuple[str, str]] = []
+    while True:
+        line = await reader.readline()
+        if not line:
+            msg = "connection closed inside HTTP response headers"
+            raise ConnectionError(msg)
+        if line in (b"\r\n", b"\n"):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers.append((name.strip(), value.strip()))
+    connection_tokens = {
+        token.strip().lower()
+        for name, value in headers
+        if name.lower() == "connection"
+        for token in value.split(",")
+    }
+    keep_alive = version == "HTTP/1.1" and "close" not in connection_tokens
+    return int(status_text), reason, headers, keep_alive
+
+
+async def read_response_body(
+    reader: asyncio.StreamReader,
+    headers: list[tuple[str, str]],
+    sink: IO[bytes],
+    *,
+    keep_alive: bool,
+) -> bool:
+    """Copy a Content-Length, chunked, or close-delimited HTTP/1.x body to `sink`
+
+    Returns whether the connection can carry another request
+    """
+    header_map = {name.lower(): value for name, value in headers}
+    if "chunked" in header_map.get("transfer-encoding", "").lower():
+        while True:
+            size_line = await reader.readline()
+            size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+            if size == 0:
+                # Skip optional trailer headers up to the terminating blank line
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return keep_alive
+            await copy_exactly(reader, size, sink)
+            await reader.readexactly(2)
+    content_length = header_map.get("content-length")
+    if content_length is not None:
+        await copy_exactly(reader, int(content_length), sink)
+        return keep_alive
+    # No framing: the body runs until the server closes the connection
+    while chunk := await reader.read(RESPONSE_CHUNK_BYTES):
+        sink.write(chunk)
+    return False
+
+
+async def copy_exactly(
+    reader: asyncio.StreamReader, size: int, sink: IO[bytes]
+) -> None:
+    """Copy exactly `size` bytes from `reader` to `sink`, a chunk at a time"""
+    while size > 0:
+        chunk = await reader.readexactly(min(size, RESPONSE_CHUNK_BYTES))
+        sink.write(chunk)
+        size -= len(chunk)
+
+
+# Process-wide transport behind graphql_request; send_once opens one
+# connection per request, --transport async installs AsyncConnectionPool.send
+_transport: Callable[[str, bytes, dict[str, str], int], IO[bytes]] = send_once
+
+
+@contextlib.contextmanager
+def open_transport(name: str, concurrency: int) -> Iterator[None]:
+    """Install the --transport implementation for the duration of a run"""
+    global _transport
+    if name != "async":
+        yield
+        return
+    max_connections = concurrency + ASYNC_POOL_EXTRA_CONNECTIONS
+    logger.info(
+        "Transport: asyncio keep-alive pool (max %d connections per host)",
+        max_connections,
+    )
+    with AsyncConnectionPool(max_connections) as pool:
+        _transport = pool.send
+        try:
+            yield
+        finally:
+            _transport = send_once
+
+
+# --- Adaptive concurrency -----------------------------------------------------
+
+
+def latency_percentile(sorted_latencies: list[float], percent: int) -> float:
+    """Return the nearest-rank percentile of an already sorted sample"""
+    rank = max(1, -(-len(sorted_latencies) * percent // 100))
+    return sorted_latencies[rank - 1]
+
+
+class ConcurrencyLimiter:
+    """AIMD limit on in-flight per-repo work, fed by latency and overload"""
+
+    def __init__(self, initial: int, maximum: int) -> None:
+        self.maximum = maximum
+        self.lowest = initial
+        self.highest = initial
+        self.overload_signals = 0
+        self.completed = 0
+        self._limit = initial
+        self._in_flight = 0
+        self._saturated = False
+        self._latencies: list[float] = []
+        self._baseline: tuple[float, float] | None = None
+        self._cooldown_until = 0.0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        with self._condition:
+            return self._limit
+
+    @contextlib.contextmanager
+    def slot(self) -> Iterator[None]:
+        """Hold one in-flight slot, waiting while the limit is reached"""
+        with self._condition:
+            while self._in_flight >= self._limit:
+                self._saturated = True
+                self._condition.wait()
+            self._in_flight += 1
+            if self._in_flight >= self._limit:
+                self._saturated = True
+        start = time.monotonic()
+        completed = False
+        try:
+            yield
+            completed = True
+        finally:
+            elapsed = time.monotonic() - start
+            with self._condition:
+                self._in_flight -= 1
+                if completed:
+                    self.completed += 1
+                    self._record_latency(elapsed)
+                self._condition.notify_all()
+
+    def overloaded(self, reason: str) -> None:
+        """Multiplicatively lower the limit after a sign of server overload"""
+        with self._condition:
+            self.overload_signals += 1
+            now = time.monotonic()
+            if now < self._cooldown_until:
+                return
+            self._cooldown_until = now + ADAPTIVE_CONCURRENCY_COOLDOWN_SECONDS
+            self._latencies.clear()
+            self._saturated = False
+            next_limit = max(1, int(self._limit * ADAPTIVE_CONCURRENCY_BACKOFF_RATIO))
+            if next_limit == self._limit:
+                return
+            logger.warning(
+                "Adaptive concurrency: %s; lowering limit %d -> %d",
+                reason,
+                self._limit,
+                next_limit,
+            )
+            self._limit = next_limit
+            self.lowest = min(self.lowest, next_limit)
+
+    def _record_latency(self, elapsed: float) -> None:
+        self._latencies.append(elapsed)
+        if len(self._latencies) < max(ADAPTIVE_CONCURRENCY_WINDOW, self._limit):
+            return
+        window = sorted(self._latencies)
+        self._latencies.clear()
+        p50 = latency_percentile(window, 50)
+        p95 = latency_percentile(window, 95)
+        saturated = self._saturated
+        self._saturated = False
+        if self._baseline is None:
+            self._baseline = (p50, p95)
+            return
+        base_p50, base_p95 = self._baseline
+        self._baseline = (min(base_p50, p50), min(base_p95, p95))
+        flat = (
+            p50 <= base_p50 * ADAPTIVE_CONCURRENCY_LATENCY_TOLERANCE
+            and p95 <= base_p95 * ADAPTIVE_CONCURRENCY_LATENCY_TOLERANCE
+        )
+        # Growing only helps when work was actually waiting for a slot
+        if not (flat and saturated) or self._limit >= self.maximum:
+            return
+        if time.monotonic() < self._cooldown_until:
+            return
+        self._limit += 1
+        self.highest = max(self.highest, self._limit)
+        logger.info(
+            "Adaptive concurrency: latency flat (p50 %.3fs, p95 %.3fs); "
+            "raising limit to %d",
+            p50,
+            p95,
+            self._limit,
+        )
+        self._condition.notify_all()
+
+
+# Installed by use_concurrency_limiter; graphql_request reports overload to it
+_concurrency_limiter: ConcurrencyLimiter | None = None
+
+
+@contextlib.contextmanager
+def use_concurrency_limiter(limiter: ConcurrencyLimiter) -> Iterator[None]:
+    """Route overload signals from every GraphQL request to `limiter`"""
+    global _concurrency_limiter
+    _concurrency_limiter = limiter
+    try:
+        yield
+    finally:
+        _concurrency_limiter = None
+
+
+def report_overload(reason: str) -> None:
+    """Tell the installed concurrency limiter that the server is overloaded"""
+    if _concurrency_limiter is not None:
+        _concurrency_limiter.overloaded(reason)
+
+
+def has_overload_graphql_error(errors: object) -> bool:
+    """Return True when a GraphQL error says a server-side deadline passed"""
+    if not isinstance(errors, list):
+        return False
+    return any(
+        term in graphql_error_message(graphql_error).lower()
+        for graphql_error in errors
+        for term in OVERLOAD_GRAPHQL_ERROR_TERMS
+    )
+
+
+# --- Run profile (--profile) --------------------------------------------------
+
+_OPERATION_NAME_RE = re.compile(r"^(?:query|mutation)\s+(\w+)", re.MULTILINE)
+
+
+def graphql_operation_name(query: str) -> str:
+    """Return a query's operation name, e.g. ListRepos, for --profile labels"""
+    match = _OPERATION_NAME_RE.search(query)
+    return match.group(1) if match else "anonymous"
+
+
+class RunProfile:
+    """Where a run spends its time, written out by --profile when it exits
+
+    Phases are wall-clock seconds on the main thread. Request latencies and
+    queue waits come from every thread and land in LogHistogramSketches over
+    PROFILE_LATENCY_BUCKETS_SECONDS, so memory stays fixed however long the
+    run is
+    """
+
+    def __init__(self) -> None:
+        self.started_at = datetime.now(timezone.utc)
+        self.started = time.monotonic()
+        self.repos_written = 0
+        self._phases: dict[str, float] = collections.defaultdict(float)
+        self._latencies: dict[str, LogHistogramSketch] = {}
+        self._decode_seconds: dict[str, float] = collections.defaultdict(float)
+        self._bytes_sent: collections.Counter[str] = collections.Counter()
+        self._bytes_received: collections.Counter[str] = collections.Counter()
+        self._retries: collections.Counter[tuple[str, str, str]] = collections.Counter()
+        self._queue_waits: dict[str, LogHistogramSketch] = {}
+        self._lock = threading.Lock()
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self._phases[name] += seconds
+
+    def add_request(
+        self,
+        operation: str,
+        seconds: float,
+        bytes_sent: int,
+        bytes_received: int,
+    ) -> None:
+        """Record one HTTP attempt, whether or not it succeeded"""
+        with self._lock:
+            latency_sketch(self._latencies, operation).add(seconds)
+            self._bytes_sent[operation] += bytes_sent
+            self._bytes_received[operation] += bytes_received
+
+    def add_decode(self, operation: str, seconds: float) -> None:
+        with self._lock:
+            self._decode_seconds[operation] += seconds
+
+    def add_retry(self, operation: str, reason: str, detail: str) -> None:
+        """Count one retry; `reason` is http, graphql, os_error, or decode"""
+        with self._lock:
+            self._retries[operation, reason, detail] += 1
+
+    def add_queue_wait(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            latency_sketch(self._queue_waits, stage).add(seconds)
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the JSON document --profile writes"""
+        with self._lock:
+            requests: dict[str, Any] = {
+                operation: {
+                    **histogram_summary(sketch),
+                    "decode_seconds": round(self._decode_seconds[operation], 6),
+                    "bytes_sent": self._bytes_sent[operation],
+                    "bytes_received": self._bytes_received[operation],
+                    "retries": {
+                        f"{reason}: {detail}": count
+                        for (op, reason, detail), count in sorted(
+                            self._retries.items(),
+                        )
+                        if op == operation
+                    },
+                }
+                for operation, sketch in sorted(self._latencies.items())
+            }
+            return {
+                "started_at": self.started_at.isoformat(timespec="seconds"),
+                "wall_seconds": round(time.monotonic() - self.started, 6),
+                "repos_written": self.repos_written,
+                "phases": {
+                    name: round(seconds, 6)
+                    for name, seconds in sorted(
+                        self._phases.items(),
+                        key=lambda item: item[1],
+                        reverse=True,
+                    )
+                },
+                "requests": requests,
+                "queue_waits": {
+                    stage: histogram_summary(sketch)
+                    for stage, sketch in sorted(self._queue_waits.items())
+                },
+            }
+
+    def prometheus_text(self) -> str:
+        """Return the profile in the Prometheus text exposition format"""
+        with self._lock:
+            wall_seconds = time.monotonic() - self.started
+            lines = [
+                *prometheus_metric(
+                    "list_repos_run_duration_seconds",
+                    "gauge",
+                    "Wall-clock seconds since the run started",
+                    [({}, wall_seconds)],
+                ),
+                *prometheus_metric(
+                    "list_repos_repos_written",
+                    "gauge",
+                    "Repos written to the main output",
+                    [({}, self.repos_written)],
+                ),
+                *prometheus_metric(
+                    "list_repos_phase_seconds",
+                    "gauge",
+                    "Main-thread wall-clock seconds spent in each phase",
+                    [({"phase": name}, s) for name, s in sorted(self._phases.items())],
+                ),
+                *prometheus_histogram(
+                    "list_repos_graphql_request_duration_seconds",
+                    "GraphQL HTTP attempt latency by operation",
+                    "operation",
+                    self._latencies,
+                ),
+            ]
+            for name, help_text, counter in (
+                (
+                    "list_repos_graphql_decode_seconds_total",
+                    "Seconds spent decoding GraphQL responses by operation",
+                    self._decode_seconds,
+                ),
+                (
+                    "list_repos_graphql_request_bytes_total",
+                    "GraphQL request body bytes sent by operation",
+                    self._bytes_sent,
+                ),
+                (
+                    "list_repos_graphql_response_bytes_total",
+                    "GraphQL response body bytes received by operation",
+                    self._bytes_received,
+                ),
+            ):
+                lines += prometheus_metric(
+                    name,
+                    "counter",
+                    help_text,
+                    [
+                        ({"operation": op}, value)
+                        for op, value in sorted(counter.items())
+                    ],
+                )
+            lines += prometheus_metric(
+                "list_repos_graphql_retries_total",
+                "counter",
+                "GraphQL request retries by operation and reason",
+                [
+                    ({"operation": op, "reason": reason, "detail": detail}, count)
+                    for (op, reason, detail), count in sorted(self._retries.items())
+                ],
+            )
+            lines += prometheus_histogram(
+                "list_repos_queue_wait_seconds",
+                "Seconds work waited before it could run, by pipeline stage",
+                "stage",
+                self._queue_waits,
+            )
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: Path) -> None:
+        """Write JSON, or the Prometheus textfile format for a .prom path"""
+        text = (
+            self.prometheus_text()
+            if path.suffix == PROFILE_PROMETHEUS_SUFFIX
+            else json.dumps(self.as_dict(), indent=2) + "\n"
+        )
+        # Swap the file in whole; the node_exporter textfile collector may
+        # read it at any moment
+        partial = path.with_name(f".{path.name}.tmp")
+        partial.write_text(text, encoding="utf-8")
+        partial.replace(path)
+
+
+def latency_sketch(
+    sketches: dict[str, LogHistogramSketch],
+    key: str,
+) -> LogHistogramSketch:
+    """Return the --profile latency sketch for `key`, creating it on first use"""
+    sketch = sketches.get(key)
+    if sketch is None:
+        sketch = LogHistogramSketch([0.0, *PROFILE_LATENCY_BUCKETS_SECONDS])
+        sketches[key] = sketch
+    return sketch
+
+
+def cumulative_buckets(sketch: LogHistogramSketch) -> list[tuple[str, int]]:
+    """Return Prometheus-style (le, count of values below le) pairs"""
+    counts = itertools.accumulate(sketch.bucket_counts())
+    bounds = [f"{bound:g}" for bound in sketch.lows[1:]]
+    return [*zip(bounds, counts, strict=False), ("+Inf", sketch.count)]
+
+
+def histogram_summary(sketch: LogHistogramSketch) -> dict[str, Any]:
+    """Count, total, percentiles, and cumulative buckets of one sketch"""
+    summary: dict[str, Any] = {
+        "count": sketch.count,
+        "total_seconds": round(sketch.total, 6),
+    }
+    for percent in STATS_PERCENTILES:
+        value = sketch.percentile(percent)
+        summary[f"p{percent}_seconds"] = None if value is None else round(value, 6)
+    summary["buckets"] = dict(cumulative_buckets(sketch))
+    return summary
+
+
+def prometheus_labels(labels: dict[str, str]) -> str:
+    """Render a label set, escaping values as the text format requires"""
+    if not labels:
+        return ""
+    rendered = ",".join(
+        name
+        + '="'
+        + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        + '"'
+        for name, value in labels.items()
+    )
+    return "{" + rendered + "}"
+
+
+def prometheus_metric(
+    name: str,
+    metric_type: str,
+    help_text: str,
+    samples: list[tuple[dict[str, str], float]],
+) -> list[str]:
+    """Return the HELP, TYPE, and sample lines of one metric family"""
+    return [
+        f"# HELP {name} {help_text}",
+        f"# TYPE {name} {metric_type}",
+        *(f"{name}{prometheus_labels(labels)} {value}" for labels, value in samples),
+    ]
+
+
+def prometheus_histogram(
+    name: str,
+    help_text: str,
+    label: str,
+    sketches: dict[str, LogHistogramSketch],
+) -> list[str]:
+    """Return a histogram family with one series per sketch"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for key, sketch in sorted(sketches.items()):
+        lines.extend(
+            f"{name}_bucket{prometheus_labels({label: key, 'le': le})} {count}"
+            for le, count in cumulative_buckets(sketch)
+        )
+        lines.append(f"{name}_sum{prometheus_labels({label: key})} {sketch.total}")
+        lines.append(f"{name}_count{prometheus_labels({label: key})} {sketch.count}")
+    return lines
+
+
+# Installed by use_run_profile; None when --profile is not set
+_run_profile: RunProfile | None = None
+
+
+@contextlib.contextmanager
+def use_run_profile(path: Path | None) -> Iterator[None]:
+    """Profile the run and write the result to `path` when it ends, however it ends"""
+    global _run_profile
+    if path is None:
+        yield
+        return
+    profile = RunProfile()
+    _run_profile = profile
+    try:
+        yield
+    finally:
+        _run_profile = None
+        profile.write(path)
+        logger.info("Wrote run profile to %s", path)
+
+
+def record_phase(name: str, seconds: float) -> None:
+    """Add main-thread seconds to a --profile phase"""
+    if _run_profile is not None:
+        _run_profile.add_phase(name, seconds)
+
+
+def record_queue_wait(stage: str, seconds: float) -> None:
+    """Record how long one unit of work waited at a pipeline stage"""
+    if _run_profile is not None:
+        _run_profile.add_queue_wait(stage, seconds)
+
+
+# --- Request rate limiting ----------------------------------------------------
+
+
+class TokenBucket:
+    """Process-wide request rate limit that can also pause every request"""
+
+    def __init__(self, rate: float | None, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a request may be sent"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._paused_until - now
+                if wait > 0:
+                    # Spread the restart after a pause instead of releasing
+                    # every waiting thread at the same instant
+                    wait *= 1 + random.random() * RETRY_JITTER_RATIO
+                elif self.rate is None:
+                    return
+                else:
+                    elapsed = now - self._updated
+                    self._tokens = min(
+                        self.burst,
+                        self._tokens + elapsed * self.rate,
+                    )
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float, reason: str) -> None:
+        """Hold every request, on every thread, for `seconds`"""
+        with self._lock:
+            until = time.monotonic() + seconds
+            if until <= self._paused_until:
+                return
+            self._paused_until = until
+            # Do not let the bucket refill while requests are held back
+            self._tokens = 0.0
+            self._updated = until
+        logger.warning("%s; pausing all requests for %.1fs", reason, seconds)
+
+
+# Installed by use_rate_limiter; the default never throttles but still honors
+# Retry-After pauses
+_rate_limiter = TokenBucket(None, DEFAULT_RATE_LIMIT_BURST)
+
+
+@contextlib.contextmanager
+def use_rate_limiter(limiter: TokenBucket) -> Iterator[None]:
+    """Send every GraphQL request through `limiter` for the duration of a run"""
+    global _rate_limiter
+    previous = _rate_limiter
+    _rate_limiter = limiter
+    if limiter.rate is not None:
+        logger.info(
+            "Rate limit: %g requests/s (burst %d)",
+            limiter.rate,
+            limiter.burst,
+        )
+    try:
+        yield
+    finally:
+        _rate_limiter = previous
+
+
+def retry_after_seconds(error: HTTPRequestError) -> float | None:
+    """Return the Retry-After delay from a response, in seconds, if present"""
+    for name, value in error.headers:
+        if name.lower() != "retry-after":
+            continue
+        value = value.strip()
+        if value.isdigit():
+            return min(float(value), MAX_RETRY_AFTER_SECONDS)
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        delay = (retry_at - datetime.now(timezone.utc)).total_seconds()
+        return min(max(delay, 0.0), MAX_RETRY_AFTER_SECONDS)
+    return None
 
 
-def sleep_before_retry(reason: str, retry_number: int, max_retries: int) -> None:
-    """Log and sleep before the next retry attempt for this request"""
+def retry_delay_seconds(retry_number: int) -> float:
+    """Return jittered exponential retry delay: about 1, 2, 4, 8... seconds"""
+    jitter = 1 + random.uniform(-RETRY_JITTER_RATIO, RETRY_JITTER_RATIO)
+    return 2 ** (retry_number - 1) * jitter
+
+
+def sleep_before_retry(
+    reason: str,
+    retry_number: int,
+    max_retries: int,
+    retry_after: float | None = None,
+) -> None:
+    """Log and sleep before the next retry attempt for this request
+
+    A server Retry-After pauses the shared rate limiter, so every thread
+    backs off rather than only the one that got the response
+    """
     delay = retry_delay_seconds(retry_number)
+    if retry_after is not None and retry_after > 0:
+        _rate_limiter.pause(retry_after, f"{reason} with Retry-After")
+        delay = max(delay, retry_after)
     logger.warning(
-        "%s; retrying (%d/%d) in %ds...",
+        "%s; retrying (%d/%d) in %.1fs...",
         reason,
         retry_number,
         max_retries,
@@ -1646,6 +3812,16 @@ def sleep_before_retry(reason: str, retry_number: int, max_retries: int) -> None
     time.sleep(delay)
 
 
+def pause_for_retry_after(error: HTTPRequestError, reason: str) -> None:
+    """Honor a Retry-After on a request that is out of retries
+
+    The request fails anyway, but the other threads still back off
+    """
+    retry_after = retry_after_seconds(error)
+    if retry_after is not None and retry_after > 0:
+        _rate_limiter.pause(retry_after, f"{reason} with Retry-After")
+
+
 def retryable_http_error(error: HTTPRequestError) -> bool:
     """Return True for transient HTTP statuses worth retrying"""
     return error.status in RETRYABLE_HTTP_STATUSES
@@ -1660,15 +3836,21 @@ def graphql_error_message(graphql_error: object) -> str:
     return str(graphql_error)
 
 
-def has_retryable_graphql_error(errors: object) -> bool:
-    """Return True when any GraphQL error looks transient"""
+def retryable_graphql_error_term(errors: object) -> str | None:
+    """Return the first transient-error term any GraphQL error message contains"""
     if not isinstance(errors, list):
-        return False
+        return None
     for graphql_error in errors:
         message = graphql_error_message(graphql_error).lower()
-        if any(term in message for term in RETRYABLE_GRAPHQL_ERROR_TERMS):
-            return True
-    return False
+        for term in RETRYABLE_GRAPHQL_ERROR_TERMS:
+            if term in message:
+                return term
+    return None
+
+
+def has_retryable_graphql_error(errors: object) -> bool:
+    """Return True when any GraphQL error looks transient"""
+    return retryable_graphql_error_term(errors) is not None
 
 
 def summarize_graphql_errors(errors: object) -> str:
@@ -1679,16 +3861,63 @@ def summarize_graphql_errors(errors: object) -> str:
     return "; ".join(messages)
 
 
-def graphql_request(
-    endpoint: str,
-    token: str,
-    query: str,
-    variables: dict[str, Any],
+def profiled_exchange(
+    profile: RunProfile,
+    operation: str,
+    url: str,
+    body: bytes,
+    headers: dict[str, str],
+    timeout: int,
+    decode: Callable[[IO[bytes]], dict[str, Any]],
+) -> dict[str, Any]:
+    """Send and decode one attempt like graphql_request, recording it in `profile`"""
+    start = time.monotonic()
+    _rate_limiter.acquire()
+    sent = time.monotonic()
+    profile.add_queue_wait("rate_limit", sent - start)
+    try:
+        response_body = _transport(url, body, headers, timeout)
+    except HTTPRequestError as error:
+        profile.add_request(
+            operation, time.monotonic() - sent, len(body), len(error.body)
+        )
+        raise
+    except OSError:
+        profile.add_request(operation, time.monotonic() - sent, len(body), 0)
+        raise
+    received = time.monotonic()
+    profile.add_request(
+        operation,
+        received - sent,
+        len(body),
+        response_body.seek(0, os.SEEK_END),
+    )
+    response_body.seek(0)
+    response = decode(response_body)
+    profile.add_decode(operation, time.monotonic() - received)
+    return response
+
+
+def graphql_request(
+    endpoint: str,
+    token: str,
+    query: str,
+    variables: dict[str, Any],
     timeout: int = REQUEST_TIMEOUT_SECONDS,
     max_retries: int = DEFAULT_MAX_RETRIES,
     request_description: str = "GraphQL request",
+    partial_errors: list[Any] | None = None,
+    decode: Callable[[IO[bytes]], dict[str, Any]] = json.load,
 ) -> dict[str, Any]:
-    """Send a GraphQL query to the Sourcegraph API and return the data block"""
+    """Send a GraphQL query to the Sourcegraph API and return the data block
+
+    With `partial_errors`, errors that come back alongside data are appended
+    to that list and returned without a retry, so aliased batches can retry
+    only the aliases that failed. A batch in which every alias came back
+    null failed as a whole, so retryable errors retry the whole request.
+    `decode` turns the response body into the response object;
+    decode_listing_page streams listing nodes instead
+    """
     url = endpoint.rstrip("/") + "/.api/graphql"
     body = json.dumps({"query": query, "variables": variables}).encode()
     headers = {
@@ -1697,34 +3926,99 @@ def graphql_request(
         "User-Agent": "list-repos/0.0.1",
     }
     retry_prefix = f"{request_description}: " if request_description else ""
+    profile = _run_profile
+    operation = graphql_operation_name(query) if profile is not None else ""
+    archive = _response_archive
+    if archive is not None and archive.replaying:
+        # The recording holds the attempt its run acted on; retrying the
+        # same answer would only sleep
+        max_retries = 0
     for retry_count in range(max_retries + 1):
         retry_number = retry_count + 1
         try:
-            response = send_once(url, body, headers, timeout=timeout)
+            if archive is not None and archive.replaying:
+                response = archive.response(query, variables, request_description)
+            elif profile is None:
+                _rate_limiter.acquire()
+                response = decode(_transport(url, body, headers, timeout))
+            else:
+                response = profiled_exchange(
+                    profile,
+                    operation,
+                    url,
+                    body,
+                    headers,
+                    timeout,
+                    decode,
+                )
         except HTTPRequestError as error:
+            if error.status in OVERLOAD_HTTP_STATUSES:
+                report_overload(f"HTTP {error.status} {error.reason}")
             if not retryable_http_error(error) or retry_count >= max_retries:
+                # Field-count rejections shrink pages and batches, so a
+                # replay has to see them too
+                if archive is not None and not archive.replaying:
+                    archive.record_http_error(query, variables, error)
+                if archive is None or not archive.replaying:
+                    pause_for_retry_after(
+                        error,
+                        f"{retry_prefix}HTTP {error.status} {error.reason}",
+                    )
                 raise
+            if profile is not None:
+                profile.add_retry(operation, "http", str(error.status))
             sleep_before_retry(
                 f"{retry_prefix}HTTP {error.status} {error.reason}",
                 retry_number,
                 max_retries,
+                retry_after=retry_after_seconds(error),
             )
             continue
         except OSError as error:
             if retry_count >= max_retries:
                 raise
+            if profile is not None:
+                profile.add_retry(operation, "os_error", type(error).__name__)
             sleep_before_retry(
                 f"{retry_prefix}Request failed: {error}",
                 retry_number,
                 max_retries,
             )
             continue
+        except ValueError as error:
+            # A body cut short or garbled in transit decodes as invalid JSON
+            if retry_count >= max_retries:
+                raise
+            if profile is not None:
+                profile.add_retry(operation, "decode", type(error).__name__)
+            sleep_before_retry(
+                f"{retry_prefix}Malformed response: {error}",
+                retry_number,
+                max_retries,
+            )
+            continue
 
+        if archive is not None and not archive.replaying:
+            archive.record(query, variables, response)
         errors = response.get("errors")
         if not errors:
             return response["data"]
+        if has_overload_graphql_error(errors):
+            report_overload("GraphQL deadline exceeded")
+
+        data = response.get("data")
+        if (
+            partial_errors is not None
+            and isinstance(data, dict)
+            and any(value is not None for value in data.values())
+        ):
+            partial_errors.extend(errors if isinstance(errors, list) else [errors])
+            return data
 
-        if has_retryable_graphql_error(errors) and retry_count < max_retries:
+        retryable_term = retryable_graphql_error_term(errors)
+        if retryable_term is not None and retry_count < max_retries:
+            if profile is not None:
+                profile.add_retry(operation, "graphql", retryable_term)
             sleep_before_retry(
                 f"{retry_prefix}GraphQL returned retryable error(s): "
                 + summarize_graphql_errors(errors),
@@ -1735,25 +4029,897 @@ def graphql_request(
 
         # GraphQL can return both `errors` and partial `data`. If we have data,
         # log the errors and keep going; only abort if no data was returned.
-        if response.get("data"):
+        if data:
+            if partial_errors is not None:
+                # Every alias failed; the caller retries them one by one
+                partial_errors.extend(errors if isinstance(errors, list) else [errors])
+                return data
             logger.warning(
                 "GraphQL returned %d partial error(s): %s",
                 len(errors) if isinstance(errors, list) else 1,
                 json.dumps(errors, indent=2),
             )
-            return response["data"]
+            return data
         msg = f"GraphQL errors: {json.dumps(errors, indent=2)}"
         raise GraphQLError(msg)
     msg = "graphql_request retry loop exhausted unexpectedly"
     raise RuntimeError(msg)
 
 
+# --- Response archive (--record / --replay) -----------------------------------
+
+# --record DIR appends every GraphQL response of a run to DIR/responses.gz,
+# one gzip member per response, and its offset to DIR/index.jsonl under a
+# hash of the query and variables. --replay DIR answers the same requests
+# from there, so CSVs, stats, and derived columns can be rebuilt offline.
+# A crash loses at most the response being written
+
+RESPONSE_ARCHIVE_FILE = "responses.gz"
+RESPONSE_ARCHIVE_INDEX_FILE = "index.jsonl"
+RESPONSE_ARCHIVE_MANIFEST_FILE = "manifest.json"
+
+
+def response_archive_key(query: str, variables: dict[str, Any]) -> str:
+    """Return the archive key of one GraphQL request"""
+    request = json.dumps([query, variables], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(request.encode()).hexdigest()
+
+
+class ResponseArchive:
+    """GraphQL responses of one endpoint, recorded to or replayed from a directory
+
+    Later recordings of the same request replace earlier ones on replay, so
+    several --record runs can share a directory
+    """
+
+    def __init__(self, directory: Path, *, replaying: bool) -> None:
+        self.directory = directory
+        self.replaying = replaying
+        self.endpoint = ""
+        self.recorded = 0
+        self.replayed = 0
+        self.missing = 0
+        self._lock = threading.Lock()
+        self._archive: IO[bytes] | None = None
+        self._index: TextIO | None = None
+        self._offsets: dict[str, tuple[int, int]] = {}
+
+    def _read_manifest(self) -> dict[str, Any] | None:
+        path = self.directory / RESPONSE_ARCHIVE_MANIFEST_FILE
+        try:
+            manifest = json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as error:
+            die(f"Could not read {path}: {error}")
+        if not isinstance(manifest, dict) or not manifest.get("endpoint"):
+            die(f"{path} does not name the endpoint it was recorded from")
+        return manifest
+
+    def open_for_record(self, endpoint: str) -> None:
+        """Start appending this run's responses"""
+        manifest = self._read_manifest()
+        self.endpoint = endpoint.rstrip("/")
+        if manifest is not None and manifest["endpoint"] != self.endpoint:
+            die(
+                f"--record {self.directory} holds responses from "
+                f"{manifest['endpoint']}; record {self.endpoint} elsewhere",
+            )
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            if manifest is None:
+                (self.directory / RESPONSE_ARCHIVE_MANIFEST_FILE).write_text(
+                    json.dumps({"endpoint": self.endpoint}) + "\n",
+                    encoding="utf-8",
+                )
+            self._archive = (self.directory / RESPONSE_ARCHIVE_FILE).open("ab")
+            self._index = (self.directory / RESPONSE_ARCHIVE_INDEX_FILE).open(
+                "a",
+                encoding="utf-8",
+            )
+            # Responses are unredacted; remote URLs can carry credentials
+            for name in (
+                RESPONSE_ARCHIVE_FILE,
+                RESPONSE_ARCHIVE_INDEX_FILE,
+                RESPONSE_ARCHIVE_MANIFEST_FILE,
+            ):
+                (self.directory / name).chmod(0o600)
+        except OSError as error:
+            die(f"Could not open --record {self.directory}: {error}")
+
+    def open_for_replay(self) -> str:
+        """Load the index and return the endpoint the archive was recorded from"""
+        manifest = self._read_manifest()
+        if manifest is None:
+            die(f"--replay {self.directory} has no {RESPONSE_ARCHIVE_MANIFEST_FILE}")
+        self.endpoint = str(manifest["endpoint"])
+        try:
+            self._archive = (self.directory / RESPONSE_ARCHIVE_FILE).open("rb")
+            size = os.fstat(self._archive.fileno()).st_size
+            with (self.directory / RESPONSE_ARCHIVE_INDEX_FILE).open(
+                encoding="utf-8",
+            ) as index:
+                for line in index:
+                    try:
+                        entry = json.loads(line)
+                        offset, length = int(entry["offset"]), int(entry["length"])
+                    except (ValueError, KeyError, TypeError):
+                        continue
+                    # An entry past the end of the archive is from a write
+                    # that never finished
+                    if offset + length <= size:
+                        self._offsets[str(entry["key"])] = (offset, length)
+        except OSError as error:
+            die(f"Could not open --replay {self.directory}: {error}")
+        logger.info(
+            "Replaying %d recorded response(s) from %s (recorded against %s)",
+            len(self._offsets),
+            self.directory,
+            self.endpoint,
+        )
+        return self.endpoint
+
+    def _append(
+        self, query: str, variables: dict[str, Any], entry: dict[str, Any]
+    ) -> None:
+        payload = gzip.compress(
+            json.dumps(entry).encode(),
+            compresslevel=RESPONSE_ARCHIVE_COMPRESSLEVEL,
+        )
+        key = response_archive_key(query, variables)
+        with self._lock:
+            if self._archive is None or self._index is None:
+                return
+            offset = self._archive.seek(0, os.SEEK_END)
+            self._archive.write(payload)
+            self._archive.flush()
+            self._index.write(
+                json.dumps(
+                    {
+                        "key": key,
+                        "operation": graphql_operation_name(query),
+                        "offset": offset,
+                        "length": len(payload),
+                    },
+                )
+                + "\n",
+            )
+            self._index.flush()
+            self.recorded += 1
+
+    def record(
+        self,
+        query: str,
+        variables: dict[str, Any],
+        response: dict[str, Any],
+    ) -> None:
+        """Append a decoded response, materializing streamed listing nodes"""
+        data = response.get("data")
+        connection = data.get("repositories") if isinstance(data, dict) else None
+        if isinstance(connection, dict):
+            nodes = connection.get("nodes")
+            if nodes is not None and not isinstance(nodes, list):
+                connection["nodes"] = list(nodes)
+        self._append(query, variables, {"response": response})
+
+    def record_http_error(
+        self,
+        query: str,
+        variables: dict[str, Any],
+        error: HTTPRequestError,
+    ) -> None:
+        """Append the HTTP error a request finally failed with"""
+        self._append(
+            query,
+            variables,
+            {
+                "httpError": {
+                    "status": error.status,
+                    "reason": error.reason,
+                    "headers": error.headers,
+                    "body": error.body.decode(errors="replace"),
+                },
+            },
+        )
+
+    def response(
+        self,
+        query: str,
+        variables: dict[str, Any],
+        request_description: str,
+    ) -> dict[str, Any]:
+        """Return the recorded response, or raise the recorded HTTP error"""
+        location = self._offsets.get(response_archive_key(query, variables))
+        if location is None or self._archive is None:
+            with self._lock:
+                self.missing += 1
+            msg = (
+                f"{request_description}: not in the --replay archive; replay "
+                "with the query flags of the recorded run"
+            )
+            raise GraphQLError(msg)
+        offset, length = location
+        with self._lock:
+            self._archive.seek(offset)
+            payload = self._archive.read(length)
+            self.replayed += 1
+        entry = json.loads(gzip.decompress(payload))
+        http_error = entry.get("httpError")
+        if http_error is not None:
+            raise HTTPRequestError(
+                int(http_error["status"]),
+                str(http_error["reason"]),
+                self.endpoint + "/.api/graphql",
+                [(str(name), str(value)) for name, value in http_error["headers"]],
+                str(http_error["body"]).encode(),
+            )
+        return entry["response"]
+
+    def close(self) -> None:
+        """Close the archive files"""
+        with self._lock:
+            for file in (self._archive, self._index):
+                if file is not None:
+                    file.close()
+            self._archive = None
+            self._index = None
+
+
+# Process-wide archive behind graphql_request; installed by
+# use_response_archive for the duration of a run
+_response_archive: ResponseArchive | None = None
+
+
+@contextlib.contextmanager
+def use_response_archive(archive: ResponseArchive | None) -> Iterator[None]:
+    """Record GraphQL responses to, or replay them from, `archive`"""
+    global _response_archive
+    if archive is None:
+        yield
+        return
+    _response_archive = archive
+    try:
+        yield
+    finally:
+        _response_archive = None
+        archive.close()
+        if not archive.replaying:
+            logger.info(
+                "Recorded %d GraphQL response(s) to %s",
+                archive.recorded,
+                archive.directory,
+            )
+        elif archive.missing:
+            logger.warning(
+                "%d of %d GraphQL request(s) were not in %s; replay with the "
+                "query flags of the recorded run",
+                archive.missing,
+                archive.missing + archive.replayed,
+                archive.directory,
+            )
+        else:
+            logger.info(
+                "Replayed %d GraphQL response(s) from %s",
+                archive.replayed,
+                archive.directory,
+            )
+
+
+# --- Streaming search (--search-api stream) -----------------------------------
+
+# /.api/search/stream sends matches as server-sent events while the search
+# runs, so callers keep only the fields they need from each match and can hang
+# up once they have seen enough. Closing the connection cancels the search on
+# the server. Streams open their own connection, whatever --transport is
+
+# Progress "skipped" reasons that mean the search stopped short, like limitHit
+SEARCH_STREAM_LIMIT_REASONS = frozenset(
+    {"document-match-limit", "shard-match-limit", "repository-limit", "shard-timedout"},
+)
+
+# Process-wide --search-api, installed by use_search_api
+_search_api = DEFAULT_SEARCH_API
+
+
+@contextlib.contextmanager
+def use_search_api(name: str) -> Iterator[None]:
+    """Install the --search-api choice for the duration of a run"""
+    global _search_api
+    _search_api = name
+    try:
+        yield
+    finally:
+        _search_api = DEFAULT_SEARCH_API
+
+
+@dataclass
+class SearchStreamSummary:
+    """Everything a search stream reported besides its matches"""
+
+    match_count: int | None = None
+    limit_hit: bool = False
+    alert_title: str | None = None
+    alert_description: str | None = None
+    bytes_received: int = 0
+
+
+def iter_sse_events(lines: Iterable[bytes]) -> Iterator[tuple[str, str]]:
+    """Yield (event, data) pairs from server-sent event lines"""
+    event = "message"
+    data: list[str] = []
+    for raw_line in lines:
+        line = raw_line.decode("utf-8").rstrip("\r\n")
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = "message", []
+            continue
+        # Lines starting with ":" are comments (keep-alives); field is ""
+        field, _, value = line.partition(":")
+        if field == "event":
+            event = value.removeprefix(" ")
+        elif field == "data":
+            data.append(value.removeprefix(" "))
+    if data:
+        yield event, "\n".join(data)
+
+
+def read_search_stream(
+    response: http.client.HTTPResponse,
+    summary: SearchStreamSummary,
+    description: str,
+) -> Iterator[dict[str, Any]]:
+    """Yield match objects from a search stream, filling in `summary`"""
+
+    def counted_lines() -> Iterator[bytes]:
+        while line := response.readline():
+            summary.bytes_received += len(line)
+            yield line
+
+    last_progress = time.monotonic()
+    for event, data in iter_sse_events(counted_lines()):
+        try:
+            payload = json.loads(data)
+        except ValueError as error:
+            # Callers treat a garbled event like any other failed search
+            msg = f"{description}: malformed search stream {event!r} event: {error}"
+            raise SearchStreamError(msg) from error
+        if event == "matches":
+            yield from payload
+        elif event == "progress":
+            if isinstance(payload.get("matchCount"), int):
+                summary.match_count = payload["matchCount"]
+            summary.limit_hit = summary.limit_hit or any(
+                skipped.get("reason") in SEARCH_STREAM_LIMIT_REASONS
+                for skipped in payload.get("skipped") or []
+                if isinstance(skipped, dict)
+            )
+            now = time.monotonic()
+            if now - last_progress >= SEARCH_STREAM_PROGRESS_INTERVAL_SECONDS:
+                last_progress = now
+                logger.info(
+                    "%s: %s match(es) so far across %s repo(s)",
+                    description,
+                    summary.match_count,
+                    payload.get("repositoriesCount"),
+                )
+        elif event == "alert":
+            title = payload.get("title")
+            alert_description = payload.get("description")
+            summary.alert_title = title if isinstance(title, str) else None
+            summary.alert_description = (
+                alert_description if isinstance(alert_description, str) else None
+            )
+        elif event == "error":
+            msg = f"{description}: search stream error: {payload.get('message')}"
+            raise SearchStreamError(msg)
+        elif event == "done":
+            return
+
+
+def stream_search(
+    endpoint: str,
+    token: str,
+    query: str,
+    summary: SearchStreamSummary,
+    *,
+    version: str,
+    display: int,
+    timeout: int,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    description: str = "Search stream",
+) -> Generator[dict[str, Any], None, None]:
+    """Yield matches from /.api/search/stream as the server sends them
+
+    `display` caps the matches the server sends (-1 for all, 0 for none, when
+    only the progress match count is wanted). Failures before the stream
+    starts are retried like graphql_request; closing the generator early
+    closes the connection, which cancels the search
+    """
+    parameters = {"q": query, "v": version, "display": str(display), "cm": "t"}
+    url = endpoint.rstrip("/") + "/.api/search/stream?" + urlencode(parameters)
+    parsed = urlparse(url)
+    headers = {
+        "Authorization": f"token {token}",
+        "Accept": "text/event-stream",
+        "User-Agent": "list-repos/0.0.1",
+    }
+    profile = _run_profile
+    for retry_count in range(max_retries + 1):
+        retry_number = retry_count + 1
+        _rate_limiter.acquire()
+        sent = time.monotonic()
+        connection = open_connection(parsed, timeout=timeout)
+        try:
+            try:
+                connection.request("GET", request_target(parsed), headers=headers)
+                response = connection.getresponse()
+            except OSError as error:
+                if retry_count >= max_retries:
+                    raise
+                if profile is not None:
+                    profile.add_retry("SearchStream", "os_error", type(error).__name__)
+                sleep_before_retry(
+                    f"{description}: Request failed: {error}",
+                    retry_number,
+                    max_retries,
+                )
+                continue
+            if response.status >= http.client.BAD_REQUEST:
+                error = HTTPRequestError(
+                    response.status,
+                    response.reason,
+                    url,
+                    response.getheaders(),
+                    response.read(),
+                )
+                if error.status in OVERLOAD_HTTP_STATUSES:
+                    report_overload(f"HTTP {error.status} {error.reason}")
+                if not retryable_http_error(error) or retry_count >= max_retries:
+                    pause_for_retry_after(
+                        error,
+                        f"{description}: HTTP {error.status} {error.reason}",
+                    )
+                    raise error
+                if profile is not None:
+                    profile.add_retry("SearchStream", "http", str(error.status))
+                sleep_before_retry(
+                    f"{description}: HTTP {error.status} {error.reason}",
+                    retry_number,
+                    max_retries,
+                    retry_after=retry_after_seconds(error),
+                )
+                continue
+            yield from read_search_stream(response, summary, description)
+            return
+        finally:
+            connection.close()
+            if profile is not None:
+                profile.add_request(
+                    "SearchStream",
+                    time.monotonic() - sent,
+                    0,
+                    summary.bytes_received,
+                )
+
+
+# --- Instance capabilities ----------------------------------------------------
+
+# Every run starts by asking who the token belongs to and which
+# RepositoryTextSearchIndex fields the schema has. Wrappers that run one
+# scoped list-repos per repo pay for those round trips every time, so the
+# answers are cached on disk for --capability-cache-ttl seconds. A cache hit
+# costs one unauthenticated GET of /__version to confirm the instance was not
+# upgraded since
+
+# GraphQL validation errors for fields, types, or arguments the schema lacks
+_SCHEMA_ERROR_RE = re.compile(r"Cannot query field|Unknown (?:type|argument)")
+
+
+@dataclass
+class InstanceCapabilities:
+    """What the startup probes learned about one instance and token"""
+
+    username: str
+    is_site_admin: bool
+    # None until the schema was inspected; a failed inspection is not cached
+    text_search_index_fields: frozenset[str] | None = None
+    # Smallest listing page size accepted after a field-count rejection
+    max_page_size: int | None = None
+
+
+def default_cache_dir() -> Path:
+    """Return the per-user cache directory, honoring XDG_CACHE_HOME"""
+    base = os.environ.get("XDG_CACHE_HOME") or str(Path.home() / ".cache")
+    return Path(base) / "list-repos"
+
+
+def fetch_instance_version(endpoint: str) -> str | None:
+    """Return the version the instance reports on /__version, or None"""
+    parsed = urlparse(endpoint.rstrip("/") + "/__version")
+    sent = time.monotonic()
+    try:
+        connection = open_connection(parsed, timeout=INSTANCE_VERSION_TIMEOUT_SECONDS)
+        try:
+            connection.request(
+                "GET",
+                request_target(parsed),
+                headers={"User-Agent": "list-repos/0.0.1"},
+            )
+            response = connection.getresponse()
+            body = response.read()
+        finally:
+            connection.close()
+    except (OSError, ValueError) as error:
+        logger.info("Could not read the instance version: %s", error)
+        return None
+    if _run_profile is not None:
+        _run_profile.add_request("Version", time.monotonic() - sent, 0, len(body))
+    version = body.decode(errors="replace").strip()
+    if response.status >= http.client.BAD_REQUEST or not version:
+        logger.info(
+            "Could not read the instance version: HTTP %d from /__version",
+            response.status,
+        )
+        return None
+    return version
+
+
+class CapabilityCache:
+    """Capability probe results per endpoint and token, in one JSON file
+
+    Entries are keyed by endpoint and a SHA-256 of the token. Each records
+    the instance version it was probed on and when; a different version or
+    an entry older than the TTL is a miss
+    """
+
+    def __init__(self, path: Path, ttl_seconds: int, endpoint: str, token: str) -> None:
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.endpoint = endpoint
+        token_hash = hashlib.sha256(token.encode()).hexdigest()
+        self.key = f"{endpoint.rstrip('/')} {token_hash}"
+        self.version: str | None = None
+        self.capabilities: InstanceCapabilities | None = None
+        self._saved: dict[str, Any] | None = None
+
+    def _read_entries(self) -> dict[str, Any]:
+        try:
+            entries = json.loads(self.path.read_text(encoding="utf-8"))["entries"]
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            logger.warning("Ignoring unreadable %s: %s", self.path, error)
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def _write_entries(self, entries: dict[str, Any]) -> None:
+        # Concurrent runs may share the file; replacing it whole means a
+        # reader sees one run's version or another's, never a mix
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}")
+            temp_path.write_text(
+                json.dumps({"entries": entries}, indent=2) + "\n",
+                encoding="utf-8",
+            )
+            temp_path.chmod(0o600)
+            os.replace(temp_path, self.path)
+        except OSError as error:
+            logger.warning("Could not write %s: %s", self.path, error)
+
+    def load(self) -> InstanceCapabilities | None:
+        """Return cached capabilities for this instance version, if fresh"""
+        self.version = fetch_instance_version(self.endpoint)
+        if self.version is None:
+            return None
+        entry = self._read_entries().get(self.key)
+        if not isinstance(entry, dict):
+            return None
+        age = time.time() - float(entry.get("savedAt") or 0)
+        if entry.get("instanceVersion") != self.version or not (
+            0 <= age < self.ttl_seconds
+        ):
+            return None
+        fields = entry.get("textSearchIndexFields")
+        try:
+            self.capabilities = InstanceCapabilities(
+                username=str(entry["username"]),
+                is_site_admin=bool(entry["siteAdmin"]),
+                text_search_index_fields=(
+                    frozenset(fields) if isinstance(fields, list) else None
+                ),
+                max_page_size=entry.get("maxPageSize"),
+            )
+        except KeyError:
+            return None
+        self._saved = entry
+        logger.info(
+            "Using capabilities cached %ds ago for Sourcegraph %s (%s)",
+            age,
+            self.version,
+            self.path,
+        )
+        return self.capabilities
+
+    def save(self) -> None:
+        """Write the current capabilities back if they changed"""
+        if self.version is None or self.capabilities is None:
+            return
+        capabilities = self.capabilities
+        fields = capabilities.text_search_index_fields
+        entry = {
+            "instanceVersion": self.version,
+            "username": capabilities.username,
+            "siteAdmin": capabilities.is_site_admin,
+            "textSearchIndexFields": sorted(fields) if fields is not None else None,
+            "maxPageSize": capabilities.max_page_size,
+        }
+        if self._saved is not None and all(
+            self._saved.get(key) == value for key, value in entry.items()
+        ):
+            return
+        entry["savedAt"] = time.time()
+        now = time.time()
+        entries = {
+            key: value
+            for key, value in self._read_entries().items()
+            if isinstance(value, dict)
+            and now - float(value.get("savedAt") or 0) < self.ttl_seconds
+        }
+        entries[self.key] = entry
+        self._write_entries(entries)
+        self._saved = entry
+
+    def invalidate(self) -> None:
+        """Drop this endpoint and token's entry"""
+        self.capabilities = None
+        entries = self._read_entries()
+        if entries.pop(self.key, None) is not None:
+            self._write_entries(entries)
+
+
+# Process-wide cache behind the startup probes; installed by
+# use_capability_cache for the duration of a run
+_capability_cache: CapabilityCache | None = None
+
+
+@contextlib.contextmanager
+def use_capability_cache(cache: CapabilityCache | None) -> Iterator[None]:
+    """Serve startup probes from `cache`, and save or invalidate it at the end
+
+    A GraphQL schema error means the cached fields no longer match the
+    instance, so the entry is dropped and the next run probes again
+    """
+    global _capability_cache
+    if cache is None:
+        yield
+        return
+    cache.load()
+    _capability_cache = cache
+    try:
+        yield
+    except GraphQLError as error:
+        if _SCHEMA_ERROR_RE.search(str(error)):
+            logger.warning(
+                "GraphQL schema error; dropping cached capabilities for %s",
+                cache.endpoint,
+            )
+            cache.invalidate()
+        raise
+    finally:
+        _capability_cache = None
+        cache.save()
+
+
+# --- Commit-count cache ---------------------------------------------------------
+
+# A commit's ancestor count never changes, so --count-commits keeps exact
+# counts per (repo, OID) in a local SQLite file and, for repos it has seen,
+# first asks only which commit the rev resolves to now
+
+COMMIT_COUNT_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS commit_counts (
+  repo TEXT NOT NULL,
+  oid TEXT NOT NULL,
+  commit_count INTEGER NOT NULL,
+  used_at REAL NOT NULL,
+  PRIMARY KEY (repo, oid)
+);
+CREATE INDEX IF NOT EXISTS commit_counts_used_at ON commit_counts (used_at);
+"""
+
+# SQLite's default limit on bound parameters is 999 in older releases
+COMMIT_COUNT_CACHE_LOOKUP_CHUNK = 500
+
+
+class CommitCountCache:
+    """Exact commit counts keyed by repo name and commit OID, in SQLite
+
+    Worker threads share one connection behind a lock. Any SQLite error
+    turns the cache off for the rest of the run instead of failing it
+    """
+
+    def __init__(self, path: Path, max_entries: int) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.stored = 0
+        self._lock = threading.Lock()
+        self._connection: sqlite3.Connection | None = None
+
+    def _disable(self, error: Exception) -> None:
+        logger.warning("Not using commit-count cache %s: %s", self.path, error)
+        if self._connection is not None:
+            self._connection.close()
+        self._connection = None
+
+    def open(self) -> None:
+        """Open or create the cache file; on failure the cache stays empty"""
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(
+                self.path,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            self.path.chmod(0o600)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(COMMIT_COUNT_CACHE_SCHEMA)
+        except (OSError, sqlite3.Error) as error:
+            self._disable(error)
+            return
+        self._connection = connection
+
+    def known_repos(self, repo_names: list[str]) -> list[str]:
+        """Return the repos with at least one cached count, in input order"""
+        known: set[str] = set()
+        with self._lock:
+            connection = self._connection
+            if connection is None:
+                return []
+            try:
+                for start in range(0, len(repo_names), COMMIT_COUNT_CACHE_LOOKUP_CHUNK):
+                    chunk = repo_names[start : start + COMMIT_COUNT_CACHE_LOOKUP_CHUNK]
+                    known.update(
+                        row[0]
+                        for row in connection.execute(
+                            "SELECT DISTINCT repo FROM commit_counts WHERE repo IN ("
+                            + ", ".join("?" * len(chunk))
+                            + ")",
+                            chunk,
+                        )
+                    )
+            except sqlite3.Error as error:
+                self._disable(error)
+                return []
+        return [name for name in repo_names if name in known]
+
+    def lookup(self, oids: dict[str, str]) -> dict[str, int]:
+        """Return cached counts for the repos' current OIDs, marking them used"""
+        counts: dict[str, int] = {}
+        with self._lock:
+            if self._connection is None:
+                return counts
+            try:
+                for name, oid in oids.items():
+                    row = self._connection.execute(
+                        "SELECT commit_count FROM commit_counts "
+                        "WHERE repo = ? AND oid = ?",
+                        (name, oid),
+                    ).fetchone()
+                    if row is not None:
+                        counts[name] = row[0]
+                now = time.time()
+                self._connection.executemany(
+                    "UPDATE commit_counts SET used_at = ? WHERE repo = ? AND oid = ?",
+                    [(now, name, oids[name]) for name in counts],
+                )
+            except sqlite3.Error as error:
+                self._disable(error)
+                return {}
+            self.hits += len(counts)
+        return counts
+
+    def store(self, repo_name: str, oid: str, count: int) -> None:
+        """Record the ancestor count of a repo's commit"""
+        with self._lock:
+            if self._connection is None:
+                return
+            try:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO commit_counts VALUES (?, ?, ?, ?)",
+                    (repo_name, oid, count, time.time()),
+                )
+            except sqlite3.Error as error:
+                self._disable(error)
+                return
+            self.stored += 1
+
+    def close(self) -> None:
+        """Drop the least recently used rows past max_entries, then close"""
+        with self._lock:
+            connection = self._connection
+            if connection is None:
+                return
+            try:
+                (entries,) = connection.execute(
+                    "SELECT COUNT(*) FROM commit_counts",
+                ).fetchone()
+                excess = entries - self.max_entries
+                if excess > 0:
+                    connection.execute(
+                        "DELETE FROM commit_counts WHERE rowid IN (SELECT rowid "
+                        "FROM commit_counts ORDER BY used_at LIMIT ?)",
+                        (excess,),
+                    )
+                    logger.info(
+                        "Evicted %d least recently used commit count(s) from %s",
+                        excess,
+                        self.path,
+                    )
+            except sqlite3.Error as error:
+                self._disable(error)
+                return
+            connection.close()
+            self._connection = None
+
+
+# Process-wide cache behind fetch_commit_counts; installed by
+# use_commit_count_cache for the duration of a run
+_commit_count_cache: CommitCountCache | None = None
+
+
+@contextlib.contextmanager
+def use_commit_count_cache(cache: CommitCountCache | None) -> Iterator[None]:
+    """Serve --count-commits ancestor counts from `cache` where the OID matches"""
+    global _commit_count_cache
+    if cache is None:
+        yield
+        return
+    cache.open()
+    _commit_count_cache = cache
+    try:
+        yield
+    finally:
+        _commit_count_cache = None
+        cache.close()
+        logger.info(
+            "Commit-count cache: %d hit(s), %d count(s) added (%s)",
+            cache.hits,
+            cache.stored,
+            cache.path,
+        )
+
+
+def note_accepted_page_size(page_size: int) -> None:
+    """Remember a listing page size accepted after a field-count rejection"""
+    cache = _capability_cache
+    if cache is None or cache.capabilities is None:
+        return
+    capabilities = cache.capabilities
+    if capabilities.max_page_size is None or page_size < capabilities.max_page_size:
+        capabilities.max_page_size = page_size
+
+
+def cached_max_page_size() -> int | None:
+    """Return the cached listing page size limit, if any"""
+    cache = _capability_cache
+    if cache is None or cache.capabilities is None:
+        return None
+    return cache.capabilities.max_page_size
+
+
 def fetch_current_user(
     endpoint: str,
     token: str,
     max_retries: int = DEFAULT_MAX_RETRIES,
 ) -> tuple[str, bool]:
     """Return the authenticated username and site-admin flag"""
+    cache = _capability_cache
+    if cache is not None and cache.capabilities is not None:
+        return cache.capabilities.username, cache.capabilities.is_site_admin
     data = graphql_request(
         endpoint,
         token,
@@ -1763,7 +4929,10 @@ def fetch_current_user(
         request_description="Current user query",
     )
     user: dict[str, Any] = data["currentUser"] or {}
-    return str(user["username"]), bool(user.get("siteAdmin"))
+    username, is_site_admin = str(user["username"]), bool(user.get("siteAdmin"))
+    if cache is not None:
+        cache.capabilities = InstanceCapabilities(username, is_site_admin)
+    return username, is_site_admin
 
 
 def fetch_text_search_index_field_names(
@@ -1795,19 +4964,27 @@ def supports_text_search_index_failure_fields(
     max_retries: int = DEFAULT_MAX_RETRIES,
 ) -> bool:
     """Return True when it is safe to query text-search index failure fields"""
-    try:
-        field_names = fetch_text_search_index_field_names(
-            endpoint,
-            token,
-            max_retries=max_retries,
-        )
-    except (GraphQLError, HTTPRequestError, OSError) as error:
-        logger.warning(
-            "Could not inspect Sourcegraph schema for new text-search index "
-            "failure fields (requires v7.5.0); leaving those CSV columns blank: %s",
-            error,
-        )
-        return False
+    cache = _capability_cache
+    capabilities = cache.capabilities if cache is not None else None
+    if capabilities is not None and capabilities.text_search_index_fields is not None:
+        field_names = set(capabilities.text_search_index_fields)
+    else:
+        try:
+            field_names = fetch_text_search_index_field_names(
+                endpoint,
+                token,
+                max_retries=max_retries,
+            )
+        except (GraphQLError, HTTPRequestError, OSError) as error:
+            logger.warning(
+                "Could not inspect Sourcegraph schema for new text-search index "
+                "failure fields (requires v7.5.0); leaving those CSV columns "
+                "blank: %s",
+                error,
+            )
+            return False
+        if capabilities is not None:
+            capabilities.text_search_index_fields = frozenset(field_names)
 
     missing = sorted(TEXT_SEARCH_INDEX_FAILURE_FIELD_NAMES - field_names)
     if missing:
@@ -1946,8 +5123,11 @@ def verify_repo_rev(
     token: str,
     repo_rev: str,
     max_retries: int = DEFAULT_MAX_RETRIES,
-) -> tuple[str, str]:
-    """Require repo/rev to resolve to an index; return output rev and skip query"""
+) -> tuple[str, str, int | None]:
+    """Require repo/rev to resolve to an index
+
+    Returns the output rev, the skippedIndexed query, and its skipped count
+    """
     name = parse_repo_name(repo_rev)
     rev = parse_repo_rev(repo_rev)
     data = graphql_request(
@@ -1973,7 +5153,9 @@ def verify_repo_rev(
     default_branch: dict[str, Any] = repository.get("defaultBranch") or {}
     default_branch_name = str(default_branch.get("displayName") or "")
     selected_skipped_query = ""
+    selected_skipped_count: int | None = None
     fallback_skipped_query = ""
+    fallback_skipped_count: int | None = None
     for ref in refs:
         if not ref.get("indexed"):
             continue
@@ -1993,8 +5175,10 @@ def verify_repo_rev(
             continue
         if not fallback_skipped_query:
             fallback_skipped_query = skipped_query
+            fallback_skipped_count = skipped_count
         if ref_name == rev or (rev == "HEAD" and ref_name == default_branch_name):
             selected_skipped_query = skipped_query
+            selected_skipped_count = skipped_count
     if target_oid not in indexed_oids:
         if indexed_names:
             indexed_summary = "\n".join(f"  - {n}" for n in indexed_names)
@@ -2007,12 +5191,16 @@ def verify_repo_rev(
 
     # When the user didn't specify a rev (or explicitly used "HEAD"), substitute
     # the actual default branch name so filenames and URLs read naturally
+    skipped_files = (
+        selected_skipped_count if selected_skipped_query else fallback_skipped_count
+    )
     if rev == "HEAD":
         return (
             default_branch_name or "HEAD",
             selected_skipped_query or fallback_skipped_query,
+            skipped_files,
         )
-    return rev, selected_skipped_query or fallback_skipped_query
+    return rev, selected_skipped_query or fallback_skipped_query, skipped_files
 
 
 def file_url(endpoint: str, repo_name: str, rev: str, file_path: str) -> str:
@@ -2074,58 +5262,147 @@ def fetch_skipped_file_reason_query(
     rev: str,
     skipped_indexed_query: str,
     max_retries: int = DEFAULT_MAX_RETRIES,
+    skipped_count: int | None = None,
 ) -> SkippedFileReasonQueryResult:
-    """Return NOT-INDEXED matches and search metadata for one indexed repo ref"""
+    """Return NOT-INDEXED matches and search metadata for one indexed repo ref
+
+    With --search-api stream, the search is cancelled as soon as
+    `skipped_count` files (skippedIndexed.count) have arrived
+    """
     start = time.monotonic()
     search_query = skipped_file_reason_search_query(skipped_indexed_query, name, rev)
-    data = graphql_request(
-        endpoint,
-        token,
-        SKIPPED_FILES_REASON_QUERY,
-        {"query": search_query},
-        timeout=REQUEST_TIMEOUT_SECONDS_WITH_COMMIT_COUNT,
-        max_retries=max_retries,
-        request_description=f"Skipped files for {name}@{rev}",
-    )
-    elapsed = time.monotonic() - start
-    results_block: dict[str, Any] = data.get("search", {}).get("results", {})
-    raw_results: list[dict[str, Any] | None] = results_block.get("results") or []
-    # Non-FileMatch results come back as empty objects; drop them
-    matches = [result for result in raw_results if result and result.get("file")]
-    raw_match_count = results_block.get("matchCount")
-    match_count: int | None = (
-        raw_match_count if isinstance(raw_match_count, int) else None
-    )
-    limit_hit = bool(results_block.get("limitHit"))
-    alert: dict[str, Any] = results_block.get("alert") or {}
-    alert_title_raw = alert.get("title")
-    alert_description_raw = alert.get("description")
-    alert_title: str | None = (
-        alert_title_raw if isinstance(alert_title_raw, str) else None
-    )
-    alert_description: str | None = (
-        alert_description_raw if isinstance(alert_description_raw, str) else None
-    )
-    alert_parts = [part for part in (alert_title, alert_description) if part]
+    if _search_api == "stream":
+        result = stream_skipped_file_reason_query(
+            endpoint,
+            token,
+            f"{name}@{rev}",
+            search_query,
+            max_retries,
+            skipped_count,
+        )
+    else:
+        data = graphql_request(
+            endpoint,
+            token,
+            SKIPPED_FILES_REASON_QUERY,
+            {"query": search_query},
+            timeout=REQUEST_TIMEOUT_SECONDS_WITH_COMMIT_COUNT,
+            max_retries=max_retries,
+            request_description=f"Skipped files for {name}@{rev}",
+        )
+        result = parse_skipped_file_reason_results(
+            data.get("search", {}).get("results", {}),
+        )
+    elapsed = time.monotonic() - start
+    alert_parts = [
+        part for part in (result.alert_title, result.alert_description) if part
+    ]
     alert_suffix = f", alert={'; '.join(alert_parts)!r}" if alert_parts else ""
-    match_count_value = "?" if match_count is None else str(match_count)
+    match_count_value = "?" if result.match_count is None else str(result.match_count)
     logger.info(
         "Skipped-file reason search for %s@%s: matchCount=%s, fileMatches=%d, "
         "limitHit=%s%s [query took %.3fs]",
         name,
         rev,
         match_count_value,
-        len(matches),
-        limit_hit,
+        len(result.matches),
+        result.limit_hit,
         alert_suffix,
         elapsed,
     )
+    return result
+
+
+def parse_skipped_file_reason_results(
+    results_block: dict[str, Any],
+) -> SkippedFileReasonQueryResult:
+    """Convert a SkippedFileReasons search results block to a query result"""
+    raw_results: list[dict[str, Any] | None] = results_block.get("results") or []
+    # Non-FileMatch results come back as empty objects; drop them
+    matches = [result for result in raw_results if result and result.get("file")]
+    raw_match_count = results_block.get("matchCount")
+    match_count: int | None = (
+        raw_match_count if isinstance(raw_match_count, int) else None
+    )
+    alert: dict[str, Any] = results_block.get("alert") or {}
+    alert_title_raw = alert.get("title")
+    alert_description_raw = alert.get("description")
     return SkippedFileReasonQueryResult(
         matches=matches,
         match_count=match_count,
-        limit_hit=limit_hit,
-        alert_title=alert_title,
-        alert_description=alert_description,
+        limit_hit=bool(results_block.get("limitHit")),
+        alert_title=alert_title_raw if isinstance(alert_title_raw, str) else None,
+        alert_description=(
+            alert_description_raw if isinstance(alert_description_raw, str) else None
+        ),
+    )
+
+
+def skipped_file_match_from_stream(match: dict[str, Any]) -> dict[str, Any]:
+    """Reshape a search stream content match like a GraphQL FileMatch
+
+    Only the fields the skipped-file CSVs use are kept. The stream does not
+    report file sizes, so file.byteSize is left blank
+    """
+    return {
+        "repository": {"name": match.get("repository")},
+        "file": {"path": match.get("path"), "byteSize": None},
+        "chunkMatches": [
+            {"content": chunk.get("content")}
+            for chunk in match.get("chunkMatches") or []
+            if isinstance(chunk, dict)
+        ],
+    }
+
+
+def stream_skipped_file_reason_query(
+    endpoint: str,
+    token: str,
+    repo_rev: str,
+    search_query: str,
+    max_retries: int,
+    skipped_count: int | None,
+) -> SkippedFileReasonQueryResult:
+    """Collect NOT-INDEXED matches from the search stream as they arrive"""
+    summary = SearchStreamSummary()
+    matches: list[dict[str, Any]] = []
+    stream = stream_search(
+        endpoint,
+        token,
+        search_query,
+        summary,
+        version="V2",
+        display=-1,
+        timeout=REQUEST_TIMEOUT_SECONDS_WITH_COMMIT_COUNT,
+        max_retries=max_retries,
+        description=f"Skipped files for {repo_rev}",
+    )
+    cancelled = False
+    try:
+        for match in stream:
+            if match.get("type") != "content":
+                continue
+            matches.append(skipped_file_match_from_stream(match))
+            if skipped_count is not None and len(matches) >= skipped_count:
+                cancelled = True
+                break
+    finally:
+        stream.close()
+    if cancelled:
+        logger.info(
+            "Skipped-file reason search for %s: all %d skipped file(s) "
+            "arrived; cancelled the rest of the search",
+            repo_rev,
+            len(matches),
+        )
+    return SkippedFileReasonQueryResult(
+        matches=matches,
+        # Each skipped file matches ^NOT-INDEXED: once, so a cancelled
+        # search has seen one match per file
+        match_count=len(matches) if cancelled else summary.match_count,
+        limit_hit=summary.limit_hit,
+        alert_title=summary.alert_title,
+        alert_description=summary.alert_description,
     )
 
 
@@ -2144,7 +5421,7 @@ def write_skipped_files_reason(
     Path(f"{input_prefix}-skipped-files.csv").unlink(missing_ok=True)
     Path(f"{input_prefix}-skipped-stats.csv").unlink(missing_ok=True)
 
-    rev, skipped_indexed_query = verify_repo_rev(
+    rev, skipped_indexed_query, skipped_count = verify_repo_rev(
         endpoint,
         token,
         repo_rev,
@@ -2203,6 +5480,7 @@ def write_skipped_files_reason(
         rev,
         skipped_indexed_query,
         max_retries=max_retries,
+        skipped_count=skipped_count,
     )
     matches = query_result.matches
 
@@ -2246,27 +5524,992 @@ def write_skipped_files_reason(
     )
 
 
+# --- Streaming listing decode (--stream-listing) ------------------------------
+
+# A listing page holds hundreds of repo nodes. Decoding it with json.load keeps
+# the raw body, its text, and the whole node tree in memory at once, for the
+# page being written and the page being prefetched. --stream-listing instead
+# decodes the spooled body one node at a time as the pipeline consumes it,
+# after a first pass that checks the body and counts its nodes
+
+_JSON_DECODER = json.JSONDecoder()
+_JSON_WHITESPACE = " \t\n\r"
+
+
+class JsonStream:
+    """Pull parser over a binary JSON file that decodes one value at a time"""
+
+    def __init__(self, file: IO[bytes]) -> None:
+        self._file = file
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        """Append more text to the buffer; return False at end of file"""
+        if self._eof:
+            return False
+        # Read at least as much as is pending, so re-decoding one large value
+        # after each short read stays linear in its size
+        size = max(RESPONSE_CHUNK_BYTES, len(self._buffer) - self._pos)
+        chunk = self._file.read(size)
+        self._eof = not chunk
+        self._buffer = self._buffer[self._pos :] + self._text_decoder.decode(
+            chunk,
+            final=self._eof,
+        )
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character, or "" at the end"""
+        while True:
+            while (
+                self._pos < len(self._buffer)
+                and self._buffer[self._pos] in _JSON_WHITESPACE
+            ):
+                self._pos += 1
+            if self._pos < len(self._buffer) or not self._fill():
+                return self._buffer[self._pos : self._pos + 1]
+
+    def take(self, expected: str) -> str:
+        """Consume the next character, which must be one of `expected`"""
+        char = self.peek()
+        if not char or char not in expected:
+            msg = f"expected one of {expected!r} in JSON response, got {char!r}"
+            raise ValueError(msg)
+        self._pos += 1
+        return char
+
+    def value(self) -> Any:
+        """Decode the next complete JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = _JSON_DECODER.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number that ends the buffer may continue in the next chunk
+            if end < len(self._buffer) or self._eof:
+                self._pos = end
+                return value
+            self._fill()
+
+    def keys(self) -> Iterator[str]:
+        """Yield each key of the object at the cursor
+
+        The caller consumes each member's value before asking for the next key
+        """
+        self.take("{")
+        if self.peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            self.take(":")
+            yield key
+            if self.take(",}") == "}":
+                return
+
+    def items(self) -> Iterator[Any]:
+        """Yield each decoded element of the array at the cursor"""
+        self.take("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.take(",]") == "]":
+                return
+
+
+def read_listing_document(
+    stream: JsonStream,
+    *,
+    count_nodes: bool,
+) -> tuple[dict[str, Any], int | None]:
+    """Decode a ListRepos response up to or around `repositories.nodes`
+
+    With `count_nodes`, the nodes are decoded, counted, and dropped, and the
+    rest of the document is decoded as usual. Without it, the stream is left
+    at the nodes array. The count is None when nodes could not be streamed:
+    totalCount and pageInfo did not come first, so nodes were kept as a list
+    """
+    response: dict[str, Any] = {}
+    node_count: int | None = None
+    top_keys = stream.keys()
+    for key in top_keys:
+        if key != "data" or stream.peek() != "{":
+            response[key] = stream.value()
+            continue
+        data: dict[str, Any] = {}
+        response["data"] = data
+        data_keys = stream.keys()
+        for data_key in data_keys:
+            if data_key != "repositories" or stream.peek() != "{":
+                data[data_key] = stream.value()
+                continue
+            connection: dict[str, Any] = {}
+            data["repositories"] = connection
+            fields = stream.keys()
+            for field in fields:
+                if (
+                    field != "nodes"
+                    or stream.peek() != "["
+                    or "totalCount" not in connection
+                    or "pageInfo" not in connection
+                ):
+                    connection[field] = stream.value()
+                elif count_nodes:
+                    node_count = sum(1 for _ in stream.items())
+                else:
+                    return response, None
+    if stream.peek():
+        msg = "extra data after the JSON response"
+        raise ValueError(msg)
+    return response, node_count
+
+
+def decode_listing_page(file: IO[bytes]) -> dict[str, Any]:
+    """Decode a ListRepos response, leaving `repositories.nodes` as StreamedNodes
+
+    A first pass decodes the whole body but keeps only the node count, so a
+    malformed or truncated body fails inside graphql_request, where it is
+    retried. A response that does not put totalCount and pageInfo before
+    nodes still decodes, with nodes materialized as a list
+    """
+    try:
+        response, node_count = read_listing_document(
+            JsonStream(file),
+            count_nodes=True,
+        )
+        if node_count is None:
+            file.close()
+            return response
+        file.seek(0)
+        stream = JsonStream(file)
+        read_listing_document(stream, count_nodes=False)
+    except BaseException:
+        file.close()
+        raise
+    response["data"]["repositories"]["nodes"] = StreamedNodes(
+        file,
+        stream,
+        node_count,
+    )
+    return response
+
+
+class StreamedNodes:
+    """Listing nodes of a checked, spooled response, decoded as they are read"""
+
+    def __init__(self, file: IO[bytes], stream: JsonStream, count: int) -> None:
+        self._file = file
+        self._stream = stream
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        # Most of a streamed page decodes here, after graphql_request timed
+        # its first pass, so --profile adds this time to ListRepos decoding
+        profile = _run_profile
+        decode_seconds = 0.0
+        items = self._stream.items()
+        try:
+            while True:
+                started = time.monotonic()
+                try:
+                    node = next(items)
+                except StopIteration:
+                    return
+                finally:
+                    decode_seconds += time.monotonic() - started
+                yield node
+        finally:
+            self._file.close()
+            if profile is not None:
+                profile.add_decode("ListRepos", decode_seconds)
+
+
+# --- Resumable runs -----------------------------------------------------------
+
+# Full listing runs keep an append-only JSON-lines journal next to their CSVs.
+# The first line records the options that shape the output; each checkpoint
+# line records the listing cursor of the oldest page with unfinished repos, the
+# page size Sourcegraph accepted, the repo IDs written since the previous
+# checkpoint, and the flushed size of every output file. --resume truncates the
+# outputs back to those sizes, so rows written after the last checkpoint are
+# redone rather than duplicated
+
+
+@dataclass(frozen=True)
+class ListingPosition:
+    """A listing page's `after` cursor and how many repos precede it"""
+
+    cursor: str | None
+    index: int
+    page_size: int
+
+
+class RunCheckpoint:
+    """On-disk journal of listing progress and completed repos for --resume"""
+
+    def __init__(
+        self,
+        path: Path,
+        options: dict[str, Any],
+        output_paths: list[Path],
+        interval: int = DEFAULT_CHECKPOINT_INTERVAL,
+    ) -> None:
+        self.path = path
+        self.options = options
+        self.output_paths = output_paths
+        self.interval = interval
+        self.resumed = False
+        self.resume_position = ListingPosition(None, 0, 0)
+        self.completed_ids: set[str] = set()
+        self._pages: collections.deque[ListingPosition] = collections.deque()
+        self._done_indexes: set[int] = set()
+        self._watermark = 0
+        self._page_size = 0
+        self._new_ids: list[str] = []
+        self._file: TextIO | None = None
+
+    def load(self) -> bool:
+        """Restore state from an earlier run's journal; False if none exists"""
+        if not self.path.is_file():
+            return False
+        records: list[dict[str, Any]] = []
+        with self.path.open(encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A crash can cut off the final line mid-write; drop it
+                    break
+        if not records or records[0].get("type") != "start":
+            die(f"{self.path.name} is not a list-repos checkpoint journal")
+        previous_options: dict[str, Any] = records[0].get("options") or {}
+        changed = sorted(
+            key
+            for key in {*previous_options, *self.options}
+            if previous_options.get(key) != self.options.get(key)
+        )
+        if changed:
+            die(
+                f"cannot --resume {self.path.name}: options changed since the "
+                f"interrupted run ({', '.join(changed)}); rerun with the same "
+                "flags, or without --resume to start over",
+            )
+        files: dict[str, int] = {}
+        for record in records[1:]:
+            self.completed_ids.update(record.get("completed") or [])
+            self.resume_position = ListingPosition(
+                record.get("cursor"),
+                int(record.get("index") or 0),
+                int(record.get("pageSize") or 0),
+            )
+            files = record.get("files") or {}
+        # Drop rows flushed after the last checkpoint; they are redone below
+        for output_path in self.output_paths:
+            size = files.get(output_path.name, 0)
+            if not output_path.is_file():
+                continue
+            if size == 0:
+                output_path.unlink()
+                continue
+            with output_path.open("r+b") as output:
+                output.truncate(size)
+        self._watermark = self.resume_position.index
+        self.resumed = True
+        return True
+
+    def open(self) -> None:
+        """Open the journal for appending, writing the header on a fresh run"""
+        self._file = self.path.open("a" if self.resumed else "w", encoding="utf-8")
+        if not self.resumed:
+            self._append({"type": "start", "options": self.options})
+
+    def page_started(self, position: ListingPosition) -> None:
+        """Remember where a listing page starts so the run can resume from it"""
+        self._pages.append(position)
+        self._page_size = position.page_size
+
+    def pending(
+        self,
+        repos: Iterator[tuple[int, int, dict[str, Any]]],
+    ) -> Iterator[tuple[int, int, dict[str, Any]]]:
+        """Yield listed repos, dropping those an earlier run already wrote"""
+        for index, target, repo in repos:
+            if repo.get("id") in self.completed_ids:
+                self._mark_index(index)
+                continue
+            yield index, target, repo
+
+    def mark_written(self, index: int, repo_id: str) -> None:
+        """Record that every output row for this repo has been written"""
+        self._new_ids.append(repo_id)
+        self._mark_index(index)
+
+    def save_due(self) -> bool:
+        """Return True once enough repos completed since the last save"""
+        return len(self._new_ids) >= self.interval
+
+    def save(self) -> None:
+        """Append a checkpoint; call only after flushing every output file"""
+        # Resume from the page holding the oldest unfinished repo: pages are
+        # walked in order, so later pages may already be partly done
+        while len(self._pages) > 1 and self._pages[1].index <= self._watermark:
+            self._pages.popleft()
+        if self._pages:
+            self.resume_position = self._pages[0]
+        self._append(
+            {
+                "type": "checkpoint",
+                "cursor": self.resume_position.cursor,
+                "index": self.resume_position.index,
+                "pageSize": self._page_size or self.resume_position.page_size,
+                "completed": self._new_ids,
+                "files": {
+                    output_path.name: (
+                        output_path.stat().st_size if output_path.is_file() else 0
+                    )
+                    for output_path in self.output_paths
+                },
+            },
+        )
+        self.completed_ids.update(self._new_ids)
+        self._new_ids = []
+
+    def finish(self) -> None:
+        """Delete the journal after a run completes successfully"""
+        self.close()
+        self.path.unlink(missing_ok=True)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> RunCheckpoint:
+        return self
+
+    def __exit__(self, *_args: object) -> None:
+        self.close()
+
+    def _mark_index(self, index: int) -> None:
+        self._done_indexes.add(index)
+        while self._watermark + 1 in self._done_indexes:
+            self._watermark += 1
+            self._done_indexes.discard(self._watermark)
+
+    def _append(self, record: dict[str, Any]) -> None:
+        if self._file is None:
+            return
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._file.flush()
+
+
+# --- Incremental runs (--since-snapshot) --------------------------------------
+
+# --since-snapshot reuses the --count-commits and --run-search columns of a
+# previous <prefix>-repos.csv for repos whose change timestamps match the
+# snapshot, instead of re-running the per-repo queries. mirrorInfo.updatedAt is
+# deliberately not compared: it moves on every successful fetch, even when no
+# new commits arrived, which would invalidate nearly every row each night
+
+# A new commit moves mirrorInfo.lastChanged, so an unchanged value means the
+# commit counts (and the cleanup metadata fetched with them) are still current
+COMMIT_COUNT_SNAPSHOT_KEYS = ("mirrorInfo.lastChanged",)
+# Search results also depend on the index, which can be rebuilt on its own
+RUN_SEARCH_SNAPSHOT_KEYS = (
+    "mirrorInfo.lastChanged",
+    "textSearchIndex.status.updatedAt",
+)
+
+
+def snapshot_int(cell: str) -> int | None:
+    """Parse an integer CSV cell, or None when blank or malformed"""
+    try:
+        return int(cell)
+    except ValueError:
+        return None
+
+
+class RepoSnapshot:
+    """Per-repo query results from a previous run's repos CSV, keyed by repo ID"""
+
+    def __init__(self, path: Path, run_searches: list[RunSearchPattern]) -> None:
+        self.path = path
+        self.commit_counts_reused = 0
+        self.searches_reused = 0
+        self._lock = threading.Lock()
+        self._rows: dict[str, dict[str, str]] = {}
+        commit_columns = [name for name, _, _, _ in COMMIT_COUNT_COLUMNS]
+        search_columns = [name for name, _, _, _ in RUN_SEARCH_COLUMNS]
+        if not path.is_file():
+            die(f"--since-snapshot {path} does not exist")
+        with path.open(newline="", encoding="utf-8") as snapshot_file:
+            reader = csv.DictReader(snapshot_file)
+            header = reader.fieldnames or []
+            if "id" not in header:
+                die(f"--since-snapshot {path} has no 'id' column")
+            self.has_commit_counts = all(name in header for name in commit_columns)
+            # Patterns are matched by name, so a --run-search-file snapshot
+            # is reused only for the names it has columns for
+            self.run_search_names = {
+                pattern.name
+                for pattern in run_searches
+                if all(pattern.column(name) in header for name in search_columns)
+            }
+            keep = [
+                name
+                for name in (
+                    *COMMIT_COUNT_SNAPSHOT_KEYS,
+                    *RUN_SEARCH_SNAPSHOT_KEYS,
+                    *(commit_columns if self.has_commit_counts else []),
+                    *(
+                        pattern.column(name)
+                        for pattern in run_searches
+                        if pattern.name in self.run_search_names
+                        for name in search_columns
+                    ),
+                )
+                if name in header
+            ]
+            for row in reader:
+                self._rows[row["id"]] = {name: row[name] for name in keep}
+
+    def _unchanged_row(
+        self,
+        repo: dict[str, Any],
+        keys: tuple[str, ...],
+    ) -> dict[str, str] | None:
+        row = self._rows.get(str(decode_repo_id(repo["id"])))
+        if row is None:
+            return None
+        for key in keys:
+            current = get_path(repo, key)
+            # A blank timestamp (e.g. never cloned) proves nothing; re-query
+            if not current or row.get(key) != str(current):
+                return None
+        return row
+
+    def commit_count(
+        self,
+        repo: dict[str, Any],
+    ) -> tuple[int | None, int | None, float | None, list[Any]] | None:
+        """Return fetch_commit_count-shaped values, or None if they are stale"""
+        if not self.has_commit_counts:
+            return None
+        row = self._unchanged_row(repo, COMMIT_COUNT_SNAPSHOT_KEYS)
+        if row is None:
+            return None
+        names = [name for name, _, _, _ in COMMIT_COUNT_COLUMNS]
+        default_count = snapshot_int(row[names[0]])
+        # A failed query in the previous run left a blank count; try again
+        if default_count is None:
+            return None
+        with self._lock:
+            self.commit_counts_reused += 1
+        # No query ran for it in this run, so there is no query time
+        return (
+            default_count,
+            snapshot_int(row[names[1]]),
+            None,
+            [row[name] or None for name in names[3:]],
+        )
+
+    def run_search(
+        self,
+        repo: dict[str, Any],
+        pattern: RunSearchPattern,
+    ) -> tuple[int | None, float | None, bool, str | None] | None:
+        """Return fetch_run_search-shaped values, or None if they are stale"""
+        if pattern.name not in self.run_search_names:
+            return None
+        row = self._unchanged_row(repo, RUN_SEARCH_SNAPSHOT_KEYS)
+        if row is None:
+            return None
+        names = [pattern.column(name) for name, _, _, _ in RUN_SEARCH_COLUMNS]
+        match_count = snapshot_int(row[names[0]])
+        if match_count is None:
+            return None
+        with self._lock:
+            self.searches_reused += 1
+        return (
+            match_count,
+            None,
+            row[names[2]] == "True",
+            row[names[3]] or None,
+        )
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+# --- History store (--store sqlite:PATH) -------------------------------------
+
+# Every full listing run becomes one row in `runs`; its repos land in tables
+# keyed by (run_id, repo_id), so runs can be compared with SQL instead of by
+# diffing CSVs. Column names match the CSV headers (quote them in SQL)
+
+STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+  run_id INTEGER PRIMARY KEY,
+  endpoint TEXT NOT NULL,
+  started_at TEXT NOT NULL,
+  finished_at TEXT,
+  repo_count INTEGER,
+  options TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS repositories (
+  repo_id INTEGER PRIMARY KEY,
+  name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS repo_errors (
+  run_id INTEGER NOT NULL REFERENCES runs,
+  repo_id INTEGER NOT NULL REFERENCES repositories,
+  kind TEXT NOT NULL,
+  message TEXT,
+  PRIMARY KEY (run_id, repo_id, kind)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS repo_errors_by_repo ON repo_errors (repo_id, kind);
+"""
+
+# Per-run tables whose columns come from the CSV column tables. New columns are
+# added to existing databases with ALTER TABLE when the script gains them
+STORE_COLUMN_TABLES: dict[str, list[str]] = {
+    "repo_snapshots": CSV_COLUMNS[1:],
+    "commit_counts": [name for name, _, _, _ in COMMIT_COUNT_COLUMNS],
+    "run_searches": ["pattern", *(name for name, _, _, _ in RUN_SEARCH_COLUMNS)],
+    "skipped_files": [name for name, _, _, _, _ in SKIPPED_FILES_EXTRA_COLUMNS],
+}
+
+# Extra primary-key columns after (run_id, repo_id), for tables that hold more
+# than one row per repo. run_searches has one row per --run-search-file pattern
+STORE_TABLE_KEYS: dict[str, list[str]] = {
+    "run_searches": ["name"],
+}
+
+STORE_REPORTS: dict[str, tuple[str, str]] = {
+    "runs": (
+        "Every stored run, newest first",
+        """
+SELECT run_id, endpoint, started_at, finished_at, repo_count, options
+FROM runs
+ORDER BY run_id DESC
+""",
+    ),
+    "new-errors": (
+        "Cloning and indexing errors in NEW that OLD did not have",
+        """
+SELECT r.name, e.kind, e.message
+FROM repo_errors e
+JOIN repositories r USING (repo_id)
+WHERE e.run_id = :new
+  AND NOT EXISTS (
+    SELECT 1 FROM repo_errors o
+    WHERE o.run_id = :old AND o.repo_id = e.repo_id AND o.kind = e.kind
+  )
+ORDER BY e.kind, r.name
+""",
+    ),
+    "resolved-errors": (
+        "Errors in OLD that are gone in NEW, for repos NEW still lists",
+        """
+SELECT r.name, o.kind, o.message AS old_message, n."mirrorInfo.status"
+FROM repo_errors o
+JOIN repositories r USING (repo_id)
+JOIN repo_snapshots n ON n.run_id = :new AND n.repo_id = o.repo_id
+WHERE o.run_id = :old
+  AND NOT EXISTS (
+    SELECT 1 FROM repo_errors e
+    WHERE e.run_id = :new AND e.repo_id = o.repo_id AND e.kind = o.kind
+  )
+ORDER BY o.kind, r.name
+""",
+    ),
+    "size-deltas": (
+        "Repos whose repo or index size changed between OLD and NEW, "
+        "largest change first",
+        """
+SELECT
+  r.name,
+  o."mirrorInfo.byteSize(MB)" AS old_repo_mb,
+  n."mirrorInfo.byteSize(MB)" AS new_repo_mb,
+  n."mirrorInfo.byteSize(MB)" - o."mirrorInfo.byteSize(MB)" AS repo_mb_delta,
+  o."textSearchIndex.status.indexByteSize(MB)" AS old_index_mb,
+  n."textSearchIndex.status.indexByteSize(MB)" AS new_index_mb,
+  n."textSearchIndex.status.indexByteSize(MB)"
+    - o."textSearchIndex.status.indexByteSize(MB)" AS index_mb_delta
+FROM repo_snapshots n
+JOIN repo_snapshots o ON o.run_id = :old AND o.repo_id = n.repo_id
+JOIN repositories r ON r.repo_id = n.repo_id
+WHERE n.run_id = :new
+  AND (
+    repo_mb_delta != 0 OR index_mb_delta != 0
+    -- A size that appeared or disappeared between the runs
+    OR (o."mirrorInfo.byteSize(MB)" IS NULL) != (n."mirrorInfo.byteSize(MB)" IS NULL)
+    OR (o."textSearchIndex.status.indexByteSize(MB)" IS NULL)
+      != (n."textSearchIndex.status.indexByteSize(MB)" IS NULL)
+  )
+ORDER BY max(abs(coalesce(repo_mb_delta, 0)), abs(coalesce(index_mb_delta, 0))) DESC,
+  r.name
+""",
+    ),
+}
+
+
+def store_path(url: str) -> Path:
+    """Return the database path from a --store sqlite:PATH value"""
+    scheme, _, path = url.partition(":")
+    if scheme != "sqlite" or not path:
+        die(f"--store expects sqlite:PATH, got {url!r}")
+    return Path(path)
+
+
+def sqlite_column_type(vtype: str) -> str:
+    """Map a declared column type to its SQLite column affinity"""
+    kind = vtype.split(" ", 1)[0]
+    if kind in ("integer", "boolean"):
+        return "INTEGER"
+    if kind == "float":
+        return "REAL"
+    return "TEXT"
+
+
+def sqlite_value(value: Any, vtype: str) -> Any:
+    """Convert a row cell for SQLite, keeping timestamps as ISO-8601 text"""
+    if vtype == "timestamp":
+        return str(value) if value not in (None, "") else None
+    return columnar_value(value, vtype)
+
+
+def quote_identifier(name: str) -> str:
+    """Quote a CSV column name for use as an SQL identifier"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def open_store_database(path: Path) -> sqlite3.Connection:
+    """Open the history database in WAL mode and bring its schema up to date"""
+    connection = sqlite3.connect(path, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(STORE_SCHEMA)
+    for table, columns in STORE_COLUMN_TABLES.items():
+        keys = STORE_TABLE_KEYS.get(table, [])
+        existing = {row[1] for row in connection.execute(f"PRAGMA table_info({table})")}
+        if existing and not existing.issuperset(keys):
+            migrate_store_table_keys(connection, table, keys)
+        connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "run_id INTEGER NOT NULL REFERENCES runs, "
+            "repo_id INTEGER NOT NULL REFERENCES repositories, "
+            + "".join(f"{quote_identifier(key)} TEXT NOT NULL, " for key in keys)
+            + "PRIMARY KEY ("
+            + ", ".join(["run_id", "repo_id", *map(quote_identifier, keys)])
+            + ")) WITHOUT ROWID",
+        )
+        existing = {row[1] for row in connection.execute(f"PRAGMA table_info({table})")}
+        for name in columns:
+            if name not in existing:
+                connection.execute(
+                    f"ALTER TABLE {table} ADD COLUMN {quote_identifier(name)} "
+                    + sqlite_column_type(column_type(name)),
+                )
+    return connection
+
+
+def migrate_store_table_keys(
+    connection: sqlite3.Connection,
+    table: str,
+    keys: list[str],
+) -> None:
+    """Rebuild a table from an older database whose primary key lacks `keys`
+
+    SQLite cannot change a primary key in place, so the old rows are copied
+    into a fresh table with '' in each new key column. The caller's CREATE
+    TABLE IF NOT EXISTS then recreates the table with the current key
+    """
+    logger.info("Migrating --store table %s to key on %s", table, ", ".join(keys))
+    names = [row[1] for row in connection.execute(f"PRAGMA table_info({table})")]
+    old_columns = ", ".join(map(quote_identifier, names))
+    key_columns = ", ".join(map(quote_identifier, keys))
+    blank_keys = ", ".join("''" for _ in keys)
+    with connection:
+        connection.execute("BEGIN")
+        connection.execute(f"ALTER TABLE {table} RENAME TO {table}_migrating")
+        connection.execute(
+            f"CREATE TABLE {table} ("
+            "run_id INTEGER NOT NULL REFERENCES runs, "
+            "repo_id INTEGER NOT NULL REFERENCES repositories, "
+            + "".join(f"{quote_identifier(key)} TEXT NOT NULL, " for key in keys)
+            + "".join(
+                f"{quote_identifier(name)} {sqlite_column_type(column_type(name))}, "
+                for name in names
+                if name not in ("run_id", "repo_id")
+            )
+            + f"PRIMARY KEY (run_id, repo_id, {key_columns})) WITHOUT ROWID",
+        )
+        connection.execute(
+            f"INSERT INTO {table} ({old_columns}, {key_columns}) "
+            f"SELECT {old_columns}, {blank_keys} "
+            f"FROM {table}_migrating",
+        )
+        connection.execute(f"DROP TABLE {table}_migrating")
+
+
+class SQLiteStore:
+    """--store sink that records one run's repos in the history database"""
+
+    def __init__(
+        self,
+        path: Path,
+        endpoint: str,
+        options: dict[str, Any],
+        *,
+        resume: bool = False,
+    ) -> None:
+        self.path = path
+        self._connection = open_store_database(path)
+        self._pending: dict[str, list[tuple[Any, ...]]] = {
+            "repositories": [],
+            "repo_errors": [],
+            **{table: [] for table in STORE_COLUMN_TABLES},
+        }
+        self._pending_repos = 0
+        options_json = json.dumps(options, sort_keys=True)
+        row = (
+            self._connection.execute(
+                "SELECT run_id FROM runs WHERE endpoint = ? AND options = ? "
+                "AND finished_at IS NULL ORDER BY run_id DESC LIMIT 1",
+                (endpoint, options_json),
+            ).fetchone()
+            if resume
+            else None
+        )
+        if row is not None:
+            # --resume keeps filling the run the interrupted process started
+            self.run_id = int(row[0])
+            return
+        cursor = self._connection.execute(
+            "INSERT INTO runs (endpoint, started_at, options) VALUES (?, ?, ?)",
+            (endpoint, datetime.now(timezone.utc).isoformat(), options_json),
+        )
+        self.run_id = int(cursor.lastrowid or 0)
+
+    def add(
+        self,
+        result: RepoProcessingResult,
+        row: list[Any],
+        columns: list[str],
+        *,
+        run_searches: list[RunSearchPattern],
+    ) -> None:
+        """Queue one written repo row; `columns` are the row's CSV headers"""
+        repo = result.repo
+        projected = result.projected
+        repo_id = decode_repo_id(repo["id"])
+        key = (self.run_id, repo_id)
+        cells = dict(zip(columns, row))
+        pending = self._pending
+        pending["repositories"].append((repo_id, str(repo.get("name") or "")))
+        for table, table_columns in STORE_COLUMN_TABLES.items():
+            if table == "commit_counts" and table_columns[0] not in cells:
+                continue
+            if table == "run_searches":
+                # One row per pattern, under the CSV's base column names
+                for pattern in run_searches:
+                    pattern_cells = {
+                        "pattern": pattern.pattern,
+                        **{
+                            name: cells.get(pattern.column(name))
+                            for name in table_columns[1:]
+                        },
+                    }
+                    pending[table].append(
+                        (
+                            *key,
+                            pattern.name,
+                            *(
+                                sqlite_value(pattern_cells[name], column_type(name))
+                                for name in table_columns
+                            ),
+                        ),
+                    )
+                continue
+            if table == "skipped_files":
+                if projected.skipped_files_cells is None:
+                    continue
+                cells.update(
+                    zip(
+                        (name for name, _, _, _, _ in SKIPPED_FILES_EXTRA_COLUMNS),
+                        projected.skipped_files_cells,
+                    ),
+                )
+            pending[table].append(
+                (
+                    *key,
+                    *(
+                        sqlite_value(cells.get(name), column_type(name))
+                        for name in table_columns
+                    ),
+                ),
+            )
+        if projected.has_cloning_error:
+            message = get_path(repo, "mirrorInfo.lastError") or projected.mirror_status
+            pending["repo_errors"].append((*key, "cloning", str(message)))
+        if projected.has_indexing_error:
+            message = get_path(
+                repo, "textSearchIndex.lastIndexFailureMessage"
+            ) or derive_index_status(repo)
+            pending["repo_errors"].append((*key, "indexing", str(message)))
+        self._pending_repos += 1
+        if self._pending_repos >= STORE_COMMIT_INTERVAL:
+            self.flush()
+
+    def flush(self) -> None:
+        """Bulk-insert queued rows in one transaction"""
+        if not self._pending_repos:
+            return
+        connection = self._connection
+        with connection:
+            connection.execute("BEGIN")
+            connection.executemany(
+                "INSERT INTO repositories (repo_id, name) VALUES (?, ?) "
+                "ON CONFLICT (repo_id) DO UPDATE SET name = excluded.name",
+                self._pending["repositories"],
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO repo_errors VALUES (?, ?, ?, ?)",
+                self._pending["repo_errors"],
+            )
+            for table, columns in STORE_COLUMN_TABLES.items():
+                all_columns = [*STORE_TABLE_KEYS.get(table, []), *columns]
+                names = ", ".join(
+                    ["run_id", "repo_id", *(quote_identifier(c) for c in all_columns)],
+                )
+                placeholders = ", ".join("?" * (len(all_columns) + 2))
+                connection.executemany(
+                    f"INSERT OR REPLACE INTO {table} ({names}) VALUES ({placeholders})",
+                    self._pending[table],
+                )
+        for rows in self._pending.values():
+            rows.clear()
+        self._pending_repos = 0
+
+    def finish(self) -> int:
+        """Flush, mark the run finished, and return its stored repo count"""
+        self.flush()
+        (repo_count,) = self._connection.execute(
+            "SELECT count(*) FROM repo_snapshots WHERE run_id = ?",
+            (self.run_id,),
+        ).fetchone()
+        self._connection.execute(
+            "UPDATE runs SET finished_at = ?, repo_count = ? WHERE run_id = ?",
+            (datetime.now(timezone.utc).isoformat(), repo_count, self.run_id),
+        )
+        return int(repo_count)
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self) -> SQLiteStore:
+        return self
+
+    def __exit__(self, *_args: object) -> None:
+        self.flush()
+        self.close()
+
+
+def latest_store_runs(connection: sqlite3.Connection) -> tuple[int, int]:
+    """Return (old, new): the newest finished run and the one before it"""
+    rows = connection.execute(
+        "SELECT run_id, endpoint FROM runs WHERE finished_at IS NOT NULL "
+        "ORDER BY run_id DESC",
+    ).fetchall()
+    if rows:
+        new_run, endpoint = rows[0]
+        for run_id, run_endpoint in rows[1:]:
+            if run_endpoint == endpoint:
+                return int(run_id), int(new_run)
+    die("--store-report needs two finished runs for one endpoint; see --store-runs")
+
+
+def write_store_report(
+    url: str,
+    report: str,
+    runs: list[int] | None,
+    out: TextIO,
+) -> int:
+    """Run a built-in --store-report query and write its rows as CSV"""
+    path = store_path(url)
+    if not path.is_file():
+        die(f"--store database {path} does not exist")
+    _, query = STORE_REPORTS[report]
+    with contextlib.closing(open_store_database(path)) as connection:
+        if report == "runs":
+            params: dict[str, int] = {}
+        elif runs is not None:
+            params = {"old": runs[0], "new": runs[1]}
+        else:
+            old, new = latest_store_runs(connection)
+            params = {"old": old, "new": new}
+        cursor = connection.execute(query, params)
+        writer = csv.writer(out)
+        writer.writerow([column[0] for column in cursor.description])
+        count = 0
+        for row in cursor:
+            writer.writerow(row)
+            count += 1
+    if params:
+        logger.info(
+            "%s: %d row(s) between run %d and run %d",
+            report,
+            count,
+            params["old"],
+            params["new"],
+        )
+    return count
+
+
 # --- Repo CSV pipeline --------------------------------------------------------
 
 
 class LazyCSVWriter:
     """csv.writer wrapper that creates optional CSVs only when needed"""
 
-    def __init__(self, path: Path, columns: list[str]) -> None:
+    def __init__(self, path: Path, columns: list[str], *, append: bool = False) -> None:
         self.path = path
         self.columns = columns
+        self.append = append
         self.count = 0
         self._file: TextIO | None = None
         self._writer: Any = None
 
     def writerow(self, row: list[Any]) -> None:
         if self._writer is None:
-            self._file = self.path.open("w", newline="")
+            # --resume appends to a CSV an earlier run already started
+            resuming = (
+                self.append and self.path.is_file() and self.path.stat().st_size > 0
+            )
+            self._file = self.path.open("a" if resuming else "w", newline="")
             self._writer = csv.writer(self._file)
-            self._writer.writerow(self.columns)
+            if not resuming:
+                self._writer.writerow(self.columns)
         self._writer.writerow(row)
         self.count += 1
 
+    def flush(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+
     def __enter__(self) -> LazyCSVWriter:
         return self
 
@@ -2275,9 +6518,165 @@ class LazyCSVWriter:
             self._file.close()
 
 
+def import_pyarrow() -> Any:
+    """Import pyarrow for --output-format parquet/arrow, or exit with a hint"""
+    try:
+        return importlib.import_module("pyarrow")
+    except ImportError:
+        die(
+            "--output-format parquet and arrow need pyarrow: "
+            "`pip install pyarrow`, or run with "
+            "`uv run --with pyarrow list-repos.py ...`",
+        )
+
+
+def arrow_type(pa: Any, vtype: str) -> Any:
+    """Map a declared column type to its Arrow type"""
+    kind = vtype.split(" ", 1)[0]
+    if kind == "integer":
+        return pa.int64()
+    if kind == "float":
+        return pa.float64()
+    if kind == "boolean":
+        return pa.bool_()
+    if kind == "timestamp":
+        return pa.timestamp("us", tz="UTC")
+    if kind == "enum":
+        return pa.dictionary(pa.int8(), pa.string())
+    return pa.string()
+
+
+def columnar_value(value: Any, vtype: str) -> Any:
+    """Convert a row cell to the Python value for its declared column type"""
+    if value is None or value == "":
+        return None
+    kind = vtype.split(" ", 1)[0]
+    try:
+        if kind == "integer":
+            return int(value)
+        if kind == "float":
+            return float(value)
+        if kind == "boolean":
+            return value if isinstance(value, bool) else str(value) == "True"
+        if kind == "timestamp":
+            return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return str(value)
+
+
+class LazyColumnarWriter:
+    """Typed Parquet or Arrow IPC writer with the LazyCSVWriter interface
+
+    Rows are buffered and written COLUMNAR_ROW_GROUP_SIZE at a time, one
+    compressed row group (Parquet) or record batch (Arrow) per buffer
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        columns: list[str],
+        output_format: str,
+        *,
+        create_empty: bool = False,
+    ) -> None:
+        self.path = path
+        self.columns = columns
+        self.output_format = output_format
+        self.create_empty = create_empty
+        self.count = 0
+        self._rows: list[list[Any]] = []
+        self._pa: Any = None
+        self._schema: Any = None
+        self._writer: Any = None
+
+    def writerow(self, row: list[Any]) -> None:
+        self._rows.append(row)
+        self.count += 1
+        if len(self._rows) >= COLUMNAR_ROW_GROUP_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._rows:
+            return
+        writer = self._writer if self._writer is not None else self._open()
+        pa = self._pa
+        types = [column_type(name) for name in self.columns]
+        batch = pa.record_batch(
+            [
+                pa.array(
+                    [columnar_value(value, vtype) for value in values],
+                    type=field.type,
+                )
+                for values, vtype, field in zip(
+                    zip(*self._rows),
+                    types,
+                    self._schema,
+                )
+            ],
+            schema=self._schema,
+        )
+        if self.output_format == "parquet":
+            writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            writer.write_batch(batch)
+        self._rows.clear()
+
+    def _open(self) -> Any:
+        """Create the file and its writer, and return the writer"""
+        pa = self._pa = import_pyarrow()
+        self._schema = pa.schema(
+            [
+                pa.field(name, arrow_type(pa, column_type(name)))
+                for name in self.columns
+            ],
+        )
+        if self.output_format == "parquet":
+            parquet = importlib.import_module("pyarrow.parquet")
+            self._writer = parquet.ParquetWriter(
+                str(self.path),
+                self._schema,
+                compression=COLUMNAR_COMPRESSION,
+            )
+        else:
+            self._writer = pa.ipc.new_file(
+                str(self.path),
+                self._schema,
+                options=pa.ipc.IpcWriteOptions(compression=COLUMNAR_COMPRESSION),
+            )
+        return self._writer
+
+    def __enter__(self) -> LazyColumnarWriter:
+        return self
+
+    def __exit__(self, *_args: object) -> None:
+        self.flush()
+        if self._writer is None and self.create_empty:
+            self._open()
+        if self._writer is not None:
+            self._writer.close()
+
+
+def open_repo_writer(
+    path: Path,
+    columns: list[str],
+    output_format: str,
+    *,
+    append: bool = False,
+) -> LazyCSVWriter | LazyColumnarWriter:
+    """Return the lazily created sidecar writer for --output-format"""
+    if output_format == "csv":
+        return LazyCSVWriter(path, columns, append=append)
+    return LazyColumnarWriter(path, columns, output_format)
+
+
 @dataclass(frozen=True)
 class RepositoryPage:
-    """One repository listing page plus the page size Sourcegraph accepted"""
+    """One repository listing page plus the page size Sourcegraph accepted
+
+    With --stream-listing, `connection["nodes"]` is StreamedNodes over the
+    spooled response rather than a list
+    """
 
     connection: dict[str, Any]
     request_page_size: int
@@ -2332,15 +6731,21 @@ def fetch_repository_page(
     is_site_admin: bool,
     include_index_failure_fields: bool,
     max_retries: int,
+    stream_listing: bool = False,
+    listing_filter: dict[str, bool | str] | None = None,
 ) -> RepositoryPage:
     """Fetch one repository listing page, reducing page size on field-count errors"""
+    shrunk = False
     while True:
         start = time.monotonic()
         try:
             data = graphql_request(
                 endpoint,
                 token,
-                build_repository_listing_query(include_index_failure_fields),
+                build_repository_listing_query(
+                    include_index_failure_fields,
+                    listing_filter,
+                ),
                 {
                     "first": request_page_size,
                     "after": cursor,
@@ -2350,6 +6755,7 @@ def fetch_repository_page(
                 request_description=(
                     f"Repository listing page (first={request_page_size})"
                 ),
+                decode=decode_listing_page if stream_listing else json.load,
             )
             elapsed = time.monotonic() - start
             cursor_label = "start" if cursor is None else "cursor"
@@ -2360,6 +6766,8 @@ def fetch_repository_page(
                 cursor_label,
                 elapsed,
             )
+            if shrunk:
+                note_accepted_page_size(request_page_size)
             return RepositoryPage(data["repositories"], request_page_size)
         except HTTPRequestError as error:
             violation = parse_field_count_violation(error)
@@ -2378,6 +6786,7 @@ def fetch_repository_page(
                 next_page_size,
             )
             request_page_size = next_page_size
+            shrunk = True
 
 
 def fetch_repos(
@@ -2390,8 +6799,21 @@ def fetch_repos(
     is_site_admin: bool,
     include_index_failure_fields: bool,
     max_retries: int = DEFAULT_MAX_RETRIES,
+    start: ListingPosition | None = None,
+    page_observer: Callable[[ListingPosition], None] | None = None,
+    listing_shards: int = DEFAULT_LISTING_SHARDS,
+    stream_listing: bool = False,
+    only: str | None = None,
+    listing_filter: dict[str, bool | str] | None = None,
+    top: TopRepos | None = None,
 ) -> Iterator[tuple[int, int, dict[str, Any]]]:
-    """Yield (index, target, repo) tuples for a scoped repo or paged repo list"""
+    """Yield (index, target, repo) tuples for a scoped repo or paged repo list
+
+    `start` continues an earlier listing from its cursor; `page_observer` is
+    told where each page starts before its repos are yielded. `only` names a
+    LISTING_FILTERS mode; `listing_filter` filters or orders this one walk.
+    `top` ranks by a listing column and yields just the top repos
+    """
     if scope_repo is not None:
         repo = fetch_single_repo(
             endpoint,
@@ -2405,9 +6827,57 @@ def fetch_repos(
         yield 1, 1, repo
         logger.info("Fetched 1/1 repositories...")
         return
-    total_fetched = 0
+    if top is not None and top.from_listing:
+        yield from fetch_top_repos(
+            endpoint,
+            token,
+            top,
+            page_size=page_size,
+            is_site_admin=is_site_admin,
+            include_index_failure_fields=include_index_failure_fields,
+            max_retries=max_retries,
+            listing_shards=listing_shards,
+            stream_listing=stream_listing,
+            only=only,
+        )
+        return
+    if only is not None:
+        yield from fetch_filtered_repos(
+            endpoint,
+            token,
+            max_repos,
+            only,
+            page_size=page_size,
+            is_site_admin=is_site_admin,
+            include_index_failure_fields=include_index_failure_fields,
+            max_retries=max_retries,
+            stream_listing=stream_listing,
+        )
+        return
+    if listing_shards > 1:
+        if start is not None and start.cursor is not None:
+            logger.info(
+                "--listing-shards restarts the listing from the beginning; "
+                "repos already written are skipped",
+            )
+        yield from fetch_repos_sharded(
+            endpoint,
+            token,
+            max_repos,
+            page_size=page_size,
+            listing_shards=listing_shards,
+            is_site_admin=is_site_admin,
+            include_index_failure_fields=include_index_failure_fields,
+            max_retries=max_retries,
+            stream_listing=stream_listing,
+        )
+        return
+    total_fetched = start.index if start is not None else 0
+    page_cursor = start.cursor if start is not None else None
     first_page = True
     current_page_size = page_size
+    if start is not None and start.page_size:
+        current_page_size = min(current_page_size, start.page_size)
     logger.info(
         "GraphQL listing page size: %d (will retry smaller if Sourcegraph "
         "reports a field-count limit)",
@@ -2420,14 +6890,18 @@ def fetch_repos(
     )
     if request_page_size is None:
         return
+    if start is not None and start.cursor is not None:
+        logger.info("Resuming listing after %d repositories", total_fetched)
     page = fetch_repository_page(
         endpoint,
         token,
-        None,
+        page_cursor,
         request_page_size,
         is_site_admin=is_site_admin,
         include_index_failure_fields=include_index_failure_fields,
         max_retries=max_retries,
+        stream_listing=stream_listing,
+        listing_filter=listing_filter,
     )
     with concurrent.futures.ThreadPoolExecutor(max_workers=1) as page_executor:
         while True:
@@ -2445,46 +6919,335 @@ def fetch_repos(
                 )
                 first_page = False
 
-            nodes: list[dict[str, Any]] = connection["nodes"]
-            total_after_page = total_fetched + len(nodes)
-            page_info: dict[str, Any] = connection["pageInfo"]
-            next_page = None
-            if page_info["hasNextPage"]:
-                next_request_page_size = repository_page_request_size(
-                    current_page_size,
-                    max_repos,
-                    total_after_page,
+            nodes: Iterable[dict[str, Any]] = connection["nodes"]
+            if page_observer is not None:
+                page_observer(
+                    ListingPosition(page_cursor, total_fetched, current_page_size),
+                )
+            total_after_page = total_fetched + len(page.connection["nodes"])
+            page_info: dict[str, Any] = connection["pageInfo"]
+            next_page = None
+            if page_info["hasNextPage"]:
+                next_request_page_size = repository_page_request_size(
+                    current_page_size,
+                    max_repos,
+                    total_after_page,
+                )
+                if next_request_page_size is not None:
+                    next_page = page_executor.submit(
+                        fetch_repository_page,
+                        endpoint,
+                        token,
+                        page_info["endCursor"],
+                        next_request_page_size,
+                        is_site_admin=is_site_admin,
+                        include_index_failure_fields=include_index_failure_fields,
+                        max_retries=max_retries,
+                        stream_listing=stream_listing,
+                        listing_filter=listing_filter,
+                    )
+
+            for repo in nodes:
+                total_fetched += 1
+                yield total_fetched, target, repo
+
+            logger.info("Fetched %d/%d repositories...", total_fetched, target)
+
+            if next_page is None:
+                break
+            page_cursor = page_info["endCursor"]
+            page = next_page.result()
+
+
+def fetch_listing_filter_counts(
+    endpoint: str,
+    token: str,
+    listing_filters: tuple[dict[str, bool | str], ...],
+    *,
+    max_retries: int,
+) -> list[int]:
+    """Return the number of repos matching each listing filter"""
+    data = graphql_request(
+        endpoint,
+        token,
+        build_repository_count_query(listing_filters),
+        {},
+        max_retries=max_retries,
+        request_description="Filtered repository counts",
+    )
+    return [
+        data[f"count{position}"]["totalCount"]
+        for position in range(len(listing_filters))
+    ]
+
+
+def fetch_filtered_repos(
+    endpoint: str,
+    token: str,
+    max_repos: int | None,
+    only: str,
+    *,
+    page_size: int,
+    is_site_admin: bool,
+    include_index_failure_fields: bool,
+    max_retries: int,
+    stream_listing: bool = False,
+) -> Iterator[tuple[int, int, dict[str, Any]]]:
+    """Yield (index, target, repo) tuples for the repos an --only mode matches
+
+    Each filter is walked in turn and repos matched by an earlier filter are
+    dropped, so the target is an upper bound when the filters overlap
+    """
+    listing_filters = LISTING_FILTERS[only]
+    counts = fetch_listing_filter_counts(
+        endpoint,
+        token,
+        listing_filters,
+        max_retries=max_retries,
+    )
+    logger.info(
+        "--only %s: %s",
+        only,
+        ", ".join(
+            f"{count} with {describe_listing_filter(listing_filter)}"
+            for listing_filter, count in zip(listing_filters, counts)
+        ),
+    )
+    target = sum(counts)
+    if max_repos is not None:
+        target = min(target, max_repos)
+    seen_ids: set[str] = set()
+    total_fetched = 0
+    for listing_filter, count in zip(listing_filters, counts):
+        remaining = None if max_repos is None else max_repos - total_fetched
+        if not count or remaining == 0:
+            continue
+        for _, _, repo in fetch_repos(
+            endpoint,
+            token,
+            remaining,
+            page_size=page_size,
+            is_site_admin=is_site_admin,
+            include_index_failure_fields=include_index_failure_fields,
+            max_retries=max_retries,
+            stream_listing=stream_listing,
+            listing_filter=listing_filter,
+        ):
+            if repo["id"] in seen_ids:
+                continue
+            seen_ids.add(repo["id"])
+            total_fetched += 1
+            yield total_fetched, target, repo
+
+
+@dataclass(frozen=True)
+class ListingShard:
+    """A contiguous run of the repo listing, walked by one shard thread"""
+
+    cursor: str | None
+    count: int | None  # None: walk until the end of the listing
+
+
+def fetch_shard_boundaries(
+    endpoint: str,
+    token: str,
+    listing_shards: int,
+    max_retries: int,
+) -> tuple[int, list[ListingShard]]:
+    """Split the listing into roughly equal shards at server-issued cursors
+
+    Shards start at real endCursors from an ID-only walk of the same
+    connection, so they are disjoint without assuming any cursor format
+    """
+    boundaries: list[tuple[int, str]] = []
+    cursor: str | None = None
+    scan_page_size = SHARD_BOUNDARY_SCAN_PAGE_SIZE
+    seen = 0
+    total_count = 0
+    while True:
+        try:
+            data = graphql_request(
+                endpoint,
+                token,
+                REPOSITORY_CURSORS_QUERY,
+                {"first": scan_page_size, "after": cursor},
+                max_retries=max_retries,
+                request_description="Repository listing boundary scan",
+            )
+        except HTTPRequestError as error:
+            violation = parse_field_count_violation(error)
+            if violation is None or scan_page_size <= 1:
+                raise
+            scan_page_size = retry_page_size_after_field_count_violation(
+                scan_page_size,
+                violation,
+            )
+            continue
+        connection: dict[str, Any] = data["repositories"]
+        total_count = int(connection["totalCount"])
+        page_info: dict[str, Any] = connection["pageInfo"]
+        if not page_info["hasNextPage"]:
+            break
+        seen += len(connection["nodes"])
+        cursor = str(page_info["endCursor"])
+        boundaries.append((seen, cursor))
+
+    # Pick the scanned boundary closest to each ideal split point
+    starts: list[tuple[int, str | None]] = [(0, None)]
+    for shard_number in range(1, listing_shards):
+        ideal = total_count * shard_number // listing_shards
+        if not boundaries:
+            break
+        offset, boundary_cursor = min(
+            boundaries,
+            key=lambda boundary: abs(boundary[0] - ideal),
+        )
+        if offset > starts[-1][0]:
+            starts.append((offset, boundary_cursor))
+    shards = [
+        ListingShard(
+            shard_cursor,
+            starts[position + 1][0] - offset if position + 1 < len(starts) else None,
+        )
+        for position, (offset, shard_cursor) in enumerate(starts)
+    ]
+    return total_count, shards
+
+
+def fetch_repos_sharded(
+    endpoint: str,
+    token: str,
+    max_repos: int | None,
+    *,
+    page_size: int,
+    listing_shards: int,
+    is_site_admin: bool,
+    include_index_failure_fields: bool,
+    max_retries: int,
+    stream_listing: bool = False,
+) -> Iterator[tuple[int, int, dict[str, Any]]]:
+    """Walk listing shards concurrently and merge them into one repo stream"""
+    start = time.monotonic()
+    total_count, shards = fetch_shard_boundaries(
+        endpoint,
+        token,
+        listing_shards,
+        max_retries,
+    )
+    target = min(max_repos, total_count) if max_repos is not None else total_count
+    logger.info(
+        "Listing %d of %d total repositories in %d shard(s) [boundary scan took %.3fs]",
+        target,
+        total_count,
+        len(shards),
+        time.monotonic() - start,
+    )
+    if len(shards) < listing_shards:
+        logger.warning(
+            "--listing-shards %d reduced to %d: shards start at boundary scan "
+            "pages of %d repos, and the listing has %d",
+            listing_shards,
+            len(shards),
+            SHARD_BOUNDARY_SCAN_PAGE_SIZE,
+            total_count,
+        )
+    logger.info(
+        "GraphQL listing page size: %d (will retry smaller if Sourcegraph "
+        "reports a field-count limit)",
+        page_size,
+    )
+    # Shards share the page size Sourcegraph accepted, so a field-count
+    # rejection seen by one shard is not rediscovered by every other shard
+    accepted_page_size = page_size
+    stop = threading.Event()
+    # At most two pages per shard wait for the consumer, in memory or, with
+    # --stream-listing, as spooled response bodies. A shard's position marks
+    # the end of its walk
+    pages: queue.Queue[Iterable[dict[str, Any]] | int] = queue.Queue(
+        maxsize=len(shards) * 2
+    )
+
+    def deliver(item: Iterable[dict[str, Any]] | int) -> bool:
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.5)
+            except queue.Full:
+                continue
+            return True
+        return False
+
+    def walk_shard(position: int, shard: ListingShard) -> None:
+        nonlocal accepted_page_size
+        cursor = shard.cursor
+        fetched = 0
+        try:
+            while not stop.is_set():
+                request_page_size = accepted_page_size
+                if shard.count is not None:
+                    if fetched >= shard.count:
+                        break
+                    request_page_size = min(request_page_size, shard.count - fetched)
+                page = fetch_repository_page(
+                    endpoint,
+                    token,
+                    cursor,
+                    request_page_size,
+                    is_site_admin=is_site_admin,
+                    include_index_failure_fields=include_index_failure_fields,
+                    max_retries=max_retries,
+                    stream_listing=stream_listing,
                 )
-                if next_request_page_size is not None:
-                    next_page = page_executor.submit(
-                        fetch_repository_page,
-                        endpoint,
-                        token,
-                        page_info["endCursor"],
-                        next_request_page_size,
-                        is_site_admin=is_site_admin,
-                        include_index_failure_fields=include_index_failure_fields,
-                        max_retries=max_retries,
+                if page.request_page_size < request_page_size:
+                    accepted_page_size = min(
+                        accepted_page_size,
+                        page.request_page_size,
                     )
-
-            for repo in nodes:
+                fetched += len(page.connection["nodes"])
+                if not deliver(page.connection["nodes"]):
+                    return
+                page_info: dict[str, Any] = page.connection["pageInfo"]
+                if not page_info["hasNextPage"]:
+                    break
+                cursor = page_info["endCursor"]
+        finally:
+            # The consumer re-raises a failure from this shard's future
+            deliver(position)
+
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=len(shards),
+        thread_name_prefix="list-repos-shard",
+    )
+    try:
+        walks = [
+            executor.submit(walk_shard, position, shard)
+            for position, shard in enumerate(shards)
+        ]
+        # Repos added or renamed mid-run can shift a boundary by a few
+        # repos; drop anything a neighboring shard already yielded
+        seen_ids: set[str] = set()
+        total_fetched = 0
+        finished = 0
+        while finished < len(shards):
+            item = pages.get()
+            if isinstance(item, int):
+                error = walks[item].exception()
+                if error is not None:
+                    raise error
+                finished += 1
+                continue
+            for repo in item:
+                repo_id = str(repo.get("id"))
+                if repo_id in seen_ids:
+                    continue
+                seen_ids.add(repo_id)
                 total_fetched += 1
                 yield total_fetched, target, repo
-
+                if max_repos is not None and total_fetched >= max_repos:
+                    return
             logger.info("Fetched %d/%d repositories...", total_fetched, target)
-
-            if next_page is None:
-                break
-            page = next_page.result()
-
-
-def build_row(repo: dict[str, Any], endpoint: str) -> list[Any]:
-    """Build a base CSV row and absolutize the repo URL"""
-    base = endpoint.rstrip("/")
-    row = [extract(repo) for _, extract, _, _, _ in COLUMNS]
-    if row[URL_COLUMN_INDEX]:
-        row[URL_COLUMN_INDEX] = base + row[URL_COLUMN_INDEX]
-    return row
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
 
 
 def append_commit_count(
@@ -2512,34 +7275,32 @@ def append_commit_count(
 
 def append_run_search(
     row: list[Any],
-    match_count: int | None,
-    elapsed_seconds: float | None,
-    limit_hit: bool,
-    alert_title: str | None,
-    *,
-    run_search: bool,
+    searches: list[tuple[int | None, float | None, bool, str | None]],
 ) -> list[Any]:
-    """Append optional run-search fields in RUN_SEARCH_COLUMNS order"""
-    if not run_search:
+    """Append one RUN_SEARCH_COLUMNS block per --run-search pattern"""
+    if not searches:
         return row
-    elapsed_cell: str | None = (
-        f"{elapsed_seconds:.3f}" if elapsed_seconds is not None else None
-    )
-    return [*row, match_count, elapsed_cell, limit_hit, alert_title]
+    row = list(row)
+    for match_count, elapsed_seconds, limit_hit, alert_title in searches:
+        elapsed_cell: str | None = (
+            f"{elapsed_seconds:.3f}" if elapsed_seconds is not None else None
+        )
+        row += [match_count, elapsed_cell, limit_hit, alert_title]
+    return row
 
 
 def csv_columns_for(
     base_columns: list[str],
     *,
     count_commits: bool,
-    run_search: bool = False,
+    run_searches: list[RunSearchPattern] | None = None,
 ) -> list[str]:
     """Return base columns plus enabled optional column blocks"""
     cols = list(base_columns)
     if count_commits:
         cols.extend(name for name, _, _, _ in COMMIT_COUNT_COLUMNS)
-    if run_search:
-        cols.extend(name for name, _, _, _ in RUN_SEARCH_COLUMNS)
+    for pattern in run_searches or []:
+        cols.extend(pattern.column(name) for name, _, _, _ in RUN_SEARCH_COLUMNS)
     return cols
 
 
@@ -2568,6 +7329,7 @@ def collect_skipped_file_reason_search_results(
                 revision,
                 skipped_indexed_query,
                 max_retries=max_retries,
+                skipped_count=skipped_count,
             )
         except (GraphQLError, HTTPRequestError, OSError) as error:
             results.append(
@@ -2687,91 +7449,308 @@ class RepoProcessingResult:
     index: int
     target: int
     repo: dict[str, Any]
-    row: list[Any]
+    projected: ProjectedRepo
     commit_count: int | None
     all_refs_count: int | None
     commit_elapsed_seconds: float | None
     optimization_values: list[Any] | None
-    search_match_count: int | None
-    search_elapsed_seconds: float | None
-    search_limit_hit: bool
-    search_alert_title: str | None
+    # One (matchCount, queryTimeSeconds, limitHit, alertTitle) per pattern
+    searches: list[tuple[int | None, float | None, bool, str | None]]
     skipped_file_reason_search_results: list[SkippedFileReasonSearchResult]
+    commit_count_from_snapshot: bool = False
+    # Names of the patterns whose results came from --since-snapshot
+    searches_from_snapshot: frozenset[str] = frozenset()
+
+
+# --- Top repos (--top) --------------------------------------------------------
+
+# --by columns the repositories connection can sort on, with the arguments
+# that list the largest first; --top then fetches only the first N repos
+TOP_SERVER_ORDER: dict[str, dict[str, bool | str]] = {
+    "mirrorInfo.byteSize(MB)": {"orderBy": "SIZE", "descending": True},
+}
+DEFAULT_TOP_BY = "mirrorInfo.byteSize(MB)"
+
+# --by columns filled in by per-repo queries. Every listed repo has to be
+# queried to rank these, so only the finished rows are bounded
+TOP_RESULT_VALUES: dict[str, Callable[[RepoProcessingResult], Any]] = {
+    "defaultBranch.target.commit.ancestors.totalCount": lambda result: (
+        result.commit_count
+    ),
+    "allRefs.search.matchCount": lambda result: result.all_refs_count,
+    "commitCount.queryTimeSeconds": lambda result: result.commit_elapsed_seconds,
+    "runSearch.matchCount": lambda result: (
+        result.searches[0][0] if result.searches else None
+    ),
+    "runSearch.queryTimeSeconds": lambda result: (
+        result.searches[0][1] if result.searches else None
+    ),
+}
+
+# Numeric listing columns, all FieldPath columns, ranked as repos are listed
+TOP_LISTING_COLUMNS: dict[str, FieldPath] = {
+    name: extract
+    for name, extract, _, _, vtype in COLUMNS
+    if vtype in ("integer", "float") and isinstance(extract, FieldPath)
+}
+TOP_BY_COLUMNS = [*TOP_LISTING_COLUMNS, *TOP_RESULT_VALUES]
+
+
+@dataclass(frozen=True)
+class TopRepos:
+    """--top N --by COLUMN: keep only the N repos with the largest values"""
+
+    count: int
+    column: str
 
+    @property
+    def from_listing(self) -> bool:
+        return self.column in TOP_LISTING_COLUMNS
 
-def collect_repo_processing_result(
+
+def top_rank(value: object) -> tuple[bool, Any]:
+    """Sort key putting repos without a value below every repo with one"""
+    return (value is not None, value if value is not None else 0)
+
+
+def top_listing_value(repo: dict[str, Any], column: str) -> object | None:
+    """Return a repo's --by value straight from its listing node"""
+    extract = TOP_LISTING_COLUMNS[column]
+    value = get_path(repo, extract.path)
+    if value is None or extract.convert is None:
+        return value
+    # Compare sizes in bytes: whole megabytes would tie most small repos
+    if extract.convert is whole_mb:
+        return int(cast("int | str", value))
+    return extract.convert(value)
+
+
+def fetch_top_repos(
     endpoint: str,
     token: str,
-    index: int,
-    target: int,
-    repo: dict[str, Any],
+    top: TopRepos,
+    *,
+    page_size: int,
+    is_site_admin: bool,
+    include_index_failure_fields: bool,
+    max_retries: int,
+    listing_shards: int = DEFAULT_LISTING_SHARDS,
+    stream_listing: bool = False,
+    only: str | None = None,
+) -> Iterator[tuple[int, int, dict[str, Any]]]:
+    """Yield (index, target, repo) for the top repos by a listing column
+
+    Uses the connection's own ordering when it has one for the column, and
+    otherwise lists every repo through a heap of `top.count` repos
+    """
+    order = TOP_SERVER_ORDER.get(top.column)
+    if order is not None and only is None:
+        logger.info(
+            "--top %d: listing repos by %s, largest first",
+            top.count,
+            describe_listing_filter(order),
+        )
+        yield from fetch_repos(
+            endpoint,
+            token,
+            top.count,
+            page_size=page_size,
+            is_site_admin=is_site_admin,
+            include_index_failure_fields=include_index_failure_fields,
+            max_retries=max_retries,
+            stream_listing=stream_listing,
+            listing_filter=order,
+        )
+        return
+    repos = fetch_repos(
+        endpoint,
+        token,
+        page_size=page_size,
+        is_site_admin=is_site_admin,
+        include_index_failure_fields=include_index_failure_fields,
+        max_retries=max_retries,
+        listing_shards=listing_shards,
+        stream_listing=stream_listing,
+        only=only,
+    )
+    survivors = heapq.nlargest(
+        top.count,
+        (repo for _, _, repo in repos),
+        key=lambda repo: top_rank(top_listing_value(repo, top.column)),
+    )
+    logger.info(
+        "--top %d: kept %d repo(s) with the largest %s",
+        top.count,
+        len(survivors),
+        top.column,
+    )
+    for index, repo in enumerate(survivors, 1):
+        yield index, len(survivors), repo
+
+
+def top_processing_results(
+    results: Iterable[RepoProcessingResult],
+    top: TopRepos,
+) -> Iterator[RepoProcessingResult]:
+    """Hold the top results by a per-repo query column, then yield them"""
+    value = TOP_RESULT_VALUES[top.column]
+    survivors = heapq.nlargest(
+        top.count,
+        results,
+        key=lambda result: top_rank(value(result)),
+    )
+    logger.info(
+        "--top %d: writing %d repo(s) with the largest %s",
+        top.count,
+        len(survivors),
+        top.column,
+    )
+    for index, result in enumerate(survivors, 1):
+        yield replace(result, index=index, target=len(survivors))
+
+
+def collect_repo_processing_results(
+    endpoint: str,
+    token: str,
+    batch: list[tuple[int, int, dict[str, Any]]],
     *,
     count_commits: bool,
     count_commits_rev: str,
-    run_search_pattern: str | None,
+    run_searches: list[RunSearchPattern],
     skipped_file_reasons: bool,
     max_retries: int,
-) -> RepoProcessingResult:
-    """Build the row and run optional per-repo network queries"""
-    row = build_row(repo, endpoint)
-    commit_count: int | None = None
-    all_refs_count: int | None = None
-    commit_elapsed_seconds: float | None = None
-    optimization_values: list[Any] | None = None
-    search_match_count: int | None = None
-    search_elapsed_seconds: float | None = None
-    search_limit_hit = False
-    search_alert_title: str | None = None
-    skipped_file_reason_search_results: list[SkippedFileReasonSearchResult] = []
-    repo_name = str(repo.get("name") or "")
+    commit_count_batch_size: QueryBatchSize,
+    run_search_batch_size: QueryBatchSize,
+    snapshot: RepoSnapshot | None = None,
+    run_search_mode: str = DEFAULT_RUN_SEARCH_MODE,
+) -> list[RepoProcessingResult]:
+    """Build rows for a batch of repos and run optional per-repo queries
+
+    Commit counts and --run-search queries for the batch are sent as aliased
+    requests; results come back in batch order. With --run-search-mode
+    global, only repos the batch's select:repo search returned are searched
+    """
+    snapshot_commit_counts: dict[int, Any] = {}
+    snapshot_searches: dict[tuple[int, str], Any] = {}
+    if snapshot is not None:
+        for index, _target, repo in batch:
+            if count_commits:
+                snapshot_commit_counts[index] = snapshot.commit_count(repo)
+            for pattern in run_searches:
+                snapshot_searches[index, pattern.name] = snapshot.run_search(
+                    repo,
+                    pattern,
+                )
+
+    commit_counts: dict[
+        str, tuple[int | None, int | None, float | None, list[Any]]
+    ] = {}
     if count_commits:
-        (
-            commit_count,
-            all_refs_count,
-            commit_elapsed_seconds,
-            optimization_values,
-        ) = fetch_commit_count(
+        commit_counts = fetch_commit_counts(
             endpoint,
             token,
-            repo_name,
+            [
+                str(repo.get("name") or "")
+                for index, _target, repo in batch
+                if snapshot_commit_counts.get(index) is None
+            ],
             count_commits_rev,
+            commit_count_batch_size,
             max_retries=max_retries,
         )
-    if run_search_pattern is not None:
-        (
-            search_match_count,
-            search_elapsed_seconds,
-            search_limit_hit,
-            search_alert_title,
-        ) = fetch_run_search(
+    searches: dict[tuple[str, str], tuple[int | None, float, bool, str | None]] = {}
+    if run_searches:
+        repo_searches = [
+            (
+                str(repo.get("name") or ""),
+                [
+                    pattern
+                    for pattern in run_searches
+                    if snapshot_searches.get((index, pattern.name)) is None
+                ],
+            )
+            for index, _target, repo in batch
+        ]
+        if run_search_mode == "global":
+            candidates = fetch_run_search_candidates(
+                endpoint,
+                token,
+                [name for name, patterns in repo_searches if patterns],
+                run_searches,
+                max_retries=max_retries,
+            )
+            repo_searches = [
+                (
+                    name,
+                    [
+                        pattern
+                        for pattern in patterns
+                        if name in candidates[pattern.name]
+                    ],
+                )
+                for name, patterns in repo_searches
+            ]
+        searches = fetch_run_searches(
             endpoint,
             token,
-            repo_name,
-            run_search_pattern,
+            repo_searches,
+            run_search_batch_size,
             max_retries=max_retries,
         )
-    if skipped_file_reasons and has_skipped_files(repo):
-        skipped_file_reason_search_results = collect_skipped_file_reason_search_results(
-            endpoint,
-            token,
-            repo,
-            max_retries,
+
+    results: list[RepoProcessingResult] = []
+    for index, target, repo in batch:
+        repo_name = str(repo.get("name") or "")
+        projected = project_repo(repo, endpoint)
+        commit_count: int | None = None
+        all_refs_count: int | None = None
+        commit_elapsed_seconds: float | None = None
+        optimization_values: list[Any] | None = None
+        result_searches: list[tuple[int | None, float | None, bool, str | None]] = []
+        searches_from_snapshot: set[str] = set()
+        skipped_file_reason_search_results: list[SkippedFileReasonSearchResult] = []
+        snapshot_commit_count = snapshot_commit_counts.get(index)
+        if count_commits:
+            (
+                commit_count,
+                all_refs_count,
+                commit_elapsed_seconds,
+                optimization_values,
+            ) = snapshot_commit_count or commit_counts[repo_name]
+        for pattern in run_searches:
+            snapshot_search = snapshot_searches.get((index, pattern.name))
+            if snapshot_search is not None:
+                searches_from_snapshot.add(pattern.name)
+            result_searches.append(
+                snapshot_search
+                or searches.get((repo_name, pattern.name), RUN_SEARCH_NO_MATCH),
+            )
+        if skipped_file_reasons and projected.has_skipped_files:
+            skipped_file_reason_search_results = (
+                collect_skipped_file_reason_search_results(
+                    endpoint,
+                    token,
+                    repo,
+                    max_retries,
+                )
+            )
+        results.append(
+            RepoProcessingResult(
+                index=index,
+                target=target,
+                repo=repo,
+                projected=projected,
+                commit_count=commit_count,
+                all_refs_count=all_refs_count,
+                commit_elapsed_seconds=commit_elapsed_seconds,
+                optimization_values=optimization_values,
+                searches=result_searches,
+                skipped_file_reason_search_results=(skipped_file_reason_search_results),
+                commit_count_from_snapshot=snapshot_commit_count is not None,
+                searches_from_snapshot=frozenset(searches_from_snapshot),
+            ),
         )
-    return RepoProcessingResult(
-        index=index,
-        target=target,
-        repo=repo,
-        row=row,
-        commit_count=commit_count,
-        all_refs_count=all_refs_count,
-        commit_elapsed_seconds=commit_elapsed_seconds,
-        optimization_values=optimization_values,
-        search_match_count=search_match_count,
-        search_elapsed_seconds=search_elapsed_seconds,
-        search_limit_hit=search_limit_hit,
-        search_alert_title=search_alert_title,
-        skipped_file_reason_search_results=skipped_file_reason_search_results,
-    )
+    return results
 
 
 def append_processing_result_columns(
@@ -2779,7 +7758,6 @@ def append_processing_result_columns(
     result: RepoProcessingResult,
     *,
     count_commits: bool,
-    run_search: bool,
 ) -> list[Any]:
     """Append optional column blocks from a processed repo result"""
     with_commit = append_commit_count(
@@ -2790,21 +7768,14 @@ def append_processing_result_columns(
         result.optimization_values,
         count_commits=count_commits,
     )
-    return append_run_search(
-        with_commit,
-        result.search_match_count,
-        result.search_elapsed_seconds,
-        result.search_limit_hit,
-        result.search_alert_title,
-        run_search=run_search,
-    )
+    return append_run_search(with_commit, result.searches)
 
 
 def log_processing_result(
     result: RepoProcessingResult,
     *,
     count_commits: bool,
-    run_search_pattern: str | None,
+    run_searches: list[RunSearchPattern],
 ) -> None:
     """Log optional per-repo query results in CSV order"""
     position = f"[{result.index}/{result.target}]"
@@ -2817,7 +7788,23 @@ def log_processing_result(
             "?" if result.all_refs_count is None else f"{result.all_refs_count}"
         )
         elapsed = result.commit_elapsed_seconds or 0.0
-        if result.commit_count is None:
+        if result.commit_count_from_snapshot:
+            logger.info(
+                "%s Commit count for %s: default=%s, allRefs=%s [unchanged since snapshot]",
+                position,
+                repo_label,
+                default_str,
+                all_refs_str,
+            )
+        elif result.commit_count is not None and result.commit_elapsed_seconds is None:
+            logger.info(
+                "%s Commit count for %s: default=%s, allRefs=%s [cached for this commit]",
+                position,
+                repo_label,
+                default_str,
+                all_refs_str,
+            )
+        elif result.commit_count is None:
             logger.info(
                 "%s No commit count for %s (default=%s, allRefs=%s) [query took %.3fs]",
                 position,
@@ -2835,26 +7822,70 @@ def log_processing_result(
                 all_refs_str,
                 elapsed,
             )
-    if run_search_pattern is not None:
-        count_str = (
-            "?" if result.search_match_count is None else f"{result.search_match_count}"
-        )
-        limit_suffix = " (limit hit)" if result.search_limit_hit else ""
-        alert_suffix = (
-            f" alert={result.search_alert_title!r}" if result.search_alert_title else ""
-        )
+    for pattern, (match_count, elapsed_seconds, limit_hit, alert_title) in zip(
+        run_searches,
+        result.searches,
+    ):
+        count_str = "?" if match_count is None else f"{match_count}"
+        limit_suffix = " (limit hit)" if limit_hit else ""
+        alert_suffix = f" alert={alert_title!r}" if alert_title else ""
+        if pattern.name in result.searches_from_snapshot:
+            timing = "unchanged since snapshot"
+        elif elapsed_seconds is None:
+            timing = "no match in instance-wide search"
+        else:
+            timing = f"query took {elapsed_seconds:.3f}s"
         logger.info(
-            "%s Search %s in %s: matches=%s%s%s [query took %.3fs]",
+            "%s Search %s in %s: matches=%s%s%s [%s]",
             position,
-            run_search_pattern,
+            pattern.name or pattern.pattern,
             repo_label,
             count_str,
             limit_suffix,
             alert_suffix,
-            result.search_elapsed_seconds or 0.0,
+            timing,
         )
 
 
+def estimated_repo_bytes(repo: dict[str, Any]) -> int:
+    """Guess a repo's per-repo query cost from its git and indexed sizes
+
+    Commit counts walk the git repo and searches read the indexed content,
+    so the larger of mirrorInfo.byteSize and contentByteSize is used
+    """
+    mirror = repo.get("mirrorInfo") or {}
+    status = (repo.get("textSearchIndex") or {}).get("status") or {}
+    sizes = [
+        int(size)
+        for size in (mirror.get("byteSize"), status.get("contentByteSize"))
+        if isinstance(size, (int, str))
+    ]
+    return max(sizes, default=0)
+
+
+ReorderedItem = TypeVar("ReorderedItem")
+
+
+class ReorderBuffer(Generic[ReorderedItem]):
+    """Hold items that finish out of order until every earlier one arrives"""
+
+    def __init__(self) -> None:
+        self._next = 0
+        self._held: dict[int, ReorderedItem] = {}
+
+    def __len__(self) -> int:
+        return len(self._held)
+
+    def add(self, sequence: int, item: ReorderedItem) -> list[ReorderedItem]:
+        """Store the item for `sequence`; return the items now in order"""
+        self._held[sequence] = item
+        ready: list[ReorderedItem] = []
+        while self._next in self._held:
+            ready.append(self._held.pop(self._next))
+            self._next += 1
+        return ready
+
+
 def iter_repo_processing_results(
     endpoint: str,
     token: str,
@@ -2866,12 +7897,27 @@ def iter_repo_processing_results(
     include_index_failure_fields: bool,
     count_commits: bool,
     count_commits_rev: str,
-    run_search_pattern: str | None,
+    run_searches: list[RunSearchPattern],
     skipped_file_reasons: bool,
-    concurrency: int,
+    concurrency_limiter: ConcurrencyLimiter,
     max_retries: int,
+    checkpoint: RunCheckpoint | None = None,
+    listing_shards: int = DEFAULT_LISTING_SHARDS,
+    snapshot: RepoSnapshot | None = None,
+    query_batch_size: int = DEFAULT_QUERY_BATCH_SIZE,
+    stream_listing: bool = False,
+    run_search_mode: str = DEFAULT_RUN_SEARCH_MODE,
+    large_repo_mb: int | None = None,
+    large_repo_concurrency: int = DEFAULT_LARGE_REPO_CONCURRENCY,
+    ordered: bool = False,
+    only: str | None = None,
+    top: TopRepos | None = None,
 ) -> Iterator[RepoProcessingResult]:
-    """Yield processed repos, parallelizing optional per-repo queries"""
+    """Yield processed repos, parallelizing optional per-repo queries
+
+    Rows come in completion order unless `ordered`; `large_repo_mb` only
+    moves large repos onto their own threads
+    """
     repos = fetch_repos(
         endpoint,
         token,
@@ -2881,61 +7927,103 @@ def iter_repo_processing_results(
         is_site_admin=is_site_admin,
         include_index_failure_fields=include_index_failure_fields,
         max_retries=max_retries,
+        start=checkpoint.resume_position if checkpoint is not None else None,
+        page_observer=checkpoint.page_started if checkpoint is not None else None,
+        listing_shards=listing_shards,
+        stream_listing=stream_listing,
+        only=only,
+        top=top,
     )
-    use_threads = concurrency > 1 and (
-        count_commits or run_search_pattern is not None or skipped_file_reasons
-    )
-    if not use_threads:
-        for index, target, repo in repos:
-            yield collect_repo_processing_result(
-                endpoint,
-                token,
-                index,
-                target,
-                repo,
-                count_commits=count_commits,
-                count_commits_rev=count_commits_rev,
-                run_search_pattern=run_search_pattern,
-                skipped_file_reasons=skipped_file_reasons,
-                max_retries=max_retries,
-            )
-        return
-
-    logger.info("Per-repo query concurrency: %d threads", concurrency)
-    max_pending = concurrency * 2
-    repo_iterator = iter(repos)
-    pending_results: dict[concurrent.futures.Future[RepoProcessingResult], int] = {}
+    if checkpoint is not None and checkpoint.completed_ids:
+        repos = checkpoint.pending(repos)
+    commit_count_batch_size = QueryBatchSize("CommitCount", query_batch_size)
+    run_search_batch_size = QueryBatchSize("RunSearch", query_batch_size)
+    if run_searches and run_search_mode == "global":
+        # Batches are split into --query-batch-size requests further down
+        batch_size = RUN_SEARCH_GLOBAL_CHUNK_SIZE
+    elif count_commits or run_searches:
+        batch_size = query_batch_size
+    else:
+        batch_size = 1
 
-    def submit_repo(
-        executor: concurrent.futures.ThreadPoolExecutor,
-        index: int,
-        target: int,
-        repo: dict[str, Any],
-    ) -> None:
-        future = executor.submit(
-            collect_repo_processing_result,
+    def collect(
+        batch: list[tuple[int, int, dict[str, Any]]],
+    ) -> list[RepoProcessingResult]:
+        return collect_repo_processing_results(
             endpoint,
             token,
-            index,
-            target,
-            repo,
+            batch,
             count_commits=count_commits,
             count_commits_rev=count_commits_rev,
-            run_search_pattern=run_search_pattern,
+            run_searches=run_searches,
             skipped_file_reasons=skipped_file_reasons,
             max_retries=max_retries,
+            commit_count_batch_size=commit_count_batch_size,
+            run_search_batch_size=run_search_batch_size,
+            snapshot=snapshot,
+            run_search_mode=run_search_mode,
+        )
+
+    use_threads = concurrency_limiter.maximum > 1 and (
+        count_commits or run_searches or skipped_file_reasons
+    )
+    if not use_threads:
+        for batch in repo_batches(repos, batch_size):
+            yield from collect(batch)
+        return
+
+    logger.info(
+        "Per-repo query concurrency: %d in flight (adaptive, up to %d)",
+        concurrency_limiter.limit,
+        concurrency_limiter.maximum,
+    )
+    # Each future returns when its batch finished, so --profile can tell how
+    # long finished results sat waiting for the writer
+    pending_results: set[
+        concurrent.futures.Future[tuple[float, list[RepoProcessingResult]]]
+    ] = set()
+
+    def collect_in_slot(
+        batch: list[tuple[int, int, dict[str, Any]]],
+        submitted: float,
+    ) -> tuple[float, list[RepoProcessingResult]]:
+        started = time.monotonic()
+        record_queue_wait("executor", started - submitted)
+        with concurrency_limiter.slot():
+            record_queue_wait("concurrency_slot", time.monotonic() - started)
+            results = collect(batch)
+        return time.monotonic(), results
+
+    if ordered or large_repo_mb is not None:
+        yield from iter_ordered_results(
+            repos,
+            batch_size,
+            large_repo_mb * 1024 * 1024 if large_repo_mb is not None else None,
+            collect,
+            collect_in_slot,
+            ordered=ordered,
+            concurrency_limiter=concurrency_limiter,
+            large_repo_concurrency=large_repo_concurrency,
         )
-        pending_results[future] = index
+        return
+
+    batches = repo_batches(repos, batch_size)
 
     def fill_pending(executor: concurrent.futures.ThreadPoolExecutor) -> None:
-        while len(pending_results) < max_pending:
+        # Queue up to twice the current limit; the limiter's slots decide how
+        # many of those actually run at once
+        while len(pending_results) < concurrency_limiter.limit * 2:
             try:
-                index, target, repo = next(repo_iterator)
+                batch = next(batches)
             except StopIteration:
                 return
-            submit_repo(executor, index, target, repo)
+            pending_results.add(
+                executor.submit(collect_in_slot, batch, time.monotonic()),
+            )
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=concurrency_limiter.maximum,
+    ) as executor:
         fill_pending(executor)
         while pending_results:
             done, _ = concurrent.futures.wait(
@@ -2943,17 +8031,172 @@ def iter_repo_processing_results(
                 return_when=concurrent.futures.FIRST_COMPLETED,
             )
             for future in done:
-                pending_results.pop(future)
-                result = future.result()
-                yield result
+                pending_results.discard(future)
+                finished, results = future.result()
+                record_queue_wait("writer", time.monotonic() - finished)
+                yield from results
                 fill_pending(executor)
 
 
+def iter_ordered_results(
+    repos: Iterable[tuple[int, int, dict[str, Any]]],
+    batch_size: int,
+    large_repo_bytes: int | None,
+    collect: Callable[
+        [list[tuple[int, int, dict[str, Any]]]],
+        list[RepoProcessingResult],
+    ],
+    collect_in_slot: Callable[
+        [list[tuple[int, int, dict[str, Any]]], float],
+        tuple[float, list[RepoProcessingResult]],
+    ],
+    *,
+    ordered: bool,
+    concurrency_limiter: ConcurrencyLimiter,
+    large_repo_concurrency: int,
+) -> Iterator[RepoProcessingResult]:
+    """Yield processed repos, in listing order through a reorder buffer if `ordered`
+
+    With `large_repo_bytes`, repos at least that large run on their own
+    threads so they can't hold every slot: one per request, at most
+    `large_repo_concurrency` at once. With `ordered`, their results take
+    their listing place in the same buffer, and large repos waiting for a
+    thread count against its window, so memory never grows with the number
+    of large repos
+    """
+    # Large repos found while listing wait here, with their listing sequence,
+    # for a free large-repo thread
+    large_backlog: collections.deque[tuple[int, tuple[int, int, dict[str, Any]]]] = (
+        collections.deque()
+    )
+    sequences = itertools.count()
+
+    def sequenced_batches() -> Iterator[
+        tuple[int, list[tuple[int, int, dict[str, Any]]]] | None
+    ]:
+        """Yield numbered small-repo batches, and None after queueing a large repo"""
+        batch: list[tuple[int, int, dict[str, Any]]] = []
+        for item in repos:
+            if (
+                large_repo_bytes is None
+                or estimated_repo_bytes(item[2]) < large_repo_bytes
+            ):
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    yield next(sequences), batch
+                    batch = []
+                continue
+            # Close the batch so the large repo keeps its listing place
+            if batch:
+                yield next(sequences), batch
+                batch = []
+            large_backlog.append((next(sequences), item))
+            yield None
+        if batch:
+            yield next(sequences), batch
+
+    def collect_large(
+        item: tuple[int, int, dict[str, Any]],
+        submitted: float,
+    ) -> tuple[float, list[RepoProcessingResult]]:
+        record_queue_wait("large_repo_executor", time.monotonic() - submitted)
+        return time.monotonic(), collect([item])
+
+    batches = sequenced_batches()
+    small_pending: dict[
+        concurrent.futures.Future[tuple[float, list[RepoProcessingResult]]],
+        int,
+    ] = {}
+    large_pending: dict[
+        concurrent.futures.Future[tuple[float, list[RepoProcessingResult]]],
+        int,
+    ] = {}
+    reorder: ReorderBuffer[tuple[float, list[RepoProcessingResult]]] = ReorderBuffer()
+
+    def fill_pending(
+        small_executor: concurrent.futures.ThreadPoolExecutor,
+        large_executor: concurrent.futures.ThreadPoolExecutor,
+    ) -> None:
+        # Finished batches held for an earlier one and queued large repos
+        # count against the window, so a slow batch or a run of large repos
+        # pauses the listing instead of growing the buffer
+        limit = concurrency_limiter.limit
+        while (
+            len(small_pending) < limit * 2
+            and len(small_pending)
+            + len(large_pending)
+            + len(large_backlog)
+            + len(reorder)
+            < limit * REORDER_BUFFER_BATCHES_PER_SLOT
+        ):
+            try:
+                work = next(batches)
+            except StopIteration:
+                break
+            if work is None:
+                continue
+            sequence, batch = work
+            future = small_executor.submit(collect_in_slot, batch, time.monotonic())
+            small_pending[future] = sequence
+        while large_backlog and len(large_pending) < large_repo_concurrency:
+            sequence, item = large_backlog.popleft()
+            future = large_executor.submit(collect_large, item, time.monotonic())
+            large_pending[future] = sequence
+
+    if large_repo_bytes is not None:
+        logger.info(
+            "Large-repo lane: repos of %d MB or more run %d at a time",
+            large_repo_bytes // (1024 * 1024),
+            large_repo_concurrency,
+        )
+    with (
+        concurrent.futures.ThreadPoolExecutor(
+            max_workers=concurrency_limiter.maximum,
+        ) as small_executor,
+        concurrent.futures.ThreadPoolExecutor(
+            max_workers=large_repo_concurrency,
+        ) as large_executor,
+    ):
+        fill_pending(small_executor, large_executor)
+        while small_pending or large_pending:
+            done, _ = concurrent.futures.wait(
+                [*small_pending, *large_pending],
+                return_when=concurrent.futures.FIRST_COMPLETED,
+            )
+            for future in done:
+                if future in large_pending:
+                    sequence = large_pending.pop(future)
+                else:
+                    sequence = small_pending.pop(future)
+                outcome = future.result()
+                for finished, results in (
+                    reorder.add(sequence, outcome) if ordered else [outcome]
+                ):
+                    record_queue_wait("writer", time.monotonic() - finished)
+                    yield from results
+            fill_pending(small_executor, large_executor)
+
+
+def repo_batches(
+    repos: Iterable[tuple[int, int, dict[str, Any]]],
+    size: int,
+) -> Iterator[list[tuple[int, int, dict[str, Any]]]]:
+    """Group listed repos into lists of up to `size` for aliased queries"""
+    batch: list[tuple[int, int, dict[str, Any]]] = []
+    for item in repos:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
 def write_csv(
-    out: TextIO,
-    cloning_writer: LazyCSVWriter,
-    indexing_writer: LazyCSVWriter,
-    skipped_writer: LazyCSVWriter | None,
+    out: TextIO | LazyColumnarWriter,
+    cloning_writer: LazyCSVWriter | LazyColumnarWriter | None,
+    indexing_writer: LazyCSVWriter | LazyColumnarWriter | None,
+    skipped_writer: LazyCSVWriter | LazyColumnarWriter | None,
     skipped_file_reason_writer: LazyCSVWriter | None,
     endpoint: str,
     token: str,
@@ -2964,30 +8207,78 @@ def write_csv(
     count_commits: bool = False,
     scope_repo: str | None = None,
     count_commits_rev: str = "HEAD",
-    run_search_pattern: str | None = None,
+    run_searches: list[RunSearchPattern] | None = None,
     page_size: int = PAGE_SIZE,
-    concurrency: int = DEFAULT_CONCURRENCY,
+    concurrency_limiter: ConcurrencyLimiter | None = None,
     max_retries: int = DEFAULT_MAX_RETRIES,
     stats: StatsCollector | None = None,
     is_site_admin: bool,
     include_index_failure_fields: bool,
+    checkpoint: RunCheckpoint | None = None,
+    listing_shards: int = DEFAULT_LISTING_SHARDS,
+    snapshot: RepoSnapshot | None = None,
+    query_batch_size: int = DEFAULT_QUERY_BATCH_SIZE,
+    store: SQLiteStore | None = None,
+    stream_listing: bool = False,
+    run_search_mode: str = DEFAULT_RUN_SEARCH_MODE,
+    large_repo_mb: int | None = None,
+    large_repo_concurrency: int = DEFAULT_LARGE_REPO_CONCURRENCY,
+    ordered: bool = False,
+    only: str | None = None,
+    main_columns: list[str] | None = None,
+    top: TopRepos | None = None,
 ) -> tuple[int, int, int]:
-    """Stream repos to CSVs and optionally trigger reclone/reindex mutations"""
-    run_search_enabled = run_search_pattern is not None
+    """Stream repos to CSVs and optionally trigger reclone/reindex mutations
+
+    `out` is the main CSV file, or a LazyColumnarWriter for --output-format
+    parquet/arrow. `main_columns` picks the --columns of the main CSV
+    """
+    run_searches = run_searches or []
     skipped_file_reasons_enabled = skipped_file_reason_writer is not None
-    writer = csv.writer(out)
-    writer.writerow(
-        csv_columns_for(
-            CSV_COLUMNS,
-            count_commits=count_commits,
-            run_search=run_search_enabled,
-        ),
+    writer: Any = out if isinstance(out, LazyColumnarWriter) else csv.writer(out)
+    main_column_indexes = (
+        [CSV_COLUMNS.index(name) for name in main_columns]
+        if main_columns is not None
+        else None
     )
+    columns = csv_columns_for(
+        main_columns if main_columns is not None else CSV_COLUMNS,
+        count_commits=count_commits,
+        run_searches=run_searches,
+    )
+    # A resumed run appends to the main CSV the interrupted run started
+    if not isinstance(out, LazyColumnarWriter) and out.tell() == 0:
+        writer.writerow(columns)
+    lazy_writers = [
+        lazy_writer
+        for lazy_writer in (
+            cloning_writer,
+            indexing_writer,
+            skipped_writer,
+            skipped_file_reason_writer,
+        )
+        if lazy_writer is not None
+    ]
+
+    def save_checkpoint(checkpoint: RunCheckpoint) -> None:
+        out.flush()
+        for lazy_writer in lazy_writers:
+            lazy_writer.flush()
+        if store is not None:
+            store.flush()
+        checkpoint.save()
 
     total = 0
     reclone_total = 0
     reindex_total = 0
-    for result in iter_repo_processing_results(
+    # Main-thread seconds per --profile phase; whatever is left of the loop
+    # (logging, checkpoints) is reported as row_handling
+    phase_seconds: dict[str, float] = dict.fromkeys(
+        ("results_wait", "csv_write", "store_write", "statistics", "mutations"),
+        0.0,
+    )
+    loop_started = mark = time.monotonic()
+    results = iter_repo_processing_results(
         endpoint,
         token,
         max_repos,
@@ -2997,82 +8288,146 @@ def write_csv(
         include_index_failure_fields=include_index_failure_fields,
         count_commits=count_commits,
         count_commits_rev=count_commits_rev,
-        run_search_pattern=run_search_pattern,
+        run_searches=run_searches,
         skipped_file_reasons=skipped_file_reasons_enabled,
-        concurrency=concurrency,
+        concurrency_limiter=(
+            concurrency_limiter
+            if concurrency_limiter is not None
+            else ConcurrencyLimiter(DEFAULT_CONCURRENCY, DEFAULT_CONCURRENCY)
+        ),
         max_retries=max_retries,
-    ):
-        repo = result.repo
-        row = result.row
-        log_processing_result(
-            result,
-            count_commits=count_commits,
-            run_search_pattern=run_search_pattern,
-        )
-        writer.writerow(
-            append_processing_result_columns(
-                row,
+        checkpoint=checkpoint,
+        listing_shards=listing_shards,
+        snapshot=snapshot,
+        query_batch_size=query_batch_size,
+        stream_listing=stream_listing,
+        run_search_mode=run_search_mode,
+        large_repo_mb=large_repo_mb,
+        large_repo_concurrency=large_repo_concurrency,
+        ordered=ordered,
+        only=only,
+        top=top,
+    )
+    if top is not None and not top.from_listing:
+        results = top_processing_results(results, top)
+    try:
+        for result in results:
+            now = time.monotonic()
+            phase_seconds["results_wait"] += now - mark
+            mark = now
+            repo = result.repo
+            projected = result.projected
+            row = projected.row
+            log_processing_result(
                 result,
                 count_commits=count_commits,
-                run_search=run_search_enabled,
-            ),
-        )
-        total += 1
-        if stats is not None:
-            stats.add(repo)
-        repo_has_cloning_error = has_cloning_error(repo)
-        repo_has_indexing_error = has_indexing_error(repo)
-        if repo_has_cloning_error:
-            cloning_writer.writerow(
-                append_processing_result_columns(
-                    row
-                    + [
-                        extract(repo)
-                        for _, extract, _, _, _ in CLONING_ERROR_EXTRA_COLUMNS
-                    ],
-                    result,
-                    count_commits=count_commits,
-                    run_search=run_search_enabled,
-                ),
-            )
-        # In single-repo (scope_repo) mode the user explicitly asked for
-        # this repo, so trigger the mutation regardless of error state. In
-        # full-repo mode keep the existing "only fix repos with errors"
-        # guard so a blanket --reclone doesn't reclone the whole instance
-        if reclone and (scope_repo is not None or repo_has_cloning_error):
-            if trigger_reclone(endpoint, token, repo["id"], max_retries=max_retries):
-                reclone_total += 1
-        if repo_has_indexing_error:
-            indexing_writer.writerow(
-                append_processing_result_columns(
-                    row,
-                    result,
-                    count_commits=count_commits,
-                    run_search=run_search_enabled,
-                ),
+                run_searches=run_searches,
             )
-        if reindex and (scope_repo is not None or repo_has_indexing_error):
-            if trigger_reindex(endpoint, token, repo["id"], max_retries=max_retries):
-                reindex_total += 1
-        if skipped_writer is not None and has_skipped_files(repo):
-            skipped_writer.writerow(
-                append_processing_result_columns(
+            now = time.monotonic()
+            main_row = append_processing_result_columns(
+                (
                     row
-                    + [
-                        extract(repo)
-                        for _, extract, _, _, _ in SKIPPED_FILES_EXTRA_COLUMNS
-                    ],
-                    result,
-                    count_commits=count_commits,
-                    run_search=run_search_enabled,
+                    if main_column_indexes is None
+                    else [row[index] for index in main_column_indexes]
                 ),
+                result,
+                count_commits=count_commits,
             )
-        if skipped_file_reason_writer is not None:
-            write_skipped_file_reason_rows(
-                skipped_file_reason_writer,
-                endpoint,
-                result.skipped_file_reason_search_results,
-            )
+            writer.writerow(main_row)
+            phase_seconds["csv_write"] += time.monotonic() - now
+            if store is not None:
+                now = time.monotonic()
+                store.add(
+                    result,
+                    main_row,
+                    columns,
+                    run_searches=run_searches,
+                )
+                phase_seconds["store_write"] += time.monotonic() - now
+            total += 1
+            if stats is not None:
+                now = time.monotonic()
+                stats.add(projected)
+                phase_seconds["statistics"] += time.monotonic() - now
+            repo_has_cloning_error = projected.has_cloning_error
+            repo_has_indexing_error = projected.has_indexing_error
+            now = time.monotonic()
+            if cloning_writer is not None and projected.cloning_error_cells is not None:
+                cloning_writer.writerow(
+                    append_processing_result_columns(
+                        row + projected.cloning_error_cells,
+                        result,
+                        count_commits=count_commits,
+                    ),
+                )
+            phase_seconds["csv_write"] += time.monotonic() - now
+            # In single-repo (scope_repo) mode the user explicitly asked for
+            # this repo, so trigger the mutation regardless of error state. In
+            # full-repo mode keep the existing "only fix repos with errors"
+            # guard so a blanket --reclone doesn't reclone the whole instance
+            if reclone and (scope_repo is not None or repo_has_cloning_error):
+                now = time.monotonic()
+                if trigger_reclone(
+                    endpoint,
+                    token,
+                    repo["id"],
+                    max_retries=max_retries,
+                ):
+                    reclone_total += 1
+                phase_seconds["mutations"] += time.monotonic() - now
+            now = time.monotonic()
+            if indexing_writer is not None and repo_has_indexing_error:
+                indexing_writer.writerow(
+                    append_processing_result_columns(
+                        row,
+                        result,
+                        count_commits=count_commits,
+                    ),
+                )
+            phase_seconds["csv_write"] += time.monotonic() - now
+            if reindex and (scope_repo is not None or repo_has_indexing_error):
+                now = time.monotonic()
+                if trigger_reindex(
+                    endpoint,
+                    token,
+                    repo["id"],
+                    max_retries=max_retries,
+                ):
+                    reindex_total += 1
+                phase_seconds["mutations"] += time.monotonic() - now
+            now = time.monotonic()
+            if skipped_writer is not None and projected.skipped_files_cells is not None:
+                skipped_writer.writerow(
+                    append_processing_result_columns(
+                        row + projected.skipped_files_cells,
+                        result,
+                        count_commits=count_commits,
+                    ),
+                )
+            if skipped_file_reason_writer is not None:
+                write_skipped_file_reason_rows(
+                    skipped_file_reason_writer,
+                    endpoint,
+                    result.skipped_file_reason_search_results,
+                )
+            phase_seconds["csv_write"] += time.monotonic() - now
+            if checkpoint is not None:
+                checkpoint.mark_written(result.index, str(repo["id"]))
+                if checkpoint.save_due():
+                    save_checkpoint(checkpoint)
+            mark = time.monotonic()
+        phase_seconds["results_wait"] += time.monotonic() - mark
+        if checkpoint is not None:
+            save_checkpoint(checkpoint)
+    finally:
+        loop_seconds = time.monotonic() - loop_started
+        phase_seconds["row_handling"] = loop_seconds - sum(phase_seconds.values())
+        for name, seconds in phase_seconds.items():
+            # Features that are off this run never accumulate any time
+            if seconds:
+                record_phase(name, seconds)
+        if _run_profile is not None:
+            _run_profile.repos_written += total
     return (total, reclone_total, reindex_total)
 
 
@@ -3195,6 +8550,19 @@ def positive_int(value: str) -> int:
     return n
 
 
+def positive_float(value: str) -> float:
+    """argparse type for numbers > 0"""
+    try:
+        n = float(value)
+    except ValueError:
+        msg = f"must be a number, got {value!r}"
+        raise argparse.ArgumentTypeError(msg) from None
+    if not n > 0:
+        msg = f"must be a positive number (>0), got {value}"
+        raise argparse.ArgumentTypeError(msg)
+    return n
+
+
 def non_negative_int(value: str) -> int:
     """argparse type for integers >= 0"""
     try:
@@ -3208,6 +8576,22 @@ def non_negative_int(value: str) -> int:
     return n
 
 
+def parse_column_list(value: str) -> list[str]:
+    """argparse type for --columns: comma-separated main CSV column names"""
+    columns = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in columns if name not in CSV_COLUMNS]
+    if unknown:
+        msg = (
+            f"unknown column(s) {', '.join(unknown)}; choose from the repos "
+            "CSV columns in CSV_SCHEMA.md"
+        )
+        raise argparse.ArgumentTypeError(msg)
+    if not columns:
+        msg = "needs at least one column"
+        raise argparse.ArgumentTypeError(msg)
+    return list(dict.fromkeys(columns))
+
+
 def parse_args(argv: list[str]) -> argparse.Namespace:
     """Parse command-line arguments into a Namespace"""
     parser = argparse.ArgumentParser(
@@ -3237,6 +8621,14 @@ def parse_args(argv: list[str]) -> argparse.Namespace:
         action="store_true",
         help="Write statistics CSV files",
     )
+    parser.add_argument(
+        "--statistics-sketch",
+        action="store_true",
+        help=(
+            "Like --statistics, but compute percentiles from a fixed-memory\n"
+            "log-bucket histogram (within 1%%) instead of keeping every value"
+        ),
+    )
     parser.add_argument(
         "--count-commits",
         nargs="?",
@@ -3270,7 +8662,106 @@ def parse_args(argv: list[str]) -> argparse.Namespace:
         "--run-search",
         metavar="PATTERN",
         default=None,
-        help=("Run PATTERN once per repo and append result columns"),
+        help=(
+            "Run PATTERN once per repo and append result columns; see "
+            "--run-search-file for several patterns"
+        ),
+    )
+    parser.add_argument(
+        "--run-search-file",
+        metavar="PATH",
+        type=Path,
+        default=None,
+        help=(
+            "Run every NAME=PATTERN line of PATH once per repo in the same "
+            "pass and append one block of runSearch.NAME.* columns per "
+            "pattern\n"
+            "Blank lines and lines starting with # are skipped"
+        ),
+    )
+    parser.add_argument(
+        "--run-search-mode",
+        choices=RUN_SEARCH_MODES,
+        default=DEFAULT_RUN_SEARCH_MODE,
+        help=(
+            "per-repo (default) sends one anchored search per repo\n"
+            "global first runs each pattern with select:repo over chunks of "
+            f"{RUN_SEARCH_GLOBAL_CHUNK_SIZE} listed repos, then searches only "
+            "the repos it returned; the rest get matchCount 0 and a blank "
+            "queryTimeSeconds. Much faster when few repos match"
+        ),
+    )
+    parser.add_argument(
+        "--search-api",
+        choices=SEARCH_API_CHOICES,
+        default=DEFAULT_SEARCH_API,
+        help=(
+            "API for --skipped-files-reason and per-repo --run-search searches "
+            f"(default {DEFAULT_SEARCH_API})\n"
+            "stream reads /.api/search/stream as results arrive, logs progress, "
+            "and stops a skipped-file search once skippedIndexed.count files "
+            "arrived; file.byteSize is blank and --run-search requests are not "
+            "batched"
+        ),
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=tuple(OUTPUT_FORMAT_SUFFIXES),
+        default=DEFAULT_OUTPUT_FORMAT,
+        help=(
+            "File format for the repos listing and the cloning-errors, "
+            "indexing-errors, and skipped-files files "
+            f"(default {DEFAULT_OUTPUT_FORMAT})\n"
+            "parquet and arrow write typed, zstd-compressed columns from the "
+            "types in CSV_SCHEMA.md and need pyarrow "
+            "(`uv run --with pyarrow list-repos.py ...`)"
+        ),
+    )
+    parser.add_argument(
+        "--store",
+        metavar="sqlite:PATH",
+        default=None,
+        help=(
+            "Also record this run in a SQLite history database, one run per "
+            "listing, for comparing runs with --store-report or plain SQL"
+        ),
+    )
+    parser.add_argument(
+        "--store-report",
+        choices=tuple(STORE_REPORTS),
+        default=None,
+        help=(
+            "Print a built-in query over the --store database as CSV and exit; "
+            "no network required\n"
+            + "\n".join(
+                f"{name}: {description}"
+                for name, (description, _) in STORE_REPORTS.items()
+            )
+        ),
+    )
+    parser.add_argument(
+        "--store-runs",
+        nargs=2,
+        type=positive_int,
+        metavar=("OLD", "NEW"),
+        default=None,
+        help=(
+            "Run IDs for --store-report to compare (default: the two newest "
+            "finished runs of the same endpoint)"
+        ),
+    )
+    parser.add_argument(
+        "--since-snapshot",
+        metavar="CSV",
+        default=None,
+        help=(
+            "Reuse --count-commits and --run-search columns from a previous "
+            "<prefix>-repos.csv for repos whose mirrorInfo.lastChanged (and, "
+            "for --run-search, textSearchIndex.status.updatedAt) did not "
+            "change; only changed or new repos are queried\n"
+            "Use the same --count-commits REV and --run-search PATTERN as the "
+            "snapshot run"
+        ),
     )
     parser.add_argument(
         "--reclone",
@@ -3294,6 +8785,16 @@ def parse_args(argv: list[str]) -> argparse.Namespace:
             "Without REPO: reindex all repos with indexing errors"
         ),
     )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help=(
+            f"Continue an interrupted run from its <prefix>-{DEFAULT_CHECKPOINT_FILE} "
+            "journal: restart the listing from the last checkpointed cursor, "
+            "skip repos already written, and append to the existing CSVs\n"
+            "Requires the same flags as the interrupted run"
+        ),
+    )
     parser.add_argument(
         "--page-size",
         type=positive_int,
@@ -3304,6 +8805,28 @@ def parse_args(argv: list[str]) -> argparse.Namespace:
             f"(default {PAGE_SIZE}; reduced automatically if rejected)"
         ),
     )
+    parser.add_argument(
+        "--listing-shards",
+        type=positive_int,
+        default=DEFAULT_LISTING_SHARDS,
+        metavar="int",
+        help=(
+            "Split the repository listing into <int> disjoint shards and "
+            f"page through them concurrently (default {DEFAULT_LISTING_SHARDS}: "
+            "one serial cursor chain)\n"
+            "Shard boundaries come from a quick ID-only pass over the listing; "
+            "repos are written in merged shard order"
+        ),
+    )
+    parser.add_argument(
+        "--stream-listing",
+        action="store_true",
+        help=(
+            "Decode listing pages one repository at a time from a spooled "
+            "response instead of all at once\n"
+            "Keeps peak memory flat, so --page-size can be raised"
+        ),
+    )
     parser.add_argument(
         "--concurrency",
         type=positive_int,
@@ -3311,7 +8834,133 @@ def parse_args(argv: list[str]) -> argparse.Namespace:
         metavar="int",
         help=(
             "Concurrent per-repo query threads for --count-commits and "
-            f"--run-search (default {DEFAULT_CONCURRENCY})"
+            f"--run-search (default {DEFAULT_CONCURRENCY})\n"
+            "This is the starting limit: it halves when the instance answers "
+            "429/502/503/504 or deadline-exceeded errors, and grows back while "
+            "query latency stays flat"
+        ),
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=positive_int,
+        default=None,
+        metavar="int",
+        help=(
+            "Let the adaptive per-repo concurrency limit grow past "
+            "--concurrency, up to this many in-flight queries "
+            "(default: --concurrency)"
+        ),
+    )
+    parser.add_argument(
+        "--large-repo-mb",
+        type=positive_int,
+        default=None,
+        metavar="int",
+        help=(
+            "Query repos whose git or indexed content size is at least <int> "
+            "MB one at a time on separate threads, so a cluster of monorepos "
+            "can't take every --concurrency slot\n"
+            "Rows are still written as they finish, or in listing order with "
+            "--ordered"
+        ),
+    )
+    parser.add_argument(
+        "--large-repo-concurrency",
+        type=positive_int,
+        default=DEFAULT_LARGE_REPO_CONCURRENCY,
+        metavar="int",
+        help=(
+            "Large repos queried at once with --large-repo-mb, on top of "
+            f"--concurrency (default {DEFAULT_LARGE_REPO_CONCURRENCY})"
+        ),
+    )
+    parser.add_argument(
+        "--ordered",
+        action="store_true",
+        help=(
+            "Write rows in listing order rather than as per-repo queries "
+            "finish, so repeated runs diff cleanly\n"
+            "Finished batches wait in a buffer bounded by --concurrency; a "
+            "slow batch pauses new queries until it finishes"
+        ),
+    )
+    parser.add_argument(
+        "--columns",
+        type=parse_column_list,
+        metavar="NAME,...",
+        help=(
+            "Write only these repos CSV columns, in this order, and fetch "
+            "only the GraphQL fields they need. Lighter pages start at a "
+            f"larger --page-size (up to {MAX_COLUMNS_PAGE_SIZE}). The error "
+            "and skipped-files CSVs are not written\n"
+            "e.g. url,mirrorInfo.status,mirrorInfo.byteSize(MB)"
+        ),
+    )
+    parser.add_argument(
+        "--top",
+        type=positive_int,
+        metavar="N",
+        help=(
+            "Write only the N repos with the largest --by value, largest "
+            "first. Outputs are prefixed <endpoint>-top-<N>-<column>\n"
+            "Per-repo queries run only for those N, unless --by is one of "
+            "their own columns"
+        ),
+    )
+    parser.add_argument(
+        "--by",
+        choices=TOP_BY_COLUMNS,
+        metavar="COLUMN",
+        help=(
+            f"Column --top ranks by (default {DEFAULT_TOP_BY}, which the "
+            "instance sorts itself): a numeric repos CSV column, a "
+            "--count-commits column, or runSearch.matchCount / "
+            "runSearch.queryTimeSeconds with one --run-search"
+        ),
+    )
+    parser.add_argument(
+        "--only",
+        choices=list(LISTING_FILTERS),
+        help=(
+            "List only repos in this state, filtered by Sourcegraph rather "
+            "than after fetching every repo. Outputs are prefixed "
+            "<endpoint>-only-<mode>\n"
+            "cloning-errors: failed fetches, corrupted, or not cloned\n"
+            "indexing-errors: cloned but with no search index\n"
+            "not-cloned, not-indexed, corrupted: that state alone"
+        ),
+    )
+    parser.add_argument(
+        "--query-batch-size",
+        type=positive_int,
+        default=DEFAULT_QUERY_BATCH_SIZE,
+        metavar="int",
+        help=(
+            "Repos per aliased --count-commits / --run-search GraphQL request "
+            f"(default {DEFAULT_QUERY_BATCH_SIZE})\n"
+            "Shrinks automatically on GraphQL field-count errors; use 1 for "
+            "one request, and an exact per-repo queryTimeSeconds, per repo"
+        ),
+    )
+    parser.add_argument(
+        "--max-rps",
+        type=positive_float,
+        default=None,
+        metavar="float",
+        help=(
+            "Cap GraphQL requests per second across every thread: listing, "
+            "per-repo queries, and reclone/reindex mutations "
+            "(default: unlimited)"
+        ),
+    )
+    parser.add_argument(
+        "--burst",
+        type=positive_int,
+        default=DEFAULT_RATE_LIMIT_BURST,
+        metavar="int",
+        help=(
+            "Requests --max-rps lets through back to back after an idle "
+            f"period (default {DEFAULT_RATE_LIMIT_BURST})"
         ),
     )
     parser.add_argument(
@@ -3324,6 +8973,87 @@ def parse_args(argv: list[str]) -> argparse.Namespace:
             f"(default {DEFAULT_MAX_RETRIES}; backoff 1s, 2s, 4s, ...)"
         ),
     )
+    parser.add_argument(
+        "--capability-cache-ttl",
+        type=non_negative_int,
+        default=DEFAULT_CAPABILITY_CACHE_TTL_SECONDS,
+        metavar="seconds",
+        help=(
+            "Reuse the current-user and schema probes of an earlier run "
+            "against the same endpoint, token, and instance version for this "
+            f"long (default {DEFAULT_CAPABILITY_CACHE_TTL_SECONDS}; 0 turns "
+            "the cache off)\n"
+            f"On by default: cached in {CAPABILITY_CACHE_FILE} under "
+            "--cache-dir (~/.cache/list-repos unless set), and every run sends "
+            "an unauthenticated GET of /__version to key the cache by instance "
+            "version"
+        ),
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        metavar="DIR",
+        help=(
+            "Directory for the capability and --count-commits caches "
+            "(default $XDG_CACHE_HOME/list-repos or ~/.cache/list-repos)\n"
+            f"{COMMIT_COUNT_CACHE_FILE} keeps exact commit counts per repo and "
+            "commit OID, so repos whose rev has not moved skip the ancestor "
+            f"walk; it keeps the {COMMIT_COUNT_CACHE_MAX_ENTRIES} most recently "
+            "used counts"
+        ),
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Neither read nor write the capability and --count-commits caches",
+    )
+    parser.add_argument(
+        "--record",
+        type=Path,
+        metavar="DIR",
+        help=(
+            "Also append every GraphQL response to a compressed archive in "
+            "DIR, for --replay\n"
+            "Implies --no-cache, so the archive holds every request a run sends"
+        ),
+    )
+    parser.add_argument(
+        "--replay",
+        type=Path,
+        metavar="DIR",
+        help=(
+            "Answer GraphQL requests from a --record DIR instead of the "
+            "instance, to rebuild CSVs and stats offline\n"
+            "Needs no credentials. Pass the query flags of the recorded run; "
+            "output-only flags such as --statistics, --ordered, or --store "
+            "may differ"
+        ),
+    )
+    parser.add_argument(
+        "--transport",
+        choices=TRANSPORT_CHOICES,
+        default=DEFAULT_TRANSPORT,
+        help=(
+            "HTTP transport for GraphQL requests (default "
+            f"{DEFAULT_TRANSPORT})\n"
+            "sync: one connection per request\n"
+            "async: asyncio keep-alive connection pool shared by the listing "
+            "and per-repo queries; avoids a TLS handshake per request"
+        ),
+    )
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        default=None,
+        metavar="PATH",
+        help=(
+            "When the run ends, write where it spent its time to PATH: "
+            "main-thread phases, per-operation GraphQL latency histograms, "
+            "retries by reason, bytes sent/received, and pipeline queue waits\n"
+            "JSON, or the Prometheus textfile format when PATH ends in "
+            f"{PROFILE_PROMETHEUS_SUFFIX}"
+        ),
+    )
     parser.add_argument(
         "--write-csv-schema",
         action="store_true",
@@ -3383,8 +9113,25 @@ def collect_scope(args: argparse.Namespace) -> tuple[str, str] | None:
     return repo_name, rev
 
 
+def collect_run_searches(args: argparse.Namespace) -> list[RunSearchPattern]:
+    """Return the --run-search or --run-search-file patterns, if any"""
+    if args.run_search is not None and args.run_search_file is not None:
+        die("--run-search and --run-search-file cannot be used together")
+    if args.run_search_file is not None:
+        return load_run_search_patterns(args.run_search_file)
+    if args.run_search is not None:
+        return [RunSearchPattern("", args.run_search)]
+    return []
+
+
+def max_concurrency(args: argparse.Namespace) -> int:
+    """Return the ceiling for the adaptive per-repo concurrency limit"""
+    return args.max_concurrency or args.concurrency
+
+
 def run(args: argparse.Namespace, endpoint: str, token: str) -> None:
     """Confirm the connection, then stream every repo to the CSV file"""
+    started = time.monotonic()
     logger.info(
         "Retry policy: %d retries per GraphQL request (backoff: 1s, 2s, 4s, ...)",
         args.max_retries,
@@ -3397,6 +9144,69 @@ def run(args: argparse.Namespace, endpoint: str, token: str) -> None:
             REQUEST_TIMEOUT_SECONDS_WITH_COMMIT_COUNT,
         )
     scope = collect_scope(args)
+    run_searches = collect_run_searches(args)
+    if args.run_search_mode == "global":
+        if not run_searches:
+            logger.warning(
+                "Ignoring --run-search-mode global: it needs --run-search or "
+                "--run-search-file",
+            )
+        elif any(_SELECT_FILTER_RE.search(pattern.pattern) for pattern in run_searches):
+            die(
+                "--run-search-mode global adds select:repo; remove select: from patterns"
+            )
+    large_repo_mb = args.large_repo_mb
+    if large_repo_mb is not None and not (
+        args.count_commits or run_searches or args.skipped_files_reason is True
+    ):
+        logger.warning(
+            "Ignoring --large-repo-mb: it only schedules --count-commits, "
+            "--run-search, and --skipped-files-reason queries",
+        )
+        large_repo_mb = None
+    if args.ordered and args.listing_shards > 1:
+        logger.warning(
+            "--ordered follows the listing as merged from --listing-shards, "
+            "which can differ between runs",
+        )
+    only = args.only
+    if only is not None and scope is not None:
+        logger.warning("Ignoring --only: scoped runs fetch a single repository")
+        only = None
+    elif only is not None and args.listing_shards > 1:
+        logger.warning(
+            "Ignoring --listing-shards: --only walks the filtered listing serially",
+        )
+    top: TopRepos | None = None
+    max_repos = args.limit
+    if args.top is not None and scope is not None:
+        logger.warning("Ignoring --top: scoped runs fetch a single repository")
+    elif args.top is not None:
+        top = TopRepos(args.top, args.by or DEFAULT_TOP_BY)
+        if top.column.startswith("runSearch."):
+            if args.run_search is None:
+                die(f"--by {top.column} needs a single --run-search pattern")
+        elif not top.from_listing and not args.count_commits:
+            die(f"--by {top.column} needs --count-commits")
+        if max_repos is not None:
+            logger.warning("Ignoring --limit: --top already bounds the run")
+            max_repos = None
+    elif args.by is not None:
+        logger.warning("Ignoring --by: it ranks repos for --top")
+    main_columns: list[str] | None = args.columns
+    skipped_files = args.skipped_files
+    if main_columns is not None and skipped_files:
+        logger.warning(
+            "Ignoring --skipped-files: its CSV carries every column; drop "
+            "--columns to write it",
+        )
+        skipped_files = False
+    if len(run_searches) > 1:
+        logger.info(
+            "--run-search-file: %d patterns per repo (%s)",
+            len(run_searches),
+            ", ".join(pattern.name for pattern in run_searches),
+        )
     if scope is not None:
         scope_repo, scope_rev = scope
         logger.info(
@@ -3456,11 +9266,29 @@ def run(args: argparse.Namespace, endpoint: str, token: str) -> None:
                 ("--reindex", args.reindex),
                 ("--limit", args.limit is not None),
                 ("--page-size", args.page_size != PAGE_SIZE),
+                ("--listing-shards", args.listing_shards != DEFAULT_LISTING_SHARDS),
+                ("--stream-listing", args.stream_listing),
                 ("--concurrency", args.concurrency != DEFAULT_CONCURRENCY),
+                (
+                    "--query-batch-size",
+                    args.query_batch_size != DEFAULT_QUERY_BATCH_SIZE,
+                ),
                 ("--skipped-files", args.skipped_files),
                 ("--count-commits", args.count_commits),
                 ("--run-search", args.run_search is not None),
-                ("--statistics", args.statistics),
+                ("--run-search-file", args.run_search_file is not None),
+                (
+                    "--run-search-mode",
+                    args.run_search_mode != DEFAULT_RUN_SEARCH_MODE,
+                ),
+                ("--large-repo-mb", args.large_repo_mb is not None),
+                ("--ordered", args.ordered),
+                ("--only", args.only is not None),
+                ("--columns", args.columns is not None),
+                ("--top", args.top is not None),
+                ("--statistics", args.statistics or args.statistics_sketch),
+                ("--since-snapshot", args.since_snapshot is not None),
+                ("--store", args.store is not None),
             )
             if set_
         ]
@@ -3470,12 +9298,15 @@ def run(args: argparse.Namespace, endpoint: str, token: str) -> None:
                 "query and does not iterate the repo list",
                 ", ".join(ignored),
             )
+        record_phase("setup", time.monotonic() - started)
+        started = time.monotonic()
         write_skipped_files_reason(
             endpoint,
             token,
             args.skipped_files_reason,
             max_retries=args.max_retries,
         )
+        record_phase("skipped_files_reason", time.monotonic() - started)
         return
 
     include_index_failure_fields = supports_text_search_index_failure_fields(
@@ -3483,6 +9314,49 @@ def run(args: argparse.Namespace, endpoint: str, token: str) -> None:
         token,
         max_retries=args.max_retries,
     )
+    page_size = args.page_size
+    node_fields: frozenset[str] | None = None
+    if main_columns is not None:
+        # Fields the selected columns do not read but this run still needs
+        required: list[str] = []
+        if (
+            args.reclone
+            or args.reindex
+            or args.statistics
+            or args.statistics_sketch
+            or large_repo_mb is not None
+        ):
+            required += PROJECTED_REPO_FIELDS
+        if args.since_snapshot is not None:
+            required += RUN_SEARCH_SNAPSHOT_KEYS
+        if args.skipped_files_reason is True:
+            required += SKIPPED_INDEXED_FIELDS
+        if top is not None and top.from_listing:
+            required.append(TOP_LISTING_COLUMNS[top.column].path)
+        node_fields = repo_node_fields(main_columns, required)
+        if page_size == PAGE_SIZE:
+            page_size = columns_page_size(node_fields)
+        logger.info(
+            "--columns: listing %d repo field(s) per node, page size %d; only "
+            "the main CSV is written",
+            len(node_fields),
+            page_size,
+        )
+    max_page_size = cached_max_page_size()
+    # The cached limit was learned from full repo nodes, and an explicit
+    # --page-size is the user's to lower
+    if (
+        node_fields is None
+        and args.page_size == PAGE_SIZE
+        and max_page_size is not None
+        and max_page_size < page_size
+    ):
+        logger.info(
+            "Starting at listing page size %d, which an earlier run settled "
+            "on after this instance rejected larger pages",
+            max_page_size,
+        )
+        page_size = max_page_size
 
     # Prefix outputs with endpoint, plus scoped repo/rev when applicable
     endpoint_sanitized = sanitize_endpoint_for_filename(endpoint)
@@ -3492,60 +9366,189 @@ def run(args: argparse.Namespace, endpoint: str, token: str) -> None:
         if args.count_commits and scope_rev != "HEAD":
             scope_suffix = f"{scope_suffix}-{sanitize_for_filename(scope_rev)}"
         prefix = f"{endpoint_sanitized}-{scope_suffix}"
+    elif only is not None:
+        prefix = f"{endpoint_sanitized}-only-{only}"
     else:
         prefix = endpoint_sanitized
-    output_path = Path(f"{prefix}-{DEFAULT_OUTPUT_FILE}")
-    cloning_errors_path = Path(f"{prefix}-{DEFAULT_CLONING_ERRORS_FILE}")
-    indexing_errors_path = Path(f"{prefix}-{DEFAULT_INDEXING_ERRORS_FILE}")
+    if top is not None:
+        prefix = f"{prefix}-top-{top.count}-{sanitize_for_filename(top.column)}"
+    output_format: str = args.output_format
+    suffix = OUTPUT_FORMAT_SUFFIXES[output_format]
+    if output_format != "csv":
+        # Fail before the listing starts, not when the first file is written
+        import_pyarrow()
+    output_path = Path(f"{prefix}-{DEFAULT_OUTPUT_FILE}").with_suffix(suffix)
+    cloning_errors_path = Path(
+        f"{prefix}-{DEFAULT_CLONING_ERRORS_FILE}",
+    ).with_suffix(suffix)
+    indexing_errors_path = Path(
+        f"{prefix}-{DEFAULT_INDEXING_ERRORS_FILE}",
+    ).with_suffix(suffix)
     skipped_files_path = (
-        Path(f"{prefix}-{DEFAULT_SKIPPED_FILES_FILE}") if args.skipped_files else None
+        Path(f"{prefix}-{DEFAULT_SKIPPED_FILES_FILE}").with_suffix(suffix)
+        if skipped_files
+        else None
     )
     skipped_file_reasons_path = (
         Path(f"{prefix}-{DEFAULT_SKIPPED_FILE_REASONS_FILE}")
         if args.skipped_files_reason is True
         else None
     )
+    # Read the snapshot before the output CSVs are truncated: it is often the
+    # previous run's copy of the very file this run is about to rewrite
+    snapshot: RepoSnapshot | None = None
+    if args.since_snapshot is not None:
+        if not (args.count_commits or run_searches):
+            logger.warning(
+                "Ignoring --since-snapshot: it only reuses --count-commits "
+                "and --run-search results",
+            )
+        else:
+            snapshot = RepoSnapshot(Path(args.since_snapshot), run_searches)
+            logger.info(
+                "Loaded %d repos from snapshot %s (commit counts: %s, run-search: %s)",
+                len(snapshot),
+                args.since_snapshot,
+                "yes" if snapshot.has_commit_counts else "no",
+                (
+                    ("yes" if snapshot.run_search_names else "no")
+                    if len(run_searches) <= 1
+                    else f"{len(snapshot.run_search_names)}/{len(run_searches)} "
+                    "patterns"
+                ),
+            )
+
+    output_paths = [
+        path
+        for path in (
+            output_path,
+            cloning_errors_path,
+            indexing_errors_path,
+            skipped_files_path,
+            skipped_file_reasons_path,
+        )
+        if path is not None
+    ]
+
+    # Scoped runs are a single request; only full listings keep a journal.
+    # Parquet and Arrow files end in a footer, so they cannot be appended to
+    checkpoint: RunCheckpoint | None = None
+    checkpoint_path = Path(f"{prefix}-{DEFAULT_CHECKPOINT_FILE}")
+    if args.resume and output_format != "csv":
+        die(f"--resume needs --output-format csv, not {output_format}")
+    run_options = {
+        "countCommits": bool(args.count_commits),
+        "limit": max_repos,
+        "runSearch": (
+            {pattern.name: pattern.pattern for pattern in run_searches}
+            if args.run_search_file is not None
+            else args.run_search
+        ),
+        "skippedFiles": bool(skipped_files),
+        "skippedFilesReason": args.skipped_files_reason is True,
+        "only": only,
+        "columns": main_columns,
+    }
+    # --top runs are bounded, and their rows do not follow the listing
+    if scope_repo is None and output_format == "csv" and top is None:
+        checkpoint = RunCheckpoint(checkpoint_path, run_options, output_paths)
+        if args.resume:
+            if checkpoint.load():
+                logger.info(
+                    "Resuming from %s: %d repos already written; listing "
+                    "restarts after repo %d",
+                    checkpoint_path.name,
+                    len(checkpoint.completed_ids),
+                    checkpoint.resume_position.index,
+                )
+                if args.statistics or args.statistics_sketch:
+                    logger.warning(
+                        "--statistics only counts repos processed after "
+                        "resuming; rerun without --resume for full statistics",
+                    )
+            else:
+                logger.info(
+                    "--resume: no %s found; starting a full run",
+                    checkpoint_path.name,
+                )
+    elif args.resume and top is not None:
+        logger.warning("Ignoring --resume: --top runs start over")
+    elif args.resume:
+        logger.warning("Ignoring --resume: scoped runs fetch a single repository")
+    resumed = checkpoint is not None and checkpoint.resumed
+
+    store: SQLiteStore | None = None
+    if args.store is not None and (
+        scope_repo is not None or only is not None or top is not None
+    ):
+        logger.warning("Ignoring --store: only full listings are stored")
+    elif args.store is not None and main_columns is not None:
+        logger.warning("Ignoring --store: it records every column")
+    elif args.store is not None:
+        store = SQLiteStore(
+            store_path(args.store),
+            endpoint,
+            run_options,
+            resume=resumed,
+        )
+        logger.info("Storing run %d in %s", store.run_id, store.path)
+
     # Remove stale optional outputs; LazyCSVWriter recreates only non-empty ones
-    cloning_errors_path.unlink(missing_ok=True)
-    indexing_errors_path.unlink(missing_ok=True)
-    if skipped_files_path is not None:
-        skipped_files_path.unlink(missing_ok=True)
-    if skipped_file_reasons_path is not None:
-        skipped_file_reasons_path.unlink(missing_ok=True)
+    if not resumed:
+        checkpoint_path.unlink(missing_ok=True)
+        for path in output_paths[1:]:
+            path.unlink(missing_ok=True)
     # Clear stale stats outputs even when --statistics is not enabled this run
     for suffix, *_ in STATS_FILES:
         Path(f"{prefix}-{DEFAULT_STATS_FILE_PREFIX}-{suffix}.csv").unlink(
             missing_ok=True,
         )
 
-    stats = StatsCollector() if args.statistics else None
+    stats = (
+        StatsCollector(sketch=args.statistics_sketch)
+        if args.statistics or args.statistics_sketch
+        else None
+    )
     count_commits_enabled = bool(args.count_commits)
-    run_search_pattern: str | None = args.run_search
-    run_search_enabled = run_search_pattern is not None
-    cloning_writer = LazyCSVWriter(
-        cloning_errors_path,
-        csv_columns_for(
-            CLONING_ERROR_CSV_COLUMNS,
-            count_commits=count_commits_enabled,
-            run_search=run_search_enabled,
-        ),
+    # The error CSVs carry every column, so --columns leaves them out
+    cloning_writer = (
+        open_repo_writer(
+            cloning_errors_path,
+            csv_columns_for(
+                CLONING_ERROR_CSV_COLUMNS,
+                count_commits=count_commits_enabled,
+                run_searches=run_searches,
+            ),
+            output_format,
+            append=resumed,
+        )
+        if main_columns is None
+        else None
     )
-    indexing_writer = LazyCSVWriter(
-        indexing_errors_path,
-        csv_columns_for(
-            CSV_COLUMNS,
-            count_commits=count_commits_enabled,
-            run_search=run_search_enabled,
-        ),
+    indexing_writer = (
+        open_repo_writer(
+            indexing_errors_path,
+            csv_columns_for(
+                CSV_COLUMNS,
+                count_commits=count_commits_enabled,
+                run_searches=run_searches,
+            ),
+            output_format,
+            append=resumed,
+        )
+        if main_columns is None
+        else None
     )
     skipped_writer = (
-        LazyCSVWriter(
+        open_repo_writer(
             skipped_files_path,
             csv_columns_for(
                 SKIPPED_FILES_CSV_COLUMNS,
                 count_commits=count_commits_enabled,
-                run_search=run_search_enabled,
+                run_searches=run_searches,
             ),
+            output_format,
+            append=resumed,
         )
         if skipped_files_path is not None
         else None
@@ -3554,11 +9557,18 @@ def run(args: argparse.Namespace, endpoint: str, token: str) -> None:
         LazyCSVWriter(
             skipped_file_reasons_path,
             [name for name, _, _, _ in SKIPPED_FILE_REASON_COLUMNS],
+            append=resumed,
         )
         if skipped_file_reasons_path is not None
         else None
     )
     # Keep optional writers in the same context-manager block
+    cloning_cm = (
+        cloning_writer if cloning_writer is not None else contextlib.nullcontext()
+    )
+    indexing_cm = (
+        indexing_writer if indexing_writer is not None else contextlib.nullcontext()
+    )
     skipped_cm = (
         skipped_writer if skipped_writer is not None else contextlib.nullcontext()
     )
@@ -3567,13 +9577,39 @@ def run(args: argparse.Namespace, endpoint: str, token: str) -> None:
         if skipped_file_reason_writer is not None
         else contextlib.nullcontext()
     )
+    stored_total = 0
+    concurrency_limiter = ConcurrencyLimiter(
+        min(args.concurrency, max_concurrency(args)),
+        max_concurrency(args),
+    )
+    if checkpoint is not None:
+        checkpoint.open()
+    main_output = (
+        output_path.open("a" if resumed else "w", newline="")
+        if output_format == "csv"
+        else LazyColumnarWriter(
+            output_path,
+            csv_columns_for(
+                main_columns if main_columns is not None else CSV_COLUMNS,
+                count_commits=count_commits_enabled,
+                run_searches=run_searches,
+            ),
+            output_format,
+            create_empty=True,
+        )
+    )
     with (
-        output_path.open("w", newline="") as out,
-        cloning_writer,
-        indexing_writer,
+        main_output as out,
+        cloning_cm,
+        indexing_cm,
         skipped_cm,
         skipped_file_reason_cm,
+        checkpoint if checkpoint is not None else contextlib.nullcontext(),
+        store if store is not None else contextlib.nullcontext(),
+        use_concurrency_limiter(concurrency_limiter),
+        use_repo_node_fields(node_fields),
     ):
+        record_phase("setup", time.monotonic() - started)
         total, reclone_total, reindex_total = write_csv(
             out,
             cloning_writer,
@@ -3582,34 +9618,56 @@ def run(args: argparse.Namespace, endpoint: str, token: str) -> None:
             skipped_file_reason_writer,
             endpoint,
             token,
-            args.limit,
+            max_repos,
             reclone=bool(args.reclone),
             reindex=bool(args.reindex),
             count_commits=bool(args.count_commits),
             scope_repo=scope_repo,
             count_commits_rev=scope_rev,
-            run_search_pattern=run_search_pattern,
-            page_size=args.page_size,
-            concurrency=args.concurrency,
+            run_searches=run_searches,
+            page_size=page_size,
+            concurrency_limiter=concurrency_limiter,
             max_retries=args.max_retries,
             stats=stats,
             is_site_admin=is_site_admin,
             include_index_failure_fields=include_index_failure_fields,
+            checkpoint=checkpoint,
+            listing_shards=args.listing_shards,
+            snapshot=snapshot,
+            query_batch_size=args.query_batch_size,
+            store=store,
+            stream_listing=args.stream_listing,
+            run_search_mode=args.run_search_mode,
+            large_repo_mb=large_repo_mb,
+            large_repo_concurrency=args.large_repo_concurrency,
+            # Rows ranked from the listing are written largest first
+            ordered=args.ordered or (top is not None and top.from_listing),
+            only=only,
+            main_columns=main_columns,
+            top=top,
         )
+        started = time.monotonic()
+        if store is not None:
+            stored_total = store.finish()
+    if checkpoint is not None:
+        checkpoint.finish()
 
     if stats is not None:
         stats_paths = write_stats(prefix, stats)
         for stats_path in stats_paths:
             logger.info("Wrote statistics to %s", stats_path.name)
+    # Closing the writers flushes the last Parquet row group, so this
+    # includes more than the statistics files
+    record_phase("finish", time.monotonic() - started)
 
     logger.info("Wrote %d repos to %s", total, output_path.name)
-    if cloning_writer.count:
+    if cloning_writer is not None and cloning_writer.count:
         logger.info(
             "Wrote %d repos with cloning errors to %s",
             cloning_writer.count,
             cloning_errors_path.name,
         )
-    if indexing_writer.count:
+    if indexing_writer is not None and indexing_writer.count:
         logger.info(
             "Wrote %d repos with indexing errors to %s",
             indexing_writer.count,
@@ -3627,6 +9685,29 @@ def run(args: argparse.Namespace, endpoint: str, token: str) -> None:
             skipped_file_reason_writer.count,
             skipped_file_reason_writer.path.name,
         )
+    if store is not None:
+        logger.info(
+            "Stored run %d (%d repos) in %s",
+            store.run_id,
+            stored_total,
+            store.path,
+        )
+    if concurrency_limiter.completed:
+        logger.info(
+            "Per-repo concurrency limit ended at %d (ranged %d-%d, %d overload "
+            "signal(s))",
+            concurrency_limiter.limit,
+            concurrency_limiter.lowest,
+            concurrency_limiter.highest,
+            concurrency_limiter.overload_signals,
+        )
+    if snapshot is not None:
+        logger.info(
+            "Reused %d commit count(s) and %d search result(s) from %s",
+            snapshot.commit_counts_reused,
+            snapshot.searches_reused,
+            snapshot.path.name,
+        )
     if args.reclone:
         logger.info("Triggered recloneRepository for %d repo(s)", reclone_total)
     if args.reindex:
@@ -3708,16 +9789,81 @@ def main() -> None:
     if args.write_csv_schema:
         write_csv_schema(Path(DEFAULT_CSV_SCHEMA_FILE))
         return
+    # Reports read the local --store database only
+    if args.store_report is not None:
+        if args.store is None:
+            die("--store-report needs --store sqlite:PATH")
+        try:
+            write_store_report(
+                args.store, args.store_report, args.store_runs, sys.stdout
+            )
+            sys.stdout.flush()
+        except BrokenPipeError:
+            # The reader (e.g. head) closed the pipe; silence the flush at exit
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return
     load_dotenv()
-    endpoint, token = require_credentials(args)
+    archive: ResponseArchive | None = None
+    if args.replay is not None:
+        if args.record is not None:
+            die("--record and --replay cannot be combined")
+        if args.reclone or args.reindex:
+            die("--replay cannot send --reclone or --reindex mutations")
+        archive = ResponseArchive(args.replay, replaying=True)
+        endpoint, token = archive.open_for_replay(), ""
+    else:
+        endpoint, token = require_credentials(args)
+        if args.record is not None:
+            archive = ResponseArchive(args.record, replaying=False)
+            archive.open_for_record(endpoint)
     logger.info(
         "Running: %s (SRC_ENDPOINT=%s)",
         redact_argv_for_log(sys.argv),
         endpoint,
     )
+    cache_dir = args.cache_dir or default_cache_dir()
+    # A cache hit skips requests the archive then lacks on replay
+    use_caches = not args.no_cache and archive is None
+    search_api = args.search_api
+    if archive is not None and search_api == "stream":
+        logger.warning(
+            "Ignoring --search-api stream: --record and --replay only "
+            "capture GraphQL responses",
+        )
+        search_api = DEFAULT_SEARCH_API
 
     try:
-        run(args, endpoint, token)
+        with (
+            open_transport(
+                args.transport,
+                max_concurrency(args)
+                + args.listing_shards
+                + (args.large_repo_concurrency if args.large_repo_mb else 0),
+            ),
+            use_rate_limiter(TokenBucket(args.max_rps, args.burst)),
+            use_run_profile(args.profile),
+            use_search_api(search_api),
+            use_response_archive(archive),
+            use_capability_cache(
+                CapabilityCache(
+                    cache_dir / CAPABILITY_CACHE_FILE,
+                    args.capability_cache_ttl,
+                    endpoint,
+                    token,
+                )
+                if args.capability_cache_ttl and use_caches
+                else None,
+            ),
+            use_commit_count_cache(
+                CommitCountCache(
+                    cache_dir / COMMIT_COUNT_CACHE_FILE,
+                    COMMIT_COUNT_CACHE_MAX_ENTRIES,
+                )
+                if args.count_commits and use_caches
+                else None,
+            ),
+        ):
+            run(args, endpoint, token)
     except HTTPRequestError as exc:
         log_http_error(exc)
         sys.exit(1)
@@ -0,0 +1,163 @@
+"""--stream-listing decodes listing pages like json.loads
+
+python3 -m unittest discover tests
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import io
+import json
+import sys
+import unittest
+from pathlib import Path
+from typing import Any
+from unittest import mock
+
+SCRIPT = Path(__file__).resolve().parent.parent / "list-repos.py"
+
+
+def load_list_repos() -> Any:
+    """Import list-repos.py, whose hyphenated name rules out a plain import"""
+    spec = importlib.util.spec_from_file_location("list_repos", SCRIPT)
+    if spec is None or spec.loader is None:
+        sys.exit(f"Cannot load {SCRIPT}")
+    module = importlib.util.module_from_spec(spec)
+    # dataclasses resolve annotations through sys.modules
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+lr = load_list_repos()
+
+NODES = [
+    {
+        "id": "UmVwb3NpdG9yeTox",
+        "name": 'github.com/org/"quoted"\\repo',
+        "description": "tab\there, newline\nthere, été \U0001f600  ",
+        "mirrorInfo": {"cloned": True, "byteSize": "1234", "lastError": None},
+        "metadata": [{"key": 'k\\"', "value": "[{}]"}],
+    },
+    {
+        "id": "UmVwb3NpdG9yeToy",
+        "name": "github.com/org/plain",
+        "description": "",
+        "mirrorInfo": {"cloned": False, "byteSize": "0", "lastError": '}]"{'},
+        "metadata": [],
+    },
+]
+
+
+def listing_body(connection: dict[str, Any], **response: Any) -> bytes:
+    """Return a ListRepos response body with keys in the given order"""
+    document = {"data": {"repositories": connection}, **response}
+    # ensure_ascii=False keeps multi-byte characters that straddle chunks
+    return json.dumps(document, ensure_ascii=False).encode()
+
+
+def decode(body: bytes) -> dict[str, Any]:
+    """Decode with decode_listing_page and materialize the streamed nodes"""
+    response = lr.decode_listing_page(io.BytesIO(body))
+    connection = response["data"]["repositories"]
+    connection["nodes"] = list(connection["nodes"])
+    return response
+
+
+class DecodeListingPageTest(unittest.TestCase):
+    def setUp(self) -> None:
+        # Tiny reads make every value straddle a buffer refill
+        patcher = mock.patch.object(lr, "RESPONSE_CHUNK_BYTES", 7)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_escaped_nested_strings(self) -> None:
+        body = listing_body(
+            {
+                "totalCount": 2,
+                "pageInfo": {"hasNextPage": False, "endCursor": None},
+                "nodes": NODES,
+            },
+        )
+        self.assertEqual(decode(body), json.loads(body))
+
+    def test_node_count(self) -> None:
+        body = listing_body(
+            {
+                "totalCount": 10,
+                "pageInfo": {"hasNextPage": True, "endCursor": "abc"},
+                "nodes": NODES,
+            },
+        )
+        response = lr.decode_listing_page(io.BytesIO(body))
+        self.assertEqual(len(response["data"]["repositories"]["nodes"]), 2)
+
+    def test_nodes_not_last(self) -> None:
+        body = listing_body(
+            {
+                "totalCount": 2,
+                "pageInfo": {"hasNextPage": False, "endCursor": None},
+                "nodes": NODES,
+                "after": {"nodes": ["x"]},
+            },
+            errors=[{"message": "partial"}],
+        )
+        self.assertEqual(decode(body), json.loads(body))
+
+    def test_nodes_before_page_info(self) -> None:
+        body = listing_body(
+            {
+                "nodes": NODES,
+                "totalCount": 2,
+                "pageInfo": {"hasNextPage": False, "endCursor": None},
+            },
+        )
+        response = lr.decode_listing_page(io.BytesIO(body))
+        self.assertEqual(response, json.loads(body))
+        self.assertIsInstance(response["data"]["repositories"]["nodes"], list)
+
+    def test_truncated_body(self) -> None:
+        body = listing_body(
+            {
+                "totalCount": 2,
+                "pageInfo": {"hasNextPage": False, "endCursor": None},
+                "nodes": NODES,
+            },
+        )
+        for end in (len(body) // 2, len(body) - 1):
+            file = io.BytesIO(body[:end])
+            with self.subTest(end=end), self.assertRaises(ValueError):
+                lr.decode_listing_page(file)
+            self.assertTrue(file.closed)
+
+    def test_truncated_body_is_retried(self) -> None:
+        body = listing_body(
+            {
+                "totalCount": 2,
+                "pageInfo": {"hasNextPage": False, "endCursor": None},
+                "nodes": NODES,
+            },
+        )
+        replies = iter([body[:-10], body])
+        with (
+            mock.patch.object(
+                lr,
+                "_transport",
+                lambda *_: io.BytesIO(next(replies)),
+            ),
+            mock.patch.object(lr, "sleep_before_retry") as sleep,
+        ):
+            data = lr.graphql_request(
+                "http://sourcegraph.test",
+                "token",
+                "query ListRepos { repositories { totalCount } }",
+                {},
+                max_retries=1,
+                decode=lr.decode_listing_page,
+            )
+        self.assertEqual(sleep.call_count, 1)
+        self.assertEqual(list(data["repositories"]["nodes"]), NODES)
+
+
+if __name__ == "__main__":
+    unittest.main()